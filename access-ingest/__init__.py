@@ -1,10 +1,35 @@
 import os
 import logging
 
-from azure.identity import DefaultAzureCredential
 import azure.functions as func
 
-from shared.processor import AccessRequest
+from shared.key_vault import get_azure_credential
+from shared.processor import AccessProcessor, AccessRequest
+
+
+def process_records(req_body, access_request, raw_filename, azure_credential):
+    # Pipeline mode: the records the ingest has just written to the raw zone are normalised as
+    # access-process would normalise the raw file, without downloading it again. With an ndjson raw
+    # format the records are not parsed again either; the json format re-parses its sorted text.
+    if access_request.unchanged:
+        logging.info(f"{access_request.directory_name} is unchanged, there is nothing to process.")
+        return
+
+    datalake_name = os.environ["DATALAKE_GEN_2_RESOURCE_NAME"]
+    filesystem_raw_name = os.environ["DATALAKE_GEN_2_RAW_CONTAINER_NAME"]
+    filesystem_structured_name = os.environ["DATALAKE_GEN_2_STRUCTURED_CONTAINER_NAME"]
+    root_directory_name = os.environ["DATALAKE_GEN_2_ACCESS_DIRECTORY_NAME"]
+    output_format = req_body.get('output_format', os.environ.get("STRUCTURED_OUTPUT_FORMAT", "csv"))
+    stream_batch_size = req_body.get('stream_batch_size', os.environ.get("PROCESSOR_STREAM_BATCH_SIZE"))
+    metrics = req_body.get('metrics', os.environ.get("PIPELINE_METRICS", "false"))
+    skip_unchanged = req_body.get('skip_unchanged', os.environ.get("SKIP_UNCHANGED_UPLOADS", "false"))
+    normalise_engine = req_body.get('normalise_engine', os.environ.get("NORMALISE_ENGINE", "pandas"))
+
+    AccessProcessor(
+        raw_filename, datalake_name, filesystem_raw_name,
+        filesystem_structured_name, root_directory_name, azure_credential, output_format,
+        stream_batch_size, metrics, skip_unchanged, normalise_engine
+    ).process(access_request.records)
 
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
@@ -21,14 +46,26 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     datalake_name = os.environ["DATALAKE_GEN_2_RESOURCE_NAME"]
     filesystem_raw_name = os.environ["DATALAKE_GEN_2_RAW_CONTAINER_NAME"]
     root_directory_name = os.environ["DATALAKE_GEN_2_ACCESS_DIRECTORY_NAME"]
+    raw_format = os.environ.get("RAW_FILE_FORMAT", "json")
+    metrics = req_body.get('metrics', os.environ.get("PIPELINE_METRICS", "false"))
+    skip_unchanged = req_body.get('skip_unchanged', os.environ.get("SKIP_UNCHANGED_UPLOADS", "false"))
+    rate_limit = req_body.get('rate_limit', os.environ.get("ACCESS_RATE_LIMIT"))
+    pipeline = str(req_body.get('pipeline', os.environ.get("ACCESS_PIPELINE", "false"))).lower() in ('true', '1')
 
     # Get authentication credential
-    azure_credential = DefaultAzureCredential()
+    azure_credential = get_azure_credential()
 
     # Run Access request
-    raw_filename = AccessRequest(
+    access_request = AccessRequest(
         keyvault_name, datalake_name, filesystem_raw_name, root_directory_name,
-        endpoint, api_secret, client_secret, azure_credential
-    ).process()
+        endpoint, api_secret, client_secret, azure_credential, raw_format, metrics, skip_unchanged,
+        rate_limit, pipeline
+    )
+    raw_filename = access_request.process()
+    if pipeline:
+        process_records(req_body, access_request, raw_filename, azure_credential)
+
+    # An unchanged payload is not uploaded again; raw_filename is then the file that already holds it
+    headers = {'X-Unchanged': str(access_request.unchanged).lower()}
 
-    return func.HttpResponse(raw_filename)
+    return func.HttpResponse(raw_filename, headers=headers)
@@ -0,0 +1,38 @@
+import logging
+import json
+import os
+
+import azure.durable_functions as df
+
+from shared.orchestration import task_all_bounded, EVENT_CHUNK_SIZE, MAX_PARALLELISM
+
+
+def orchestrator_function(context: df.DurableOrchestrationContext):
+    body = context._input
+    body = json.loads(body)
+    logging.info(f"Input is: {body}")
+
+    max_parallelism = body.get('max_parallelism', os.environ.get("ARTIFAX_MAX_PARALLELISM", MAX_PARALLELISM))
+    chunk_size = body.get('event_chunk_size', os.environ.get("ARTIFAX_EVENT_CHUNK_SIZE", EVENT_CHUNK_SIZE))
+    run_id = context.instance_id
+
+    chunks = yield context.call_activity(
+        'artifax-ingest', {**body, 'action': 'plan_events', 'run_id': run_id, 'event_chunk_size': chunk_size}
+    )
+
+    calls = [
+        ('call_activity', 'artifax-ingest', {
+            **body, 'action': 'event_chunk', 'run_id': run_id, 'chunk_number': number, 'arrangement_ids': chunk
+        })
+        for number, chunk in enumerate(chunks)
+    ]
+    parts = yield from task_all_bounded(context, calls, max_parallelism)
+
+    result = yield context.call_activity(
+        'artifax-ingest', {**body, 'action': 'merge_events', 'run_id': run_id, 'parts': parts}
+    )
+
+    return result
+
+
+main = df.Orchestrator.create(orchestrator_function)
@@ -1,8 +1,38 @@
+import logging
 import os
 
-from azure.identity import DefaultAzureCredential
+from shared.key_vault import get_azure_credential
+from shared.processor import ArtifaxProcessor, ArtifaxRequest
 
-from shared.processor import ArtifaxRequest
+
+def process_records(req, artifax_request, azure_credential):
+    # Pipeline mode: the records the ingest has just written to the raw zone are normalised as
+    # artifax-process would normalise the raw file, without downloading it again. With an ndjson raw
+    # format the records are not parsed again either; the json format re-parses its sorted text.
+    if artifax_request.unchanged:
+        logging.info(f"{artifax_request.artifax_endpoint} is unchanged, there is nothing to process.")
+        return
+
+    datalake_name = os.environ["DATALAKE_GEN_2_RESOURCE_NAME"]
+    filesystem_raw_name = os.environ["DATALAKE_GEN_2_RAW_CONTAINER_NAME"]
+    filesystem_structured_name = os.environ["DATALAKE_GEN_2_STRUCTURED_CONTAINER_NAME"]
+    directory_name = os.environ["DATALAKE_GEN_2_ARTIFAX_DIRECTORY_NAME"]
+    output_format = req.get('output_format', os.environ.get("STRUCTURED_OUTPUT_FORMAT", "csv"))
+    stream_batch_size = req.get('stream_batch_size', os.environ.get("PROCESSOR_STREAM_BATCH_SIZE"))
+    metrics = req.get('metrics', os.environ.get("PIPELINE_METRICS", "false"))
+    skip_unchanged = req.get('skip_unchanged', os.environ.get("SKIP_UNCHANGED_UPLOADS", "false"))
+    normalise_engine = req.get('normalise_engine', os.environ.get("NORMALISE_ENGINE", "pandas"))
+    typed_schemas = req.get('typed_schemas', os.environ.get("TYPED_SCHEMAS", "false"))
+    partitioned = req.get('partitioned', os.environ.get("PARTITIONED_OUTPUT", "false"))
+    partition_columns = req.get('partition_columns', os.environ.get("PARTITION_COLUMNS"))
+
+    # records is None for streamed events, which are not held in memory: those are read back
+    ArtifaxProcessor(
+        artifax_request.artifax_endpoint, artifax_request.artifax_filename, datalake_name,
+        filesystem_raw_name, filesystem_structured_name, directory_name, azure_credential,
+        output_format, stream_batch_size, metrics, skip_unchanged, normalise_engine, typed_schemas,
+        partitioned, partition_columns
+    ).process(artifax_request.records)
 
 
 def main(req: dict) -> list:
@@ -17,14 +47,41 @@ def main(req: dict) -> list:
     datalake_name = os.environ["DATALAKE_GEN_2_RESOURCE_NAME"]
     filesystem_name = os.environ["DATALAKE_GEN_2_RAW_CONTAINER_NAME"]
     root_directory_name = os.environ["DATALAKE_GEN_2_ARTIFAX_DIRECTORY_NAME"]
+    max_workers = req.get('max_workers', os.environ.get("ARTIFAX_EVENT_MAX_WORKERS", 1))
+    raw_format = os.environ.get("RAW_FILE_FORMAT", "json")
+    incremental = req.get('incremental', os.environ.get("ARTIFAX_INCREMENTAL", "false"))
+    full_refresh = req.get('full_refresh', False)
+    metrics = req.get('metrics', os.environ.get("PIPELINE_METRICS", "false"))
+    skip_unchanged = req.get('skip_unchanged', os.environ.get("SKIP_UNCHANGED_UPLOADS", "false"))
+    rate_limit = req.get('rate_limit', os.environ.get("ARTIFAX_RATE_LIMIT"))
+    cache_ttl = req.get('cache_ttl', os.environ.get("ARTIFAX_CACHE_TTL"))
+    # A failed streamed run leaves a .partial raw file to resume from with ndjson raw formats only
+    stream_events = req.get('stream_events', os.environ.get("ARTIFAX_STREAM_EVENTS", "false"))
+    pipeline = str(req.get('pipeline', os.environ.get("ARTIFAX_PIPELINE", "false"))).lower() in ('true', '1')
 
     # Get authentication credential
-    azure_credential = DefaultAzureCredential()
+    azure_credential = get_azure_credential()
 
     # Run Artifax request
-    artifax_file = ArtifaxRequest(
+    artifax_request = ArtifaxRequest(
         keyvault_name, datalake_name, filesystem_name, root_directory_name,
-        endpoint, api_secret, client_secret, azure_credential
-    ).process()
+        endpoint, api_secret, client_secret, azure_credential, max_workers,
+        raw_format, incremental, full_refresh, metrics, skip_unchanged, rate_limit,
+        cache_ttl, stream_events, pipeline
+    )
+
+    # The event orchestration splits an event extraction into plan, chunk and merge steps
+    action = req.get('action', 'ingest')
+    if action == 'plan_events':
+        return artifax_request.plan_events(req['run_id'], int(req['event_chunk_size']))
+    if action == 'event_chunk':
+        return artifax_request.get_event_chunk(req['run_id'], req['chunk_number'], req['arrangement_ids'])
+    if action == 'merge_events':
+        artifax_file = artifax_request.merge_events(req['run_id'], req['parts'])
+    else:
+        artifax_file = artifax_request.process()
+
+    if pipeline:
+        process_records(req, artifax_request, azure_credential)
 
     return artifax_file
@@ -1,17 +1,33 @@
 import logging
 import json
+import os
 
 import azure.durable_functions as df
 
+from shared.orchestration import task_all_bounded, MAX_PARALLELISM
+
 
 def orchestrator_function(context: df.DurableOrchestrationContext):
     body = context._input
     body = json.loads(body)
     logging.info(f"Input is: {body}")
 
-    result = yield context.call_activity('artifax-ingest', body)
+    max_parallelism = body.get('max_parallelism', os.environ.get("ARTIFAX_MAX_PARALLELISM", MAX_PARALLELISM))
+    endpoints = body.get('endpoints') or [body['endpoint']]
+
+    # Events are fanned out again over arrangement chunks, so they get an orchestration of their own
+    calls = []
+    for endpoint in endpoints:
+        endpoint_body = {**body, 'endpoint': endpoint, 'max_parallelism': max_parallelism}
+        endpoint_body.pop('endpoints', None)
+        if endpoint == 'arrangements/event':
+            calls.append(('call_sub_orchestrator', 'artifax-event-orchestrator', endpoint_body))
+        else:
+            calls.append(('call_activity', 'artifax-ingest', endpoint_body))
+
+    result = yield from task_all_bounded(context, calls, max_parallelism)
 
-    return result
+    return result if 'endpoints' in body else result[0]
 
 
 main = df.Orchestrator.create(orchestrator_function)
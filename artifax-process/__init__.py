@@ -1,9 +1,9 @@
 import os
 import logging
 
-from azure.identity import DefaultAzureCredential
 import azure.functions as func
 
+from shared.key_vault import get_azure_credential
 from shared.processor import ArtifaxProcessor
 
 
@@ -20,16 +20,30 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     filesystem_raw_name = os.environ["DATALAKE_GEN_2_RAW_CONTAINER_NAME"]
     filesystem_structured_name = os.environ["DATALAKE_GEN_2_STRUCTURED_CONTAINER_NAME"]
     directory_name = os.environ["DATALAKE_GEN_2_ARTIFAX_DIRECTORY_NAME"]
+    output_format = req_body.get('output_format', os.environ.get("STRUCTURED_OUTPUT_FORMAT", "csv"))
+    stream_batch_size = req_body.get('stream_batch_size', os.environ.get("PROCESSOR_STREAM_BATCH_SIZE"))
+    metrics = req_body.get('metrics', os.environ.get("PIPELINE_METRICS", "false"))
+    skip_unchanged = req_body.get('skip_unchanged', os.environ.get("SKIP_UNCHANGED_UPLOADS", "false"))
+    normalise_engine = req_body.get('normalise_engine', os.environ.get("NORMALISE_ENGINE", "pandas"))
+    typed_schemas = req_body.get('typed_schemas', os.environ.get("TYPED_SCHEMAS", "false"))
+    partitioned = req_body.get('partitioned', os.environ.get("PARTITIONED_OUTPUT", "false"))
+    partition_columns = req_body.get('partition_columns', os.environ.get("PARTITION_COLUMNS"))
 
     # Get authentication credential
-    azure_credential = DefaultAzureCredential()
+    azure_credential = get_azure_credential()
 
     # Run Artifax processor
-    entity = ArtifaxProcessor(
+    artifax_processor = ArtifaxProcessor(
         endpoint, raw_filename, datalake_name, filesystem_raw_name,
-        filesystem_structured_name, directory_name, azure_credential
-    ).process()
+        filesystem_structured_name, directory_name, azure_credential, output_format,
+        stream_batch_size, metrics, skip_unchanged, normalise_engine, typed_schemas, partitioned,
+        partition_columns
+    )
+    entity = artifax_processor.process()
 
-    return func.HttpResponse(entity)
+    # A run whose output matched what is already in the lake wrote nothing
+    headers = {'X-Unchanged': str(artifax_processor.unchanged).lower()}
+
+    return func.HttpResponse(entity, headers=headers)
 
 
@@ -0,0 +1,55 @@
+import argparse
+import multiprocessing
+import time
+
+from benchmark.suite import peak_rss_mb, reset_peak_rss
+from benchmark.synthetic import Dataset
+from shared.formats import serialise_dataframe
+from shared.processor import ARRANGEMENT_PLAN, INVOICE_SCHEDULE_PLAN, ROOM_PLAN
+
+ENTITIES = {
+    'arrangement': (ARRANGEMENT_PLAN, Dataset.arrangements),
+    'invoice_schedule': (INVOICE_SCHEDULE_PLAN, Dataset.invoice_schedules),
+    'room': (ROOM_PLAN, Dataset.rooms),
+}
+
+
+def measure(entity, scale, typed, output_format):
+    # Runs in a fresh process, so the peak RSS belongs to this entity and mode alone; the records
+    # are in memory before it is reset, so the peak is what normalising and writing add to them
+    plan, records = ENTITIES[entity]
+    records = records(Dataset(scale))
+    reset_peak_rss()
+    baseline_mb = peak_rss_mb()
+
+    start = time.perf_counter()
+    normalised_data = plan.flatten(records, typed)
+    df = normalised_data[0]['data']
+    frame_mb = df.memory_usage(deep=True).sum() / 1024 ** 2
+    serialise_dataframe(df, output_format)
+    elapsed = time.perf_counter() - start
+
+    return len(df), frame_mb, peak_rss_mb() - baseline_mb, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory of the processor DataFrames, inferred against declared dtypes")
+    parser.add_argument('--entities', nargs='+', choices=list(ENTITIES), default=list(ENTITIES))
+    parser.add_argument('--scale', type=int, default=20)
+    parser.add_argument('--output-format', choices=['csv', 'parquet'], default='csv')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    print(f"{'entity':<18} {'dtypes':<9} {'rows':>8} {'frame MB':>9} {'peak MB':>8} {'seconds':>8}")
+    for entity in args.entities:
+        for typed in (False, True):
+            with context.Pool(1) as pool:
+                rows, frame_mb, peak_mb, elapsed = pool.apply(
+                    measure, (entity, args.scale, typed, args.output_format)
+                )
+            mode = 'declared' if typed else 'inferred'
+            print(f"{entity:<18} {mode:<9} {rows:>8} {frame_mb:>9.1f} {peak_mb:>8.1f} {elapsed:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import os
+import time
+
+from shared import datalake
+from shared.datalake import Datalake
+from benchmark.storage_server import start_storage_server
+
+MB = 1024 * 1024
+
+
+def payload_generator(size, piece=MB):
+    block = os.urandom(piece)
+    sent = 0
+    while sent < size:
+        yield block[:min(piece, size - sent)]
+        sent += piece
+
+
+def run(size, chunk_size, max_concurrency, repeat):
+    lake = Datalake(None, 'benchmark', 'raw', 'throughput', chunk_size=chunk_size, max_concurrency=max_concurrency)
+    payload = os.urandom(size)
+    results = {}
+    for label, make_data in (
+        ('upload bytes', lambda: payload),
+        ('upload generator', lambda: payload_generator(size)),
+    ):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            lake.upload_file_to_directory('throughput', 'file.bin', make_data())
+        results[label] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        data = lake.download_file_from_directory('file.bin')
+    results['download'] = time.perf_counter() - start
+    assert len(data) == size
+
+    return {label: size * repeat / MB / elapsed for label, elapsed in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Datalake upload/download throughput against a local stand-in")
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--chunk-sizes-mb', type=int, nargs='+', default=[4, 8, 32])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--latency-ms', type=float, default=20, help="simulated round-trip time per request")
+    args = parser.parse_args()
+
+    server, state = start_storage_server(latency=args.latency_ms / 1000)
+    datalake.ACCOUNT_URL = f"http://127.0.0.1:{server.server_port}/{{datalake_name}}"
+
+    print(f"{'chunk MB':>8} {'threads':>7} {'upload bytes':>13} {'upload gen':>11} {'download':>9}  (MB/s)")
+    for chunk_size in args.chunk_sizes_mb:
+        for max_concurrency in args.concurrency:
+            result = run(args.size_mb * MB, chunk_size * MB, max_concurrency, args.repeat)
+            print(
+                f"{chunk_size:>8} {max_concurrency:>7} {result['upload bytes']:>13.1f} "
+                f"{result['upload generator']:>11.1f} {result['download']:>9.1f}"
+            )
+    print(f"{state.requests} storage requests served")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import hashlib
+import io
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from openpyxl import Workbook
+
+from shared.excel import iter_excel_batches
+from shared.formats import TableWriter, serialise_dataframe
+
+HEADER = ['Transaction Id', 'Date', 'Customer', 'Event', 'Amount', 'Quantity', 'Offer']
+
+
+def generate_workbook(path, rows):
+    # A transaction_item-like export: ids, datetimes, text, decimals and a mostly empty column
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    worksheet.append(HEADER)
+    start = datetime(2023, 1, 1)
+    for number in range(rows):
+        worksheet.append([
+            number,
+            start + timedelta(minutes=number),
+            f"Customer {number % 5000}",
+            f"Event {number % 300}",
+            round((number % 9000) / 100, 2),
+            number % 6 + 1,
+            f"Offer {number % 7}" if number % 10 == 0 else None
+        ])
+    workbook.save(path)
+
+
+def convert_read_excel(excel_file, output_format, batch_size):
+    return serialise_dataframe(pd.read_excel(io.BytesIO(excel_file)), output_format)
+
+
+def convert_stream(engine):
+    def convert(excel_file, output_format, batch_size):
+        writer = TableWriter(output_format)
+        for df in iter_excel_batches(excel_file, batch_size, engine):
+            writer.write(df)
+        data = writer.getfile().read()
+        writer.close()
+
+        return data
+
+    return convert
+
+
+METHODS = {
+    'read_excel': convert_read_excel,
+    'stream openpyxl': convert_stream('openpyxl'),
+    'stream calamine': convert_stream('calamine'),
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss survives exec, so a spawned worker would report its parent's peak; VmHWM does not
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(method, path, output_format, batch_size):
+    # Runs in a fresh process, so the peak RSS belongs to this conversion alone
+    with open(path, 'rb') as file:
+        excel_file = file.read()
+    start = time.perf_counter()
+    data = METHODS[method](excel_file, output_format, batch_size)
+    elapsed = time.perf_counter() - start
+    peak_mb = peak_rss_mb()
+
+    if output_format == 'parquet':
+        # Parquet files embed writer metadata, so only the CSV output is compared byte for byte
+        return elapsed, peak_mb, None
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    return elapsed, peak_mb, hashlib.sha256(data).hexdigest()
+
+
+def calamine_available():
+    try:
+        import python_calamine
+    except ImportError:
+        return False
+
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spektrix Excel to CSV/Parquet conversion, per reader")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--output-format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--batch-size', type=int, default=50000)
+    args = parser.parse_args()
+
+    methods = [method for method in METHODS if method != 'stream calamine' or calamine_available()]
+    context = multiprocessing.get_context('spawn')
+
+    print(f"{'rows':>8} {'method':<16} {'seconds':>8} {'rows/s':>9} {'peak RSS MB':>12}  same output")
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            path = os.path.join(directory, f"transaction_item_{rows}.xlsx")
+            generate_workbook(path, rows)
+            reference = None
+            for method in methods:
+                with context.Pool(1) as pool:
+                    elapsed, peak_mb, data = pool.apply(measure, (method, path, args.output_format, args.batch_size))
+                if reference is None:
+                    reference = data
+                same = '-' if data is None else data == reference
+                print(f"{rows:>8} {method:<16} {elapsed:>8.2f} {rows / elapsed:>9.0f} {peak_mb:>12.0f}  {same}")
+
+
+if __name__ == '__main__':
+    main()
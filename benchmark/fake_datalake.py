@@ -0,0 +1,196 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from azure.core.exceptions import ResourceNotFoundError
+
+from shared import metrics
+from shared.datalake import CHUNK_SIZE, PARTIAL_SUFFIX, decompress, decompress_chunks
+
+
+class FakeStorage:
+    # Files of every FakeDatalake in the process, keyed by (account, filesystem, path), with counts
+    # of the calls made and the bytes that went in and out
+    def __init__(self):
+        self.files = {}
+        self.calls = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.lock = threading.Lock()
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls.clear()
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    def counters(self):
+        with self.lock:
+            return {'calls': dict(self.calls), 'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out}
+
+
+storage = FakeStorage()
+
+
+def _read(data):
+    if hasattr(data, 'read'):
+        data = data.read()
+    elif not isinstance(data, (str, bytes, bytearray, memoryview)):
+        data = b''.join(chunk.encode('utf-8') if isinstance(chunk, str) else chunk for chunk in data)
+
+    return data.encode('utf-8') if isinstance(data, str) else bytes(data)
+
+
+class FakePath:
+    def __init__(self, name, is_directory=False):
+        self.name = name
+        self.is_directory = is_directory
+
+
+class FakeAppendFile:
+    # Committed bytes are visible under the .partial name, as they are in the lake
+    def __init__(self, datalake, path):
+        self.datalake = datalake
+        self.path = path
+        self.partial_path = f"{path}{PARTIAL_SUFFIX}"
+        self.buffer = bytearray()
+        self.committed = 0
+        storage.files[datalake._key(self.partial_path)] = b''
+
+    @property
+    def uncommitted(self):
+        return len(self.buffer)
+
+    def write(self, data):
+        self.buffer += data
+
+    def commit(self):
+        if self.buffer:
+            self.datalake._count('append_data', bytes_in=len(self.buffer))
+            key = self.datalake._key(self.partial_path)
+            storage.files[key] = storage.files[key] + bytes(self.buffer)
+            self.committed += len(self.buffer)
+            self.buffer.clear()
+
+    def close(self):
+        self.commit()
+        self.datalake._count('rename_file')
+        storage.files[self.datalake._key(self.path)] = storage.files.pop(self.datalake._key(self.partial_path))
+
+    def discard(self):
+        self.buffer.clear()
+        self.datalake._count('delete_file')
+        storage.files.pop(self.datalake._key(self.partial_path), None)
+
+
+class FakeDatalake:
+    # In-process stand-in for shared.datalake.Datalake with the same methods and paths, so the
+    # Request and Processor classes run unchanged without a storage account
+    def __init__(self, azure_credential, datalake_name, filesystem_name, directory_name, *args, **kwargs):
+        self.datalake_name = datalake_name
+        self.filesystem_name = filesystem_name
+        self.directory_name = directory_name
+
+    def _key(self, path):
+        return self.datalake_name, self.filesystem_name, path
+
+    def _count(self, method, bytes_in=0, bytes_out=0):
+        with storage.lock:
+            storage.calls[method] += 1
+            storage.bytes_in += bytes_in
+            storage.bytes_out += bytes_out
+        # Fed to the pipeline metrics as the real Datalake would: what storage takes in, the pipeline sends out
+        metrics.add('bytes_in', bytes_out)
+        metrics.add('bytes_out', bytes_in)
+
+    def _get(self, path):
+        try:
+            return storage.files[self._key(path)]
+        except KeyError:
+            raise ResourceNotFoundError(f"The specified path does not exist: {path}")
+
+    def _paths(self, directory_name):
+        prefix = f"{directory_name}/"
+        return sorted(key[2] for key in storage.files if key[:2] == self._key('')[:2] and key[2].startswith(prefix))
+
+    def upload_file_to_directory(self, directory_name, filename, data):
+        data = _read(data)
+        self._count('upload_file_to_directory', bytes_in=len(data))
+        storage.files[self._key(f"{directory_name}/{filename}")] = data
+
+    def open_append_file(self, directory_name, filename):
+        self._count('create_file')
+
+        return FakeAppendFile(self, f"{directory_name}/{filename}")
+
+    def download_file_from_directory(self, filename):
+        data = self._get(f"{self.directory_name}/{filename}")
+        self._count('download_file_from_directory', bytes_out=len(data))
+
+        return decompress(data, filename)
+
+    def stream_file_from_directory(self, filename):
+        data = self._get(f"{self.directory_name}/{filename}")
+        self._count('stream_file_from_directory', bytes_out=len(data))
+        chunks = (data[start:start + CHUNK_SIZE] for start in range(0, len(data), CHUNK_SIZE))
+
+        return decompress_chunks(chunks, filename)
+
+    def list_directory_contents(self, directory_name):
+        self._count('list_directory_contents')
+        paths = self._paths(directory_name)
+        directories = {
+            '/'.join(path.split('/')[:depth])
+            for path in paths
+            for depth in range(directory_name.count('/') + 2, path.count('/') + 1)
+        }
+
+        return [FakePath(name, True) for name in sorted(directories)] + [FakePath(path) for path in paths]
+
+    def directory_exists(self, directory_name):
+        self._count('directory_exists')
+
+        return bool(self._paths(directory_name))
+
+    def delete_file_from_directory(self, directory_name, filename):
+        self._count('delete_file_from_directory')
+        self._get(f"{directory_name}/{filename}")
+        del storage.files[self._key(f"{directory_name}/{filename}")]
+
+    def delete_directory(self, directory_name):
+        self._count('delete_directory')
+        for path in self._paths(directory_name):
+            del storage.files[self._key(path)]
+
+    def delete_directory_contents(self, directory_name, max_workers=None):
+        self.delete_directory(directory_name)
+
+    def replace_directory(self, directory_name, files, atomic=True):
+        self._count('replace_directory')
+        staged = {filename: _read(data) for filename, data in files.items()}
+        for path in self._paths(directory_name):
+            del storage.files[self._key(path)]
+        for filename, data in staged.items():
+            self.upload_file_to_directory(directory_name, filename, data)
+
+    def copy_file_to_directory(self, source, source_filename, directory_name, filename):
+        data = source._get(f"{source.directory_name}/{source_filename}")
+        self._count('copy_file_to_directory')
+        storage.files[self._key(f"{directory_name}/{filename}")] = data
+
+    def move_file_to_directory(self, source, source_filename, directory_name, filename):
+        self.copy_file_to_directory(source, source_filename, directory_name, filename)
+        del storage.files[source._key(f"{source.directory_name}/{source_filename}")]
+
+
+@contextmanager
+def installed():
+    # Swaps the Datalake used by the processors for the fake for the duration of the block
+    import shared.processor
+
+    original = shared.processor.Datalake
+    shared.processor.Datalake = FakeDatalake
+    try:
+        yield storage
+    finally:
+        shared.processor.Datalake = original
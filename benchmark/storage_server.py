@@ -0,0 +1,235 @@
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class StorageState:
+    def __init__(self, latency=0.0):
+        self.files = {}
+        self.directories = set()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.latency = latency
+
+    def is_directory(self, path):
+        prefix = f"{path}/"
+        return path in self.directories or any(name.startswith(prefix) for name in self.files)
+
+    def move(self, source, destination):
+        prefix = f"{source}/"
+        moved = False
+        for name in [name for name in self.files if name == source or name.startswith(prefix)]:
+            self.files[destination + name[len(source):]] = self.files.pop(name)
+            moved = True
+        for name in [name for name in self.directories if name == source or name.startswith(prefix)]:
+            self.directories.discard(name)
+            self.directories.add(destination + name[len(source):])
+            moved = True
+
+        return moved
+
+    def delete(self, path):
+        prefix = f"{path}/"
+        for name in [name for name in self.files if name == path or name.startswith(prefix)]:
+            del self.files[name]
+        for name in [name for name in self.directories if name == path or name.startswith(prefix)]:
+            self.directories.discard(name)
+
+
+class StorageRequestHandler(BaseHTTPRequestHandler):
+    # Local stand-in for the parts of the ADLS Gen2 (dfs) and blob REST APIs the Datalake wrapper
+    # uses: create, append, flush, ranged read, copy, rename, list and delete. Paths are
+    # /{account}/{filesystem}/{path} and are stored as "{filesystem}/{path}".
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _parse(self):
+        url = urlsplit(self.path)
+        _, _, path = unquote(url.path).lstrip('/').partition('/')
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with self.state.lock:
+            self.state.requests += 1
+        if self.state.latency:
+            # Round-trip time of a real storage account, paid per request
+            time.sleep(self.state.latency)
+
+        return path, query
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+
+        return self.rfile.read(length) if length else b''
+
+    def _respond(self, status, body=b'', headers=None):
+        self.send_response(status)
+        now = datetime.now(timezone.utc).strftime('%a, %d %b %Y %H:%M:%S GMT')
+        self.send_header('ETag', '"0x1"')
+        self.send_header('Last-Modified', now)
+        self.send_header('x-ms-request-id', '00000000-0000-0000-0000-000000000000')
+        self.send_header('x-ms-version', '2021-08-06')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.command == 'HEAD':
+            self.end_headers()
+            return
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _error(self, status, code):
+        body = json.dumps({'error': {'code': code, 'message': code}}).encode('utf-8')
+        self._respond(status, body, {'x-ms-error-code': code, 'Content-Type': 'application/json'})
+
+    def do_PUT(self):
+        path, query = self._parse()
+        self._read_body()
+        with self.state.lock:
+            copy_source = self.headers.get('x-ms-copy-source')
+            if copy_source:
+                # Blob endpoint copy; the source URL carries the account as its first segment
+                _, _, source = unquote(urlsplit(copy_source).path).lstrip('/').partition('/')
+                if source not in self.state.files:
+                    return self._error(404, 'CannotVerifyCopySource')
+                self.state.files[path] = {'staged': bytearray(), 'data': self.state.files[source]['data']}
+                return self._respond(202, headers={
+                    'x-ms-copy-id': '00000000-0000-0000-0000-000000000001', 'x-ms-copy-status': 'success'
+                })
+
+            rename_source = self.headers.get('x-ms-rename-source')
+            if rename_source:
+                source = unquote(urlsplit(rename_source).path).lstrip('/')
+                if not self.state.move(source, path):
+                    return self._error(404, 'SourcePathNotFound')
+                return self._respond(201)
+
+            exists = path in self.state.files or self.state.is_directory(path)
+            if self.headers.get('If-None-Match') == '*' and exists:
+                return self._error(409, 'PathAlreadyExists')
+            if query.get('resource') == 'file':
+                self.state.files[path] = {'staged': bytearray(), 'data': b''}
+                return self._respond(201)
+            if query.get('resource') == 'directory':
+                self.state.directories.add(path)
+                return self._respond(201)
+            if query.get('restype') == 'container' or query.get('resource') == 'filesystem':
+                return self._respond(201)
+
+        self._error(400, 'InvalidInput')
+
+    def do_PATCH(self):
+        path, query = self._parse()
+        body = self._read_body()
+        with self.state.lock:
+            file = self.state.files.get(path)
+            if file is None:
+                return self._error(404, 'PathNotFound')
+            position = int(query.get('position', 0))
+            if query.get('action') == 'append':
+                staged = file['staged']
+                if len(staged) < position:
+                    # Parallel appends can arrive out of order
+                    staged.extend(bytes(position - len(staged)))
+                staged[position:position + len(body)] = body
+                return self._respond(202)
+            if query.get('action') == 'flush':
+                file['data'] = bytes(file['staged'][:position])
+                file['staged'] = bytearray()
+                return self._respond(200)
+
+        self._error(400, 'InvalidInput')
+
+    def do_GET(self):
+        path, query = self._parse()
+        if query.get('resource') == 'filesystem':
+            return self._list_paths(path, query)
+
+        with self.state.lock:
+            file = self.state.files.get(path)
+        if file is None:
+            return self._error(404, 'BlobNotFound')
+
+        data = file['data']
+        headers = {'x-ms-blob-type': 'BlockBlob', 'Content-Type': 'application/octet-stream'}
+        byte_range = self.headers.get('x-ms-range') or self.headers.get('Range')
+        if not byte_range:
+            return self._respond(200, data, headers)
+        if not data:
+            return self._respond(416, headers={'x-ms-error-code': 'InvalidRange', 'Content-Range': 'bytes */0'})
+
+        start, _, end = byte_range.split('=')[1].partition('-')
+        start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+        headers['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+        self._respond(206, data[start:end + 1], headers)
+
+    def _list_paths(self, filesystem, query):
+        directory = query.get('directory', '').strip('/')
+        prefix = f"{filesystem}/{directory}/" if directory else f"{filesystem}/"
+        recursive = query.get('recursive', 'true') == 'true'
+        with self.state.lock:
+            if directory and not self.state.is_directory(f"{filesystem}/{directory}"):
+                return self._error(404, 'PathNotFound')
+            names = {name: len(file['data']) for name, file in self.state.files.items() if name.startswith(prefix)}
+            for name in self.state.directories:
+                if name.startswith(prefix):
+                    names.setdefault(name, None)
+            # Parent directories of listed files are paths too
+            for name in list(names):
+                parts = name[len(prefix):].split('/')
+                for depth in range(1, len(parts)):
+                    names.setdefault(prefix + '/'.join(parts[:depth]), None)
+
+        paths = []
+        for name, size in sorted(names.items()):
+            if not recursive and '/' in name[len(prefix):]:
+                continue
+            path = {'name': name[len(filesystem) + 1:], 'lastModified': 'Sun, 01 Jan 2023 00:00:00 GMT', 'etag': '0x1'}
+            if size is None:
+                path['isDirectory'] = 'true'
+            else:
+                path['contentLength'] = str(size)
+            paths.append(path)
+
+        self._respond(200, json.dumps({'paths': paths}).encode('utf-8'), {'Content-Type': 'application/json'})
+
+    def do_HEAD(self):
+        path, query = self._parse()
+        with self.state.lock:
+            file = self.state.files.get(path)
+            is_directory = file is None and self.state.is_directory(path)
+        if file is None and not is_directory:
+            return self._respond(404, headers={'x-ms-error-code': 'BlobNotFound'})
+
+        headers = {
+            'x-ms-blob-type': 'BlockBlob',
+            'x-ms-resource-type': 'directory' if is_directory else 'file',
+            'Content-Length': str(len(file['data']) if file else 0)
+        }
+        if is_directory:
+            headers['x-ms-meta-hdi_isfolder'] = 'true'
+        self._respond(200, headers=headers)
+
+    def do_DELETE(self):
+        path, query = self._parse()
+        with self.state.lock:
+            if path not in self.state.files and not self.state.is_directory(path):
+                return self._error(404, 'PathNotFound')
+            self.state.delete(path)
+
+        self._respond(200)
+
+
+def start_storage_server(host='127.0.0.1', port=0, latency=0.0):
+    state = StorageState(latency)
+    handler = type('Handler', (StorageRequestHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, state
@@ -0,0 +1,399 @@
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import resource
+import time
+
+from benchmark.excel_conversion import generate_workbook
+from benchmark.fake_datalake import FakeDatalake, installed
+from benchmark.synthetic import Dataset
+from benchmark.vendor_server import start_vendor_server
+from shared.formats import serialise_raw
+
+IMPORT_DATE = '2023/01/01'
+
+
+class FakeKeyVault:
+    # Secret names double as their values: the API key and the client name the base URL is built from
+    def __init__(self, azure_credential, kv_name, *args, **kwargs):
+        pass
+
+    def get_key_vault_secrets(self, secret_names):
+        return {name: name for name in secret_names}
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile
+    if not values:
+        return None
+    values = sorted(values)
+
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss():
+    # Linux lets a process reset its own high-water mark, so set-up is not counted
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def seed_raw_file(root_directory_name, path, filename, data, raw_format):
+    directory_name = f"{root_directory_name}/{path}/{IMPORT_DATE}"
+    FakeDatalake(None, 'benchmark', 'raw', root_directory_name).upload_file_to_directory(
+        directory_name, f"{filename}.{raw_format}", serialise_raw(data, raw_format)
+    )
+
+    return f"{path}/{IMPORT_DATE}/{filename}.{raw_format}"
+
+
+def artifax_payload(dataset, endpoint):
+    if endpoint == 'arrangements/event':
+        return dataset.all_events()
+
+    return dataset.artifax(endpoint, {})
+
+
+def artifax_request(endpoint):
+    def scenario(dataset, options):
+        from shared.processor import ArtifaxRequest
+
+        def run():
+            ArtifaxRequest(
+                'vault', 'benchmark', 'raw', 'artifax', endpoint, 'api-key', 'client', None,
+                options['max_workers'], options['raw_format'], metrics=options['metrics'],
+                rate_limit=options['client_rate_limit'], cache_ttl=options['cache_ttl'],
+                stream_events=options['stream_events']
+            ).process()
+
+        return run, len(artifax_payload(dataset, endpoint))
+
+    return scenario
+
+
+def artifax_process(endpoint):
+    def scenario(dataset, options):
+        from shared.processor import ArtifaxProcessor
+
+        data = artifax_payload(dataset, endpoint)
+        raw_filename = seed_raw_file('artifax', endpoint, endpoint.split('/')[1], data, options['raw_format'])
+
+        def run():
+            ArtifaxProcessor(
+                endpoint, raw_filename, 'benchmark', 'raw', 'structured', 'artifax', None,
+                options['output_format'], options['stream_batch_size'], metrics=options['metrics'],
+                normalise_engine=options['normalise_engine'], partitioned=options['partitioned'],
+                partition_columns=options['partition_columns']
+            ).process()
+
+        return run, len(data)
+
+    return scenario
+
+
+def access_request(endpoint):
+    def scenario(dataset, options):
+        from shared.processor import AccessRequest
+
+        def run():
+            AccessRequest(
+                'vault', 'benchmark', 'raw', 'access', endpoint, 'api-key', 'client', None, options['raw_format'],
+                metrics=options['metrics'], rate_limit=options['client_rate_limit']
+            ).process()
+
+        return run, len(dataset.access_records(endpoint.split('/')[1]))
+
+    return scenario
+
+
+def access_process(endpoint):
+    def scenario(dataset, options):
+        from shared.processor import AccessProcessor
+
+        data = dataset.access_records(endpoint.split('/')[1])
+        raw_filename = seed_raw_file('access', endpoint, endpoint.split('/')[1], data, options['raw_format'])
+
+        def run():
+            AccessProcessor(
+                raw_filename, 'benchmark', 'raw', 'structured', 'access', None,
+                options['output_format'], options['stream_batch_size'], metrics=options['metrics'],
+                normalise_engine=options['normalise_engine']
+            ).process()
+
+        return run, len(data)
+
+    return scenario
+
+
+def artifax_pipeline(endpoint, in_memory):
+    # The ingest and the processor one after the other; in pipeline mode the processor is handed the
+    # records, otherwise it downloads and parses the raw file the ingest wrote, as artifax-process does
+    def scenario(dataset, options):
+        from shared.processor import ArtifaxProcessor, ArtifaxRequest
+
+        def run():
+            artifax_request = ArtifaxRequest(
+                'vault', 'benchmark', 'raw', 'artifax', endpoint, 'api-key', 'client', None,
+                options['max_workers'], options['raw_format'], metrics=options['metrics'],
+                rate_limit=options['client_rate_limit'], cache_ttl=options['cache_ttl'],
+                stream_events=options['stream_events'], keep_records=in_memory
+            )
+            _, raw_filename = artifax_request.process()
+            ArtifaxProcessor(
+                endpoint, raw_filename, 'benchmark', 'raw', 'structured', 'artifax', None,
+                options['output_format'], options['stream_batch_size'], metrics=options['metrics'],
+                normalise_engine=options['normalise_engine'], partitioned=options['partitioned'],
+                partition_columns=options['partition_columns']
+            ).process(artifax_request.records)
+
+        return run, len(artifax_payload(dataset, endpoint))
+
+    return scenario
+
+
+def access_pipeline(endpoint, in_memory):
+    def scenario(dataset, options):
+        from shared.processor import AccessProcessor, AccessRequest
+
+        def run():
+            access_request = AccessRequest(
+                'vault', 'benchmark', 'raw', 'access', endpoint, 'api-key', 'client', None, options['raw_format'],
+                metrics=options['metrics'], rate_limit=options['client_rate_limit'], keep_records=in_memory
+            )
+            raw_filename = access_request.process()
+            AccessProcessor(
+                raw_filename, 'benchmark', 'raw', 'structured', 'access', None,
+                options['output_format'], options['stream_batch_size'], metrics=options['metrics'],
+                normalise_engine=options['normalise_engine']
+            ).process(access_request.records)
+
+        return run, len(dataset.access_records(endpoint.split('/')[1]))
+
+    return scenario
+
+
+def spektrix_workbook(dataset):
+    workbook = io.BytesIO()
+    rows = 2000 * dataset.scale
+    generate_workbook(workbook, rows)
+
+    return workbook.getvalue(), rows
+
+
+def spektrix_request(dataset, options):
+    from shared.processor import SpektrixRequest
+
+    workbook, rows = spektrix_workbook(dataset)
+    FakeDatalake(None, 'benchmark', 'landing', 'spektrix').upload_file_to_directory(
+        'spektrix/new', 'Transaction_Item-20230101.xlsx', workbook
+    )
+
+    def run():
+        SpektrixRequest(
+            'new/Transaction_Item-20230101.xlsx', 'benchmark', 'landing', 'raw', 'spektrix', None,
+            metrics=options['metrics']
+        ).process()
+
+    return run, rows
+
+
+def spektrix_process(dataset, options):
+    from shared.processor import SpektrixProcessor
+
+    workbook, rows = spektrix_workbook(dataset)
+    raw_filepath = f"transaction_item/{IMPORT_DATE}/Transaction_Item-20230101.xlsx"
+    FakeDatalake(None, 'benchmark', 'raw', 'spektrix').upload_file_to_directory(
+        f"spektrix/transaction_item/{IMPORT_DATE}", 'Transaction_Item-20230101.xlsx', workbook
+    )
+
+    def run():
+        SpektrixProcessor(
+            raw_filepath, 'benchmark', 'raw', 'structured', 'spektrix', None,
+            options['output_format'], options['stream_batch_size'], options['excel_engine'],
+            metrics=options['metrics']
+        ).process()
+
+    return run, rows
+
+
+SCENARIOS = {
+    'artifax-request-room': artifax_request('arrangements/room'),
+    'artifax-request-arrangement': artifax_request('arrangements/arrangement'),
+    'artifax-request-event': artifax_request('arrangements/event'),
+    'artifax-request-invoice-schedule': artifax_request('finances/invoice_schedule'),
+    'artifax-process-room': artifax_process('arrangements/room'),
+    'artifax-process-arrangement': artifax_process('arrangements/arrangement'),
+    'artifax-process-event': artifax_process('arrangements/event'),
+    'artifax-process-event-activity': artifax_process('arrangements/event_activity'),
+    'artifax-process-invoice-schedule': artifax_process('finances/invoice_schedule'),
+    'access-request-person': access_request('hr/person'),
+    'access-process-person': access_process('hr/person'),
+    'artifax-two-step-arrangement': artifax_pipeline('arrangements/arrangement', False),
+    'artifax-pipeline-arrangement': artifax_pipeline('arrangements/arrangement', True),
+    'artifax-two-step-event': artifax_pipeline('arrangements/event', False),
+    'artifax-pipeline-event': artifax_pipeline('arrangements/event', True),
+    'artifax-two-step-invoice-schedule': artifax_pipeline('finances/invoice_schedule', False),
+    'artifax-pipeline-invoice-schedule': artifax_pipeline('finances/invoice_schedule', True),
+    'access-two-step-person': access_pipeline('hr/person', False),
+    'access-pipeline-person': access_pipeline('hr/person', True),
+    'spektrix-request': spektrix_request,
+    'spektrix-process': spektrix_process,
+}
+
+
+def run_scenario(name, options, vendor_port):
+    # Runs in a fresh process, so the peak RSS and the cached clients belong to this scenario alone
+    import shared.processor
+    from shared.transport import get_session
+
+    shared.processor.ARTIFAX_BASE_URL = f"http://127.0.0.1:{vendor_port}/artifax/"
+    shared.processor.ACCESS_BASE_URL = f"http://127.0.0.1:{vendor_port}/access/"
+    shared.processor.KeyVault = FakeKeyVault
+
+    # Timed around send, so the latency includes any retries the session makes
+    api_latencies = []
+    session = get_session()
+    send = session.send
+
+    def timed_send(request, **kwargs):
+        start = time.perf_counter()
+        try:
+            return send(request, **kwargs)
+        finally:
+            api_latencies.append(time.perf_counter() - start)
+
+    session.send = timed_send
+
+    dataset = Dataset(options['scale'], options['seed'])
+    with installed() as storage:
+        run, records = SCENARIOS[name](dataset, options)
+        storage.reset_counters()
+        reset_peak_rss()
+
+        durations = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            run()
+            durations.append(time.perf_counter() - start)
+
+        lake = storage.counters()
+
+    return {
+        'scenario': name,
+        'records': records,
+        'durations': durations,
+        'api_latencies': api_latencies,
+        'peak_rss_mb': peak_rss_mb(),
+        'lake': lake,
+    }
+
+
+def summarise(result, vendor):
+    durations = result['durations']
+    p50 = percentile(durations, 0.5)
+
+    return {
+        **{key: value for key, value in result.items() if key not in ('durations', 'api_latencies')},
+        'runs': len(durations),
+        'seconds_p50': p50,
+        'seconds_p95': percentile(durations, 0.95),
+        'records_per_second': result['records'] / p50 if p50 else None,
+        'api_latency_p50': percentile(result['api_latencies'], 0.5),
+        'api_latency_p95': percentile(result['api_latencies'], 0.95),
+        'api_latency_p99': percentile(result['api_latencies'], 0.99),
+        'api_calls': sum(vendor['requests'].values()),
+        'api_throttled': vendor['statuses'].get(429, 0),
+        'lake_calls': sum(result['lake']['calls'].values()),
+    }
+
+
+def format_seconds(value):
+    return '-' if value is None else f"{value * 1000:.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end Request/Processor benchmarks against local stand-ins")
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--scale', type=int, default=1, help="multiplies the size of every synthetic dataset")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=20, help="vendor API round-trip time per request")
+    parser.add_argument('--rate-limit', type=float, help="vendor API requests per second before 429s")
+    parser.add_argument('--burst', type=float, help="vendor API burst size, defaults to the rate limit")
+    parser.add_argument('--no-etags', action='store_true', help="vendor API sends no ETags, so caches use the TTL")
+    parser.add_argument('--max-workers', type=int, default=1, help="ArtifaxRequest event concurrency")
+    parser.add_argument('--client-rate-limit', type=float, help="requests per second the requests are configured with")
+    parser.add_argument('--cache-ttl', type=float, help="enables the Artifax response cache with this TTL in seconds")
+    parser.add_argument('--stream-events', action='store_true', help="stream events into the raw file as they arrive")
+    parser.add_argument('--raw-format', default='json')
+    parser.add_argument('--output-format', default='csv')
+    parser.add_argument('--stream-batch-size', type=int)
+    parser.add_argument('--excel-engine', default='openpyxl')
+    parser.add_argument('--normalise-engine', default='pandas', help="e.g. arrow or pandas,event=arrow")
+    parser.add_argument('--partitioned', action='store_true', help="write invoice schedules by month")
+    parser.add_argument('--partition-columns', help="e.g. event=event_date, the synthetic events' date")
+    parser.add_argument('--metrics', action='store_true', help="run with the pipeline metrics enabled")
+    parser.add_argument('--json', help="also write the results to this file, for comparing runs")
+    args = parser.parse_args()
+
+    options = {
+        'scale': args.scale, 'seed': args.seed, 'repeat': args.repeat, 'max_workers': args.max_workers,
+        'raw_format': args.raw_format, 'output_format': args.output_format,
+        'stream_batch_size': args.stream_batch_size, 'excel_engine': args.excel_engine,
+        'normalise_engine': args.normalise_engine, 'partitioned': args.partitioned,
+        'partition_columns': args.partition_columns, 'metrics': args.metrics,
+        'client_rate_limit': args.client_rate_limit, 'cache_ttl': args.cache_ttl,
+        'stream_events': args.stream_events,
+    }
+    server, vendor = start_vendor_server(
+        Dataset(args.scale, args.seed), latency=args.latency_ms / 1000, rate_limit=args.rate_limit, burst=args.burst,
+        etags=not args.no_etags
+    )
+    context = multiprocessing.get_context('spawn')
+
+    print(
+        f"{'scenario':<34} {'records':>8} {'p50 ms':>8} {'p95 ms':>8} {'records/s':>10} {'RSS MB':>7} "
+        f"{'API':>6} {'429':>5} {'API p50/p95/p99 ms':>19} {'lake':>5}"
+    )
+    results = []
+    for name in args.scenarios:
+        vendor.reset_counters()
+        with context.Pool(1) as pool:
+            result = pool.apply(run_scenario, (name, options, server.server_port))
+        summary = summarise(result, vendor.counters())
+        results.append(summary)
+
+        api_latency = '/'.join(
+            format_seconds(summary[key]) for key in ('api_latency_p50', 'api_latency_p95', 'api_latency_p99')
+        )
+        print(
+            f"{name:<34} {summary['records']:>8} {format_seconds(summary['seconds_p50']):>8} "
+            f"{format_seconds(summary['seconds_p95']):>8} {summary['records_per_second']:>10.0f} "
+            f"{summary['peak_rss_mb']:>7.0f} {summary['api_calls']:>6} {summary['api_throttled']:>5} "
+            f"{api_latency:>19} {summary['lake_calls']:>5}"
+        )
+
+    server.shutdown()
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'options': options, 'results': results}, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import copy
+import glob
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+from shared.processor import ARRANGEMENT_PLAN, INVOICE_SCHEDULE_PLAN
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+START_DATE = datetime(2023, 1, 1)
+
+
+def sample_rooms():
+    path = sorted(glob.glob(os.path.join(DATA_DIRECTORY, 'room_*.json')))[-1]
+    with open(path) as file:
+        return json.load(file)
+
+
+class Dataset:
+    # Deterministic synthetic payloads for the vendor endpoints. Rooms are the captured sample
+    # scaled up; the other entities follow the columns the processors declare.
+    def __init__(self, scale=1, seed=0):
+        self.scale = scale
+        self.seed = seed
+        self.arrangement_count = 200 * scale
+        self.events_per_arrangement = 8
+        self.invoice_schedule_count = 5000 * scale
+        self.room_count = 500 * scale
+        self.access_record_count = 5000 * scale
+        self._cache = {}
+
+    def _value(self, rng, column, dtype):
+        # A value shaped like the column's declared type: ids, a handful of repeated labels, ISO
+        # dates and amounts; undeclared columns get free text
+        if dtype == 'Int64':
+            return rng.randint(1, 5000)
+        if dtype == 'category':
+            return f"{column} {rng.randint(0, 20)}"
+        if dtype == 'datetime':
+            return (START_DATE + timedelta(days=rng.randint(-400, 200))).strftime("%Y-%m-%d")
+        if dtype and dtype.startswith('decimal'):
+            return round(rng.uniform(0, 5000), 2)
+
+        return f"{column} {rng.randint(0, 10 ** 6)}"
+
+    def _random(self, name):
+        return random.Random(f"{self.seed}:{name}")
+
+    def _cached(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+
+        return self._cache[name]
+
+    def rooms(self):
+        def build():
+            sample = sample_rooms()
+            rooms = []
+            for number in range(self.room_count):
+                room = copy.deepcopy(sample[number % len(sample)])
+                room['room_id'] = number + 1
+                room['room_name'] = f"{room['room_name']} {number // len(sample)}"
+                rooms.append(room)
+            return rooms
+
+        return self._cached('rooms', build)
+
+    def arrangements(self):
+        def build():
+            rng = self._random('arrangements')
+            schema = ARRANGEMENT_PLAN.schemas[0]
+            arrangements = []
+            for number in range(self.arrangement_count):
+                arrangement = {
+                    column: self._value(rng, column, schema.dtypes.get(column)) for column in schema.columns
+                }
+                last_event = START_DATE + timedelta(days=rng.randint(-400, 200))
+                arrangement.update({
+                    'arrangement_id': number + 1,
+                    'arrangement_type_id': rng.randint(1, 12),
+                    'estimated_revenue': round(rng.uniform(0, 50000), 2),
+                    'date_first_event': (last_event - timedelta(days=rng.randint(0, 30))).strftime("%Y-%m-%d"),
+                    'date_last_event': last_event.strftime("%Y-%m-%d"),
+                    'custom_forms': [self._custom_form(rng, form) for form in range(rng.randint(0, 2))]
+                })
+                arrangements.append(arrangement)
+            return arrangements
+
+        return self._cached('arrangements', build)
+
+    def _custom_form(self, rng, form):
+        return {
+            'custom_form_assignment_id': rng.randint(1, 10 ** 6),
+            'custom_form_definition_id': form + 1,
+            'custom_form_name': f"Form {form + 1}",
+            'custom_form_sections': [
+                {
+                    'custom_form_section_id': section + 1,
+                    'custom_form_section_name': f"Section {section + 1}",
+                    'custom_form_elements': [
+                        {'custom_form_element_id': element + 1, 'label': f"Question {element + 1}",
+                         'value': rng.choice([None, 'Yes', 'No', rng.randint(0, 100)])}
+                        for element in range(rng.randint(1, 6))
+                    ]
+                }
+                for section in range(rng.randint(1, 3))
+            ]
+        }
+
+    def events(self, arrangement_id):
+        rng = self._random(f"events:{arrangement_id}")
+        events = []
+        for number in range(self.events_per_arrangement):
+            start = START_DATE + timedelta(days=rng.randint(-400, 200), hours=rng.randint(8, 20))
+            events.append({
+                'event_id': arrangement_id * 1000 + number,
+                'arrangement_id': arrangement_id,
+                'event_name': f"Event {arrangement_id}-{number}",
+                'event_date': start.strftime("%Y-%m-%d"),
+                'start_time': start.strftime("%H:%M:%S"),
+                'end_time': (start + timedelta(hours=rng.randint(1, 4))).strftime("%H:%M:%S"),
+                'room_id': rng.randint(1, self.room_count),
+                'event_status_id': rng.randint(1, 6),
+                'activity_id': rng.randint(1, 40),
+                'attendance': rng.choice([None, rng.randint(0, 2000)]),
+                'event_type': {'id': rng.randint(1, 5), 'name': 'Performance'}
+            })
+
+        return events
+
+    def all_events(self):
+        return [event for arrangement in self.arrangements() for event in self.events(arrangement['arrangement_id'])]
+
+    def event_activities(self):
+        def build():
+            rng = self._random('event_activities')
+            return [
+                {
+                    'activity_id': number + 1, 'background_color': '#ffffff', 'code': f"A{number}",
+                    'custom_forms': [], 'event_activity_name': f"Activity {number + 1}", 'text_color': '#000000',
+                    'arrangement_types': [{'id': rng.randint(1, 12), 'name': 'Type'} for _ in range(rng.randint(0, 4))]
+                }
+                for number in range(40)
+            ]
+
+        return self._cached('event_activities', build)
+
+    def invoice_schedules(self):
+        def build():
+            rng = self._random('invoice_schedules')
+            schema = INVOICE_SCHEDULE_PLAN.schemas[0]
+            schedules = []
+            for number in range(self.invoice_schedule_count):
+                schedule = {
+                    column: rng.choice([None, self._value(rng, column, schema.dtypes.get(column))])
+                    for column in schema.columns
+                }
+                schedule.update({
+                    'object_type': rng.randint(1, 3),
+                    'arrangement_id': rng.randint(1, self.arrangement_count),
+                    'invoice_date': (START_DATE - timedelta(days=rng.randint(0, 199))).strftime("%Y-%m-%d"),
+                    'net_amount': round(rng.uniform(0, 5000), 2),
+                    'quantity': rng.randint(1, 20)
+                })
+                schedules.append(schedule)
+            return schedules
+
+        return self._cached('invoice_schedules', build)
+
+    def access_records(self, endpoint):
+        def build():
+            rng = self._random(f"access:{endpoint}")
+            return [
+                {
+                    'id': number + 1, 'code': f"{endpoint[:3].upper()}{number:06d}",
+                    'name': f"{endpoint} {number}", 'active': rng.random() > 0.1,
+                    'amount': round(rng.uniform(-1000, 1000), 2),
+                    'modified': (START_DATE - timedelta(minutes=rng.randint(0, 10 ** 6))).isoformat(),
+                    'details': {'department': f"D{rng.randint(1, 40)}", 'grade': rng.randint(1, 9)}
+                }
+                for number in range(self.access_record_count)
+            ]
+
+        return self._cached(f"access:{endpoint}", build)
+
+    def artifax(self, endpoint, parameters):
+        # The payload GET /api/{endpoint} returns for these query parameters
+        if endpoint == 'arrangements/arrangement':
+            return self.arrangements()
+        if endpoint == 'arrangements/event':
+            return self.events(int(parameters['arrangement_id']))
+        if endpoint == 'arrangements/room':
+            return self.rooms()
+        if endpoint == 'arrangements/event_activity':
+            return self.event_activities()
+        if endpoint == 'finances/invoice_schedule':
+            return self.invoice_schedules()
+
+        return None
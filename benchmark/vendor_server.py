@@ -0,0 +1,113 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import orjson
+
+
+class VendorState:
+    # Shared by every handler thread: the dataset, the simulated network and the request counters
+    def __init__(self, dataset, latency=0.0, rate_limit=None, burst=None, etags=True):
+        self.dataset = dataset
+        self.latency = latency
+        self.etags = etags
+        self.rate_limit = rate_limit
+        self.burst = burst or rate_limit
+        self.tokens = self.burst
+        self.refilled = time.monotonic()
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.statuses = Counter()
+        self._payloads = {}
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests.clear()
+            self.statuses.clear()
+
+    def counters(self):
+        with self.lock:
+            return {'requests': dict(self.requests), 'statuses': dict(self.statuses)}
+
+    def take_token(self):
+        # Token bucket: rate_limit requests per second with bursts of up to burst requests
+        if not self.rate_limit:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate_limit)
+            self.refilled = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+
+            return True
+
+    def payload(self, vendor, endpoint, parameters):
+        key = (vendor, endpoint, tuple(sorted(parameters.items())))
+        if key not in self._payloads:
+            if vendor == 'artifax':
+                data = self.dataset.artifax(endpoint, parameters)
+            else:
+                data = self.dataset.access_records(endpoint)
+            self._payloads[key] = None if data is None else orjson.dumps(data)
+
+        return self._payloads[key]
+
+
+class VendorRequestHandler(BaseHTTPRequestHandler):
+    # Local stand-in for the Artifax (/artifax/{endpoint}) and Access (/access/{endpoint}) APIs
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status, body=b'', headers=None):
+        with self.state.lock:
+            self.state.statuses[status] += 1
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        vendor, _, endpoint = url.path.strip('/').partition('/')
+        parameters = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with self.state.lock:
+            self.state.requests[f"{vendor}/{endpoint}"] += 1
+
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        if not (self.headers.get('X-API-KEY') or self.headers.get('Authorization')):
+            return self._respond(401, b'{"error": "Unauthorised"}')
+        if not self.state.take_token():
+            return self._respond(429, b'{"error": "Too many requests"}', {'Retry-After': '1'})
+
+        body = self.state.payload(vendor, endpoint, parameters)
+        if body is None:
+            return self._respond(404, b'{"error": "Not found"}')
+        if not self.state.etags:
+            return self._respond(200, body, {'Content-Type': 'application/json'})
+
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            return self._respond(304, headers={'ETag': etag})
+
+        self._respond(200, body, {'Content-Type': 'application/json', 'ETag': etag})
+
+
+def start_vendor_server(dataset, host='127.0.0.1', port=0, latency=0.0, rate_limit=None, burst=None, etags=True):
+    state = VendorState(dataset, latency, rate_limit, burst, etags)
+    handler = type('Handler', (VendorRequestHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, state
@@ -0,0 +1,169 @@
+import json
+from itertools import chain
+
+import pandas as pd
+import pyarrow as pa
+
+from shared.formats import EntityOptions
+
+NORMALISE_ENGINES = ('pandas', 'arrow')
+
+
+class NormaliseEngines(EntityOptions):
+    # "pandas", "arrow" or "pandas,event=arrow,hr_person=arrow", as OutputFormats
+    choices = NORMALISE_ENGINES
+    default = 'pandas'
+    kind = 'normalise engine'
+
+
+def _nested_keys(value, prefix):
+    keys = []
+    for key, item in value.items():
+        if isinstance(item, dict):
+            keys.extend(_nested_keys(item, f"{prefix}{key}."))
+        else:
+            keys.append(f"{prefix}{key}")
+
+    return keys
+
+
+def _record_keys(record):
+    # The column order pd.json_normalize gives a record: its own fields first, then each nested
+    # dict flattened in turn
+    keys = []
+    nested = []
+    for key, item in record.items():
+        if type(item) is dict:
+            nested.append((key, item))
+        else:
+            keys.append(key)
+    for key, item in nested:
+        keys.extend(_nested_keys(item, f"{key}."))
+
+    return keys
+
+
+def _flatten_record(record):
+    row = {}
+    for key, item in record.items():
+        if not isinstance(item, dict):
+            row[key] = item
+    for key, item in record.items():
+        if isinstance(item, dict):
+            _flatten_nested(row, item, f"{key}.")
+
+    return row
+
+
+def _flatten_nested(row, value, prefix):
+    for key, item in value.items():
+        if isinstance(item, dict):
+            _flatten_nested(row, item, f"{prefix}{key}.")
+        else:
+            row[f"{prefix}{key}"] = item
+
+
+def _get(record, path):
+    for key in path:
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+
+    return record
+
+
+def _has_struct(data_type):
+    return any(pa.types.is_struct(field.type) for field in data_type)
+
+
+def _flatten_structs(table):
+    # Table.flatten() expands one level of struct columns into parent.child columns
+    while any(pa.types.is_struct(field.type) for field in table.schema):
+        table = table.flatten()
+
+    return table
+
+
+def _text_array(values, nested_to_text):
+    # Lists are written as text, as serialise_dataframe writes them; mixed scalars as str()
+    return pa.array(
+        [None if value is None else nested_to_text(value) if isinstance(value, list) else str(value)
+         for value in values],
+        type=pa.string()
+    )
+
+
+def _column_array(values, nested_to_text):
+    if any(isinstance(value, list) for value in values):
+        return _text_array(values, nested_to_text)
+    try:
+        array = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return _text_array(values, nested_to_text)
+
+    return array
+
+
+def _finish_column(array):
+    if pa.types.is_null(array.type):
+        return array.cast(pa.string())
+
+    return array
+
+
+def _from_rows(records, nested_to_text):
+    # Records whose fields change type between rows: flattened row by row and built column by column
+    rows = [_flatten_record(record) for record in records]
+    columns = list(dict.fromkeys(chain.from_iterable(rows)))
+    arrays = [_finish_column(_column_array([row.get(column) for row in rows], nested_to_text)) for column in columns]
+
+    return pa.Table.from_arrays(arrays, names=columns)
+
+
+def _from_struct_array(records, array, nested_to_text):
+    # Arrow infers every record's fields at once; its struct fields are sorted, so the columns are
+    # put back in the order pandas would give them
+    if _has_struct(array.type):
+        columns = list(dict.fromkeys(chain.from_iterable(_record_keys(record) for record in records)))
+    else:
+        columns = list(dict.fromkeys(chain.from_iterable(records)))
+
+    table = _flatten_structs(pa.Table.from_batches([pa.RecordBatch.from_struct_array(array)]))
+    arrays = []
+    for column in columns:
+        array = table.column(column)
+        if pa.types.is_list(array.type) or pa.types.is_large_list(array.type):
+            # Read from the records themselves: Arrow would fill in the keys missing from nested dicts
+            path = column.split('.')
+            array = _text_array([_get(record, path) for record in records], nested_to_text)
+        arrays.append(_finish_column(array))
+
+    return pa.Table.from_arrays(arrays, names=columns)
+
+
+def json_normalize(records, nested_to_text=str):
+    # pd.json_normalize(records) as an Arrow table: the same columns in the same order, with the
+    # same values. Columns are typed by Arrow, so a column of ints with gaps stays int64.
+    # nested_to_text writes list values: str() as in the pandas CSV output, json.dumps as in Parquet.
+    # No records give the empty DataFrame pandas makes of them.
+    if isinstance(records, dict):
+        records = [records]
+    if not records:
+        return pd.json_normalize(records)
+
+    try:
+        array = pa.array(records)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return _from_rows(records, nested_to_text)
+    if not pa.types.is_struct(array.type):
+        return _from_rows(records, nested_to_text)
+
+    try:
+        return _from_struct_array(records, array, nested_to_text)
+    except KeyError:
+        # A field that is a dict in some records and a scalar in others
+        return _from_rows(records, nested_to_text)
+
+
+def list_to_text(output_format):
+    return json.dumps if output_format == 'parquet' else str
@@ -0,0 +1,67 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from shared.key_vault import get_azure_credential
+from shared.processor import SpektrixProcessor, SpektrixRequest
+
+BATCH_MAX_WORKERS = os.cpu_count() or 1
+
+
+def list_files(datalake, root_directory_name, prefix):
+    # Files in the folder of prefix whose path starts with prefix, e.g. "new/" for a landing folder
+    # or "customer/2023/03/01/" in the raw zone. Subfolders are not descended into. The paths are
+    # relative to root_directory_name, as the single-file endpoints expect them.
+    directory_name = f"{root_directory_name}/{prefix.rpartition('/')[0]}".rstrip('/')
+    start = f"{root_directory_name}/{prefix}"
+    paths = datalake.list_directory_contents(directory_name)
+
+    return sorted(
+        path.name[len(root_directory_name) + 1:]
+        for path in paths
+        if not path.is_directory and path.name.startswith(start)
+        and '/' not in path.name[len(directory_name) + 1:]
+    )
+
+
+def ingest_spektrix_file(landing_filename, settings):
+    return SpektrixRequest(landing_filename, azure_credential=get_azure_credential(), **settings).process()
+
+
+def process_spektrix_file(raw_filepath, settings):
+    return SpektrixProcessor(raw_filepath, azure_credential=get_azure_credential(), **settings).process()
+
+
+def _timed(function, filename, settings):
+    start = time.perf_counter()
+    try:
+        outcome = {'result': function(filename, settings)}
+    except Exception as e:
+        logging.exception(f"Failed to process {filename}")
+        outcome = {'error': f"{type(e).__name__}: {e}"}
+    outcome['seconds'] = round(time.perf_counter() - start, 3)
+
+    return outcome
+
+
+def run_batch(function, filenames, settings, max_workers=BATCH_MAX_WORKERS, processes=False):
+    # Runs function(filename, settings) for every file and returns one result per file, in order.
+    # Processes suit CPU-bound work; function and settings must then be picklable, so every worker
+    # creates its own credential and lake clients and reuses them for the files it is given.
+    max_workers = max(1, min(int(max_workers), len(filenames)))
+    if processes:
+        # Spawned rather than forked: the Functions worker runs gRPC threads a fork would copy mid-flight
+        executor = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'))
+    else:
+        executor = ThreadPoolExecutor(max_workers)
+
+    logging.info(f"Processing {len(filenames)} files with {max_workers} workers.")
+    start = time.perf_counter()
+    with executor:
+        futures = [executor.submit(_timed, function, filename, settings) for filename in filenames]
+        results = [{'filename': filename, **future.result()} for filename, future in zip(filenames, futures)]
+    logging.info(f"Processed {len(filenames)} files in {time.perf_counter() - start:.2f}s.")
+
+    return results
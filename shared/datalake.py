@@ -1,43 +1,345 @@
+import gzip
+import io
 import logging
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient
 from azure.storage.filedatalake import DataLakeServiceClient
 
+from shared import metrics
+
+ACCOUNT_URL = "https://{datalake_name}.dfs.core.windows.net"
+BLOB_ACCOUNT_URL = "https://{datalake_name}.blob.core.windows.net"  # server-side copy is a blob API
+COPY_POLL_INTERVAL = 1  # seconds between status checks of a pending server-side copy
+CHUNK_SIZE = 8 * 1024 * 1024  # bytes per append or ranged GET
+MAX_CONCURRENCY = 4  # parallel connections per transfer
+CONNECTION_TIMEOUT = 1000  # seconds
+SPOOL_SIZE = 16 * 1024 * 1024  # bytes of an iterable upload kept in memory before spilling to disk
+STAGING_DIRECTORY = '_staging'  # replacement directories are built here, then renamed into place
+DELETE_MAX_WORKERS = 16
+PARTIAL_SUFFIX = '.partial'  # carried by a file being appended to until it is complete
+
+# Clients live for the whole worker process, so warm invocations skip construction and auth negotiation.
+# The download chunk size is client configuration, so it is part of every cache key.
+_service_clients = {}
+_blob_service_clients = {}
+_file_system_clients = {}
+_directory_clients = {}
+_clients_lock = threading.Lock()
+MAX_CACHED_DIRECTORY_CLIENTS = 1024
+
+
+def get_service_client(azure_credential, datalake_name, chunk_size=CHUNK_SIZE):
+    # The credential of the first caller is kept for the account; every caller uses the same managed identity
+    key = (datalake_name, chunk_size)
+    with _clients_lock:
+        if key not in _service_clients:
+            _service_clients[key] = DataLakeServiceClient(
+                account_url=ACCOUNT_URL.format(datalake_name=datalake_name), credential=azure_credential,
+                max_single_get_size=chunk_size, max_chunk_get_size=chunk_size
+            )
+
+        return _service_clients[key]
+
+
+def get_blob_service_client(azure_credential, datalake_name):
+    with _clients_lock:
+        if datalake_name not in _blob_service_clients:
+            _blob_service_clients[datalake_name] = BlobServiceClient(
+                account_url=BLOB_ACCOUNT_URL.format(datalake_name=datalake_name), credential=azure_credential
+            )
+
+        return _blob_service_clients[datalake_name]
+
+
+def get_file_system_client(azure_credential, datalake_name, filesystem_name, chunk_size=CHUNK_SIZE):
+    key = (datalake_name, chunk_size, filesystem_name)
+    client = _file_system_clients.get(key)
+    if client is None:
+        service_client = get_service_client(azure_credential, datalake_name, chunk_size)
+        with _clients_lock:
+            client = _file_system_clients.setdefault(
+                key, service_client.get_file_system_client(file_system=filesystem_name)
+            )
+
+    return client
+
+
+def get_directory_client(azure_credential, datalake_name, filesystem_name, directory_name, chunk_size=CHUNK_SIZE):
+    key = (datalake_name, chunk_size, filesystem_name, directory_name)
+    client = _directory_clients.get(key)
+    if client is None:
+        file_system_client = get_file_system_client(azure_credential, datalake_name, filesystem_name, chunk_size)
+        with _clients_lock:
+            # Date-stamped directories accumulate over the life of a worker, so keep the cache bounded
+            if len(_directory_clients) >= MAX_CACHED_DIRECTORY_CLIENTS:
+                _directory_clients.clear()
+            client = _directory_clients.setdefault(
+                key, file_system_client.get_directory_client(directory_name)
+            )
+
+    return client
+
+
+def decompress(data, filename):
+    # Raw zone files are compressed according to their extension
+    if filename.endswith('.gz'):
+        return gzip.decompress(data)
+
+    return data
+
+
+def decompress_chunks(chunks, filename):
+    if not filename.endswith('.gz'):
+        yield from chunks
+        return
+
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        if data := decompressor.decompress(chunk):
+            yield data
+    if data := decompressor.flush():
+        yield data
+
+
+def as_upload_stream(data, spool_size=SPOOL_SIZE):
+    # upload_data takes str, bytes and file objects as they are; other bytes-like objects and
+    # generators are turned into a seekable stream of known length for the chunked upload
+    if isinstance(data, (str, bytes)) or hasattr(data, 'read'):
+        return data
+    if isinstance(data, (bytearray, memoryview)):
+        return io.BytesIO(data)
+
+    stream = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    for chunk in data:
+        stream.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    stream.seek(0)
+
+    return stream
+
+
+def upload_size(stream):
+    # Only measured while metrics are collected: a str has to be encoded to know its size
+    if isinstance(stream, str):
+        return len(stream.encode('utf-8'))
+    if isinstance(stream, bytes):
+        return len(stream)
+    position = stream.tell()
+    size = stream.seek(0, io.SEEK_END) - position
+    stream.seek(position)
+
+    return size
+
+
+class AppendFile:
+    # A file written a piece at a time, holding at most one chunk in memory. Appended data becomes
+    # readable when it is committed; until close() the file is named with PARTIAL_SUFFIX, so a run
+    # that dies leaves what it committed behind, plainly marked as incomplete, unless it discard()s it.
+    def __init__(self, file_system_client, filesystem_name, path, chunk_size=CHUNK_SIZE):
+        self.filesystem_name = filesystem_name
+        self.path = path
+        self.partial_path = f"{path}{PARTIAL_SUFFIX}"
+        self.chunk_size = chunk_size
+        self.file_client = file_system_client.get_file_client(self.partial_path)
+        self.file_client.create_file()
+        self.buffer = bytearray()
+        self.offset = 0
+        self.committed = 0
+
+    @property
+    def uncommitted(self):
+        return self.offset + len(self.buffer) - self.committed
+
+    def write(self, data):
+        with metrics.stage('upload'):
+            self.buffer += data
+            while len(self.buffer) >= self.chunk_size:
+                self._append(self.chunk_size)
+
+    def _append(self, size):
+        chunk = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.file_client.append_data(chunk, offset=self.offset, length=len(chunk))
+        self.offset += len(chunk)
+        metrics.add('bytes_out', len(chunk))
+
+    def commit(self):
+        with metrics.stage('upload'):
+            if self.buffer:
+                self._append(len(self.buffer))
+            if self.offset > self.committed:
+                self.file_client.flush_data(self.offset)
+                self.committed = self.offset
+
+    def close(self):
+        self.commit()
+        with metrics.stage('upload'):
+            self.file_client.rename_file(f"{self.filesystem_name}/{self.path}")
+        logging.info(f"Completed file: {self.path} ({self.committed} bytes)")
+
+    def discard(self):
+        logging.info(f"Deleting file: {self.partial_path}")
+        self.buffer.clear()
+        try:
+            with metrics.stage('delete'):
+                self.file_client.delete_file()
+        except ResourceNotFoundError:
+            pass
+
+
+def clear_client_cache():
+    with _clients_lock:
+        _directory_clients.clear()
+        _file_system_clients.clear()
+        _blob_service_clients.clear()
+        _service_clients.clear()
+
 
 class Datalake:
-    def __init__(self, azure_credential, datalake_name, filesystem_name, directory_name):
+    def __init__(
+        self, azure_credential, datalake_name, filesystem_name, directory_name,
+        chunk_size=CHUNK_SIZE, max_concurrency=MAX_CONCURRENCY
+    ):
+        self.azure_credential = azure_credential
         self.datalake_name = datalake_name
-        self.datalake_uri = f"https://{datalake_name}.dfs.core.windows.net"
-        self.client = DataLakeServiceClient(account_url=self.datalake_uri, credential=azure_credential)
+        self.datalake_uri = ACCOUNT_URL.format(datalake_name=datalake_name)
+        self.chunk_size = chunk_size
+        self.max_concurrency = max_concurrency
+        self.client = get_service_client(azure_credential, datalake_name, chunk_size)
         self.filesystem_name = filesystem_name
+        self.file_system_client = get_file_system_client(
+            azure_credential, datalake_name, filesystem_name, chunk_size
+        )
         self.directory_name = directory_name
 
+    def _get_directory_client(self, directory_name):
+        return get_directory_client(
+            self.azure_credential, self.datalake_name, self.filesystem_name, directory_name, self.chunk_size
+        )
+
     def upload_file_to_directory(self, directory_name, filename, data):
         logging.info(f"Creating new file: {directory_name}/{filename}")
         try:
-            file_system_client = self.client.get_file_system_client(file_system=self.filesystem_name)
-            directory_client = file_system_client.get_directory_client(directory_name)
-            file_client = directory_client.create_file(filename)
-            file_client.upload_data(data, overwrite=True, connection_timeout=1000)
+            with metrics.stage('upload'):
+                stream = as_upload_stream(data)
+                if metrics.active():
+                    metrics.add('bytes_out', upload_size(stream))
+                directory_client = self._get_directory_client(directory_name)
+                file_client = directory_client.get_file_client(filename)
+                # overwrite=True creates the file itself, so no separate create_file call is needed
+                response = file_client.upload_data(
+                    stream, overwrite=True, chunk_size=self.chunk_size,
+                    max_concurrency=self.max_concurrency, connection_timeout=CONNECTION_TIMEOUT
+                )
+                if not response:
+                    # Zero-length uploads return before the file is created
+                    file_client.create_file()
         except Exception as e:
             raise
 
+    def open_append_file(self, directory_name, filename):
+        logging.info(f"Creating new file: {directory_name}/{filename}{PARTIAL_SUFFIX}")
+        with metrics.stage('upload'):
+            return AppendFile(
+                self.file_system_client, self.filesystem_name, f"{directory_name}/{filename}", self.chunk_size
+            )
+
     def download_file_from_directory(self, filename):
         logging.info(f"Downloading file: {filename}")
         try:
-            file_system_client = self.client.get_file_system_client(file_system=self.filesystem_name)
-            directory_client = file_system_client.get_directory_client(self.directory_name)
-            file_client = directory_client.get_file_client(filename)
-            streamdownloader = file_client.download_file()
-            file_reader = streamdownloader.readall()
+            with metrics.stage('download'):
+                directory_client = self._get_directory_client(self.directory_name)
+                file_client = directory_client.get_file_client(filename)
+                streamdownloader = file_client.download_file(max_concurrency=self.max_concurrency)
+                file_reader = streamdownloader.readall()
+            metrics.add('bytes_in', len(file_reader))
 
-            return file_reader
+            return decompress(file_reader, filename)
         except Exception as e:
             raise
 
+    def stream_file_from_directory(self, filename):
+        logging.info(f"Streaming file: {filename}")
+        try:
+            with metrics.stage('download'):
+                directory_client = self._get_directory_client(self.directory_name)
+                file_client = directory_client.get_file_client(filename)
+                streamdownloader = file_client.download_file()
+
+            return decompress_chunks(metrics.timed(streamdownloader.chunks(), 'download', 'bytes_in'), filename)
+        except Exception as e:
+            raise
+
+    def copy_file_to_directory(self, source, source_filename, directory_name, filename):
+        # Copies source_filename (relative to the directory of source, a Datalake for any filesystem)
+        # to directory_name/filename here. Within one account the storage service copies the bytes
+        # itself; otherwise, or if that fails, they are streamed through chunk by chunk.
+        logging.info(f"Copying file: {source.filesystem_name}/{source.directory_name}/{source_filename}")
+        with metrics.stage('copy'):
+            self._copy_file(source, source_filename, directory_name, filename)
+
+    def _copy_file(self, source, source_filename, directory_name, filename):
+        source_path = f"{source.directory_name}/{source_filename}"
+        destination_path = f"{directory_name}/{filename}"
+        if source.datalake_name == self.datalake_name:
+            try:
+                self._server_side_copy(source.filesystem_name, source_path, destination_path)
+                return
+            except ResourceNotFoundError:
+                raise
+            except HttpResponseError as e:
+                logging.warning(f"Server-side copy failed, streaming instead: {e}")
+
+        self._stream_copy(source.file_system_client.get_file_client(source_path), destination_path)
+
+    def move_file_to_directory(self, source, source_filename, directory_name, filename):
+        # A rename within one account; a copy and delete across accounts
+        source_path = f"{source.directory_name}/{source_filename}"
+        if source.datalake_name != self.datalake_name:
+            self.copy_file_to_directory(source, source_filename, directory_name, filename)
+            source.file_system_client.get_file_client(source_path).delete_file()
+            return
+
+        logging.info(f"Moving file: {source.filesystem_name}/{source_path}")
+        self._create_parent_directory(f"{directory_name}/{filename}")
+        source.file_system_client.get_file_client(source_path).rename_file(
+            f"{self.filesystem_name}/{directory_name}/{filename}"
+        )
+
+    def _server_side_copy(self, source_filesystem_name, source_path, destination_path):
+        blob_service_client = get_blob_service_client(self.azure_credential, self.datalake_name)
+        source_url = f"{blob_service_client.url.rstrip('/')}/{source_filesystem_name}/{quote(source_path)}"
+        blob_client = blob_service_client.get_blob_client(self.filesystem_name, destination_path)
+
+        # Same-account copies are authorised by the credential of the destination request
+        status = blob_client.start_copy_from_url(source_url)['copy_status']
+        while status == 'pending':
+            time.sleep(COPY_POLL_INTERVAL)
+            status = blob_client.get_blob_properties().copy.status
+        if status != 'success':
+            raise HttpResponseError(f"Copy of {source_path} ended with status {status}")
+
+    def _stream_copy(self, source_file_client, destination_path):
+        # Only one chunk is in memory at a time, whatever the size of the file
+        file_client = self.file_system_client.get_file_client(destination_path)
+        file_client.create_file()
+        offset = 0
+        for chunk in source_file_client.download_file().chunks():
+            file_client.append_data(chunk, offset=offset, length=len(chunk))
+            offset += len(chunk)
+        file_client.flush_data(offset)
+
     def list_directory_contents(self, directory_name):
         try:
-            file_system_client = self.client.get_file_system_client(file_system=self.filesystem_name)
-            files = file_system_client.get_paths(path=directory_name)
+            files = self.file_system_client.get_paths(path=directory_name)
 
             return files
         except Exception as e:
@@ -45,8 +347,7 @@ class Datalake:
 
     def directory_exists(self, directory_name):
         try:
-            file_system_client = self.client.get_file_system_client(file_system=self.filesystem_name)
-            directory_client = file_system_client.get_directory_client(directory_name)
+            directory_client = self._get_directory_client(directory_name)
             exists = directory_client.exists()
 
             return exists
@@ -56,9 +357,94 @@ class Datalake:
     def delete_file_from_directory(self, directory_name, filename):
         logging.info(f"Deleting file: {filename}")
         try:
-            file_system_client = self.client.get_file_system_client(file_system=self.filesystem_name)
-            directory_client = file_system_client.get_directory_client(directory_name)
-            file_client = directory_client.get_file_client(filename)
-            file_client.delete_file()
+            with metrics.stage('delete'):
+                directory_client = self._get_directory_client(directory_name)
+                file_client = directory_client.get_file_client(filename)
+                file_client.delete_file()
         except Exception as e:
             raise
+
+    def delete_directory(self, directory_name):
+        logging.info(f"Deleting directory: {directory_name}")
+        try:
+            with metrics.stage('delete'):
+                self._get_directory_client(directory_name).delete_directory()
+        except ResourceNotFoundError:
+            pass
+
+    def delete_directory_contents(self, directory_name, max_workers=DELETE_MAX_WORKERS):
+        # Fallback for replace_directory(atomic=False): the deletes run concurrently instead of one by one
+        try:
+            paths = list(self.file_system_client.get_paths(path=directory_name, recursive=False))
+        except ResourceNotFoundError:
+            return
+
+        def delete(path):
+            if path.is_directory:
+                self.file_system_client.get_directory_client(path.name).delete_directory()
+            else:
+                self.file_system_client.get_file_client(path.name).delete_file()
+
+        logging.info(f"Deleting {len(paths)} paths from: {directory_name}")
+        with metrics.stage('delete'):
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as executor:
+                list(executor.map(delete, paths))
+
+    def replace_directory(self, directory_name, files, atomic=True):
+        # Replaces everything in directory_name with files ({filename: data}). The new contents are
+        # written to a staging directory and swapped in with renames, so the number of storage calls
+        # does not grow with the number of files being replaced. The swap is two renames, not one:
+        # between them directory_name does not exist, so a reader listing it in that moment finds
+        # nothing rather than old or new files. It never sees a mix of the two, or a part-written file.
+        if not atomic:
+            self.delete_directory_contents(directory_name)
+            for filename, data in files.items():
+                self.upload_file_to_directory(directory_name, filename, data)
+            return
+
+        staging_name = f"{STAGING_DIRECTORY}/{uuid.uuid4().hex}"
+        try:
+            if not files:
+                # Uploads create the staging directory; without any, the replacement is an empty one
+                self._get_directory_client(staging_name).create_directory()
+            for filename, data in files.items():
+                self.upload_file_to_directory(staging_name, filename, data)
+        except Exception:
+            self.delete_directory(staging_name)
+            raise
+
+        logging.info(f"Replacing directory: {directory_name}")
+        with metrics.stage('replace'):
+            try:
+                retired = self._get_directory_client(directory_name).rename_directory(
+                    f"{self.filesystem_name}/{staging_name}_retired"
+                )
+            except ResourceNotFoundError:
+                retired = None
+                self._create_parent_directory(directory_name)
+            except Exception:
+                self.delete_directory(staging_name)
+                raise
+
+            try:
+                self._get_directory_client(staging_name).rename_directory(
+                    f"{self.filesystem_name}/{directory_name}"
+                )
+            except Exception:
+                if retired is not None:
+                    retired.rename_directory(f"{self.filesystem_name}/{directory_name}")
+                self.delete_directory(staging_name)
+                raise
+
+        if retired is not None:
+            with metrics.stage('delete'):
+                retired.delete_directory()
+
+    def _create_parent_directory(self, directory_name):
+        # A rename needs the destination's parent to exist
+        parent_name = directory_name.rpartition('/')[0]
+        if parent_name:
+            try:
+                self.file_system_client.create_directory(parent_name, match_condition=MatchConditions.IfMissing)
+            except ResourceExistsError:
+                pass
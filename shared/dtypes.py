@@ -0,0 +1,82 @@
+import logging
+import re
+from decimal import Decimal, InvalidOperation
+
+import pandas as pd
+import pyarrow as pa
+
+# Column types a TableSchema can declare:
+#   'category'         low-cardinality text, each distinct value stored once
+#   'Int64'            ids and counts, nullable, so a gap does not turn them into floats
+#   'decimal(p,s)'     amounts, exact, written with s decimal places
+#   'datetime'         ISO dates and timestamps
+# A column whose values do not fit its type is left as it came, with a warning.
+# Typed columns are written in their type's format, which is not always the text an inferred column
+# gets: decimals at their declared scale (12.50 rather than 12.5), datetimes with a space
+# (2024-03-01 10:30:00 rather than 2024-03-01T10:30:00) and ids with gaps as ints (7 rather than 7.0).
+DECIMAL_DTYPE = re.compile(r'decimal\((\d+),\s*(\d+)\)$')
+
+
+def _category(values):
+    return pd.Categorical(values)
+
+
+def _nullable_int(values):
+    return pd.to_numeric(pd.Series(values, dtype=object)).astype('Int64').array
+
+
+def _decimal(values, precision, scale):
+    # Through text, so a float such as 0.1 becomes 0.10 rather than its binary expansion; a value
+    # with more decimal places than the scale does not fit and is refused
+    decimals = [None if value is None else Decimal(str(value)) for value in values]
+
+    return pd.arrays.ArrowExtensionArray(pa.array(decimals, type=pa.decimal128(precision, scale)))
+
+
+def _datetime(values):
+    # Only text is parsed: numbers would be read as nanoseconds since the epoch
+    if not all(value is None or isinstance(value, str) for value in values):
+        raise TypeError("not all values are text")
+
+    return pd.to_datetime(pd.Series(values, dtype=object)).array
+
+
+def _inferred(values):
+    # As pd.DataFrame(rows) would infer it
+    if not values:
+        return pd.Series([], dtype=object).array
+
+    return pd.Series(values).array
+
+
+def column_array(values, dtype):
+    try:
+        if dtype == 'category':
+            return _category(values)
+        if dtype == 'Int64':
+            return _nullable_int(values)
+        if dtype == 'datetime':
+            return _datetime(values)
+        if match := DECIMAL_DTYPE.match(dtype):
+            return _decimal(values, int(match.group(1)), int(match.group(2)))
+    except (TypeError, ValueError, OverflowError, InvalidOperation, pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        logging.warning(f"Keeping column as it is, its values are not {dtype}: {e}")
+        return _inferred(values)
+
+    raise ValueError(f"Unsupported dtype: {dtype}")
+
+
+def typed_dataframe(rows, columns, dtypes):
+    # rows are lists in the order of columns; each column is built straight into its declared type,
+    # so the untyped column is never held alongside it in a DataFrame
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    rows.clear()
+    data = {}
+    for column, column_values in zip(columns, values):
+        column_values = list(column_values)
+        if column in dtypes:
+            data[column] = column_array(column_values, dtypes[column])
+        else:
+            data[column] = _inferred(column_values)
+
+    return pd.DataFrame(data, columns=columns)
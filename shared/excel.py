@@ -0,0 +1,104 @@
+import io
+from datetime import date, datetime, time
+from itertools import islice
+
+import pandas as pd
+from openpyxl import load_workbook
+
+EXCEL_ENGINES = ('openpyxl', 'calamine')
+EXCEL_BATCH_SIZE = 50000  # rows per DataFrame when a workbook is streamed
+
+
+def cell_value(value):
+    # Cell values as pd.read_excel returns them: whole numbers as int, empty cells as None and
+    # dates as datetimes (Excel has no date-only type; calamine reports midnight as a date)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if value == '':
+        return None
+    if type(value) is date:
+        return datetime.combine(value, time())
+
+    return value
+
+
+def iter_excel_rows(excel_file, engine='openpyxl'):
+    # Yields the rows of the first worksheet as tuples of cell values, without building the
+    # workbook object model. excel_file is the workbook's bytes or a binary file object.
+    if engine not in EXCEL_ENGINES:
+        raise ValueError(f"Unsupported Excel engine: {engine}")
+    if isinstance(excel_file, (bytes, bytearray)):
+        excel_file = io.BytesIO(excel_file)
+
+    if engine == 'calamine':
+        # Optional dependency: python-calamine reads the sheet in Rust, several times faster
+        from python_calamine import CalamineWorkbook
+
+        workbook = CalamineWorkbook.from_filelike(excel_file)
+        try:
+            for row in workbook.get_sheet_by_index(0).iter_rows():
+                yield tuple(cell_value(value) for value in row)
+        finally:
+            workbook.close()
+        return
+
+    workbook = load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        # Exports often carry a wrong dimension record, which read-only mode would trust
+        worksheet.reset_dimensions()
+        for row in worksheet.iter_rows(values_only=True):
+            yield tuple(cell_value(value) for value in row)
+    finally:
+        workbook.close()
+
+
+def excel_header(row):
+    # Column names as pd.read_excel makes them: blanks become "Unnamed: n", duplicates get ".n"
+    columns = []
+    seen = {}
+    for number, value in enumerate(row):
+        name = f"Unnamed: {number}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+
+    return columns
+
+
+def excel_frame(rows, columns):
+    # A batch typed as pd.read_excel types a column: by its values, with a column that has none
+    # (blank cells only) as float. A column typed differently in another batch, such as whole
+    # numbers here and a blank or text there, gets one type for the whole table from the TableWriter.
+    df = pd.DataFrame(rows, columns=columns, dtype=object).infer_objects()
+    for column in df.columns[df.isna().all().to_numpy()]:
+        df[column] = df[column].astype('float64')
+
+    return df
+
+
+def iter_excel_batches(excel_file, batch_size=EXCEL_BATCH_SIZE, engine='openpyxl'):
+    # Yields DataFrames of up to batch_size rows from the first worksheet, headed by its first row.
+    # Blank rows are skipped, as pd.read_excel does.
+    rows = (row for row in iter_excel_rows(excel_file, engine) if any(value is not None for value in row))
+    header = next(rows, None)
+    if header is None:
+        return
+
+    # Trailing blank header cells are cell formatting, not columns
+    while header and header[-1] is None:
+        header = header[:-1]
+    columns = excel_header(header)
+    width = len(columns)
+
+    yielded = False
+    while batch := list(islice(rows, batch_size)):
+        batch = [row[:width] if len(row) >= width else row + (None,) * (width - len(row)) for row in batch]
+        yield excel_frame(batch, columns)
+        yielded = True
+
+    if not yielded:
+        yield pd.DataFrame(columns=columns)
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+from shared.dtypes import typed_dataframe
+
+
+class TableSchema:
+    # One output table of an entity. Without a record_path the table has a row per record and
+    # columns lists the fields to keep (dotted for nested fields; None keeps every field). With a
+    # record_path the table has a row per item of that nested list, holding every field of the
+    # item plus the meta fields of its parents, as pd.json_normalize(record_path=, meta=) does.
+    # dtypes declares column types (see shared.dtypes) for the declared columns of a typed flatten.
+    def __init__(self, filename, columns=None, record_path=None, meta=None, drop=None, rename=None, dtypes=None):
+        self.filename = filename
+        self.columns = columns
+        self.record_path = record_path
+        self.meta = meta or []
+        self.drop = drop or []
+        self.rename = rename or {}
+        self.dtypes = dtypes or {}
+
+
+def _flatten_into(row, value, prefix=''):
+    # Nested dicts become dotted columns; lists and scalars are kept as they are
+    for key, item in value.items():
+        name = f"{prefix}{key}"
+        if isinstance(item, dict):
+            _flatten_into(row, item, f"{name}.")
+        else:
+            row[name] = item
+
+    return row
+
+
+def _compile_getter(column):
+    path = column.split('.')
+    if len(path) == 1:
+        return lambda record: record.get(column)
+
+    def get(record):
+        for key in path:
+            if not isinstance(record, dict):
+                return None
+            record = record.get(key)
+
+        return record
+
+    return get
+
+
+class _ParentTable:
+    def __init__(self, schema):
+        self.schema = schema
+        self.rows = []
+        if schema.columns is None:
+            self.add = lambda record: self.rows.append(_flatten_into({}, record))
+        else:
+            getters = [_compile_getter(column) for column in schema.columns]
+            self.add = lambda record: self.rows.append([get(record) for get in getters])
+
+    def to_dataframe(self, typed=False):
+        if self.schema.columns is None:
+            return pd.DataFrame(self.rows)
+        if typed and self.schema.dtypes:
+            return typed_dataframe(self.rows, self.schema.columns, self.schema.dtypes)
+
+        return pd.DataFrame(self.rows, columns=self.schema.columns)
+
+
+class _ChildTable:
+    def __init__(self, schema):
+        self.schema = schema
+        self.rows = []
+        self.meta_values = {self._meta_name(meta): [] for meta in schema.meta}
+        # Meta fields are read at the level of the path where they sit, so group them by depth
+        self.meta_by_depth = {}
+        for meta in schema.meta:
+            path = [meta] if isinstance(meta, str) else list(meta)
+            self.meta_by_depth.setdefault(len(path) - 1, []).append((self._meta_name(meta), path[-1]))
+
+    def _meta_name(self, meta):
+        return meta if isinstance(meta, str) else '.'.join(meta)
+
+    def add(self, record):
+        self._walk(record, 0, {})
+
+    def _walk(self, value, depth, meta):
+        for name, key in self.meta_by_depth.get(depth, ()):
+            meta = {**meta, name: value.get(key)}
+
+        items = value.get(self.schema.record_path[depth])
+        if not items:
+            return
+        if isinstance(items, dict):
+            items = [items]
+
+        if depth == len(self.schema.record_path) - 1:
+            for item in items:
+                self.rows.append(_flatten_into({}, item))
+                for name, values in self.meta_values.items():
+                    values.append(meta[name])
+        else:
+            for item in items:
+                self._walk(item, depth + 1, meta)
+
+    def to_dataframe(self, typed=False):
+        df = pd.DataFrame(self.rows)
+        for name, values in self.meta_values.items():
+            df[name] = np.array(values, dtype=object)
+        if self.schema.drop:
+            # A batch without items has only the meta columns, so the dropped fields may not be there
+            df = df.drop(columns=self.schema.drop, errors='ignore')
+        if self.schema.rename:
+            df = df.rename(columns=self.schema.rename)
+
+        return df
+
+
+class FlatteningPlan:
+    # Compiled from an entity's table schemas: flatten() walks each record once and fills every
+    # table as it goes, building only the declared columns. typed applies the declared dtypes.
+    def __init__(self, schemas):
+        self.schemas = schemas
+
+    def flatten(self, records, typed=False):
+        tables = [
+            _ChildTable(schema) if schema.record_path else _ParentTable(schema)
+            for schema in self.schemas
+        ]
+        adders = [table.add for table in tables]
+        for record in records:
+            for add in adders:
+                add(record)
+
+        return [{'filename': table.schema.filename, 'data': table.to_dataframe(typed)} for table in tables]
@@ -0,0 +1,439 @@
+import gzip
+import io
+import json
+import pickle
+import tempfile
+import textwrap
+import zlib
+
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+RAW_FORMATS = ('json', 'ndjson', 'ndjson.gz')
+RAW_COMPRESSION_LEVEL = 6
+OUTPUT_FORMATS = ('csv', 'parquet')
+PARQUET_COMPRESSION = 'snappy'
+SPOOL_SIZE = 16 * 1024 * 1024  # bytes kept in memory before a table writer spills to disk
+CSV_SLICE_ROWS = 20000  # rows formatted at a time when a DataFrame has Arrow-backed columns
+
+
+def serialise_raw(data, raw_format):
+    if raw_format not in RAW_FORMATS:
+        raise ValueError(f"Unsupported raw format: {raw_format}")
+
+    if raw_format == 'json':
+        # Legacy pretty-printed format
+        return json.dumps(data, sort_keys=True, indent=4)
+
+    if data is None:
+        records = []
+    else:
+        records = data if isinstance(data, list) else [data]
+    payload = b''.join(orjson.dumps(record) + b'\n' for record in records)
+
+    if raw_format.endswith('.gz'):
+        # A fixed header timestamp keeps the bytes, and so the content hash, the same for the same records
+        payload = gzip.compress(payload, compresslevel=RAW_COMPRESSION_LEVEL, mtime=0)
+
+    return payload
+
+
+def as_loaded(data, payload, raw_format):
+    # data as load_raw reads it back from payload, the raw file serialise_raw made of it. ndjson keeps
+    # the records as they are, so they are handed over without a parse. The json format sorts keys at
+    # every level, which decides the column order of the normalised tables, so its records are parsed
+    # from payload again: sorting them in Python measured no faster than the parse. With json, keeping
+    # the records saves the download and decoding of the raw file, not the parse.
+    if raw_format == 'json':
+        return json.loads(payload)
+    if data is None:
+        return []
+
+    return data if isinstance(data, list) else [data]
+
+
+def is_ndjson(filename):
+    return filename.endswith(('.ndjson', '.ndjson.gz'))
+
+
+def load_raw(raw_file, filename):
+    # raw_file is the decompressed text of a raw zone file; the extension says how it was written
+    if is_ndjson(filename):
+        return [orjson.loads(line) for line in raw_file.splitlines() if line.strip()]
+
+    return json.loads(raw_file)
+
+
+class RawEncoder:
+    # Serialises a list of records a piece at a time, into the same text serialise_raw makes of the
+    # whole list (for ndjson.gz, the same text once decompressed). sync() ends a compressed piece on
+    # a byte boundary, so everything written before it can be decompressed on its own.
+    def __init__(self, raw_format):
+        if raw_format not in RAW_FORMATS:
+            raise ValueError(f"Unsupported raw format: {raw_format}")
+        self.raw_format = raw_format
+        self.records = 0
+        self._compressor = None
+        if raw_format.endswith('.gz'):
+            self._compressor = zlib.compressobj(RAW_COMPRESSION_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def _compress(self, payload):
+        if self._compressor is None:
+            return payload
+
+        return self._compressor.compress(payload)
+
+    def start(self):
+        return b'[' if self.raw_format == 'json' else b''
+
+    def encode(self, records):
+        if self.raw_format == 'json':
+            # Each element indented one level, as json.dumps indents the elements of a list
+            payload = ''.join(
+                ('\n' if self.records + number == 0 else ',\n')
+                + textwrap.indent(json.dumps(record, sort_keys=True, indent=4), '    ')
+                for number, record in enumerate(records)
+            ).encode('utf-8')
+        else:
+            payload = b''.join(orjson.dumps(record) + b'\n' for record in records)
+        self.records += len(records)
+
+        return self._compress(payload)
+
+    def sync(self):
+        if self._compressor is None:
+            return b''
+
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.raw_format == 'json':
+            return b'\n]' if self.records else b']'
+        if self._compressor is None:
+            return b''
+
+        return self._compressor.flush()
+
+
+class EntityOptions:
+    # Parses "a" or "a,name=b,...": the bare item replaces the default, the name=value items override
+    # it per entity or output table
+    choices = ()
+    default = None
+    kind = 'option'
+
+    def __init__(self, spec=None):
+        self.overrides = {}
+        for item in (item.strip() for item in (spec or '').split(',')):
+            if not item:
+                continue
+            name, _, value = item.rpartition('=')
+            if value not in self.choices:
+                raise ValueError(f"Unsupported {self.kind}: {value}")
+            if name:
+                self.overrides[name] = value
+            else:
+                self.default = value
+
+    def get(self, *names):
+        for name in names:
+            if name in self.overrides:
+                return self.overrides[name]
+
+        return self.default
+
+
+class OutputFormats(EntityOptions):
+    # "csv", "parquet" or "csv,invoice_schedule=parquet,event=parquet"
+    choices = OUTPUT_FORMATS
+    default = 'csv'
+    kind = 'output format'
+
+
+def serialise_dataframe(df, output_format):
+    if isinstance(df, pa.Table):
+        return serialise_table(df, output_format)
+    if output_format == 'parquet':
+        return dataframe_to_parquet(df)
+
+    return dataframe_to_csv(df)
+
+
+def dataframe_to_csv(df, header=True):
+    # pandas formats Arrow-backed columns (the decimals of a typed schema) through several layers
+    # per value; str() of the values Arrow hands back is the same text, several times faster. The
+    # text is made a slice of rows at a time, so it is never held for the whole table.
+    arrow_columns = [column for column in df.columns if isinstance(df[column].dtype, pd.ArrowDtype)]
+    if not arrow_columns:
+        return df.to_csv(index=False, header=header)
+
+    return ''.join(
+        _format_columns(df.iloc[start:start + CSV_SLICE_ROWS], arrow_columns).to_csv(
+            index=False, header=header and start == 0
+        )
+        for start in range(0, max(len(df), 1), CSV_SLICE_ROWS)
+    )
+
+
+def _format_columns(df, columns):
+    return df.assign(**{
+        column: [None if value is None else str(value) for value in pa.array(df[column], from_pandas=True).to_pylist()]
+        for column in columns
+    })
+
+
+def serialise_table(table, output_format):
+    # Tables from the Arrow normalise engine are written by Arrow's own writers
+    buffer = pa.BufferOutputStream()
+    if output_format == 'parquet':
+        pq.write_table(table, buffer, compression=PARQUET_COMPRESSION)
+    else:
+        pa_csv.write_csv(table, buffer)
+
+    return buffer.getvalue().to_pybytes()
+
+
+def dataframe_to_parquet(df):
+    buffer = io.BytesIO()
+    pq.write_table(dataframe_to_arrow(df), buffer, compression=PARQUET_COMPRESSION)
+
+    return buffer.getvalue()
+
+
+def dataframe_to_arrow(df):
+    arrays = [_to_arrow_array(df[column]) for column in df.columns]
+
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in df.columns])
+
+
+def _to_arrow_array(series):
+    if series.dtype == object and series.map(lambda v: isinstance(v, (list, dict))).any():
+        # Nested values stay JSON text, as they are in the CSV output
+        series = series.map(lambda v: json.dumps(v) if isinstance(v, (list, dict)) else v)
+
+    try:
+        array = pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed scalar types in one column, e.g. ids that are sometimes strings
+        array = pa.array(series.astype(str).where(series.notna(), None), from_pandas=True)
+
+    if pa.types.is_null(array.type):
+        array = array.cast(pa.string())
+    elif pa.types.is_dictionary(array.type):
+        # Categories are written as their values, so every batch of a column has one type; Parquet
+        # dictionary-encodes them in the file anyway
+        array = array.dictionary_decode()
+
+    return array
+
+
+class TableLayout:
+    # The columns of a table written in batches, in order of first appearance, and the types their
+    # values had in each batch (null_types: the types of batches with no values in the column). The
+    # writers of a partitioned table share one, so every partition gets the same columns and types.
+    def __init__(self):
+        self.columns = []
+        self.types = {}
+        self.null_types = {}
+        self.nullable = set()
+        self.rows = 0
+
+    def add(self, df, is_table):
+        columns = df.column_names if is_table else list(df.columns)
+        present = set(columns)
+        self.nullable.update(column for column in self.columns if column not in present)
+        for column in columns:
+            if column not in self.types:
+                self.columns.append(column)
+                self.types[column] = set()
+                self.null_types[column] = set()
+                if self.rows:
+                    self.nullable.add(column)
+            values = df.column(column) if is_table else df[column]
+            nulls = values.null_count if is_table else int(values.isna().sum())
+            if nulls:
+                self.nullable.add(column)
+            types = self.types if nulls < len(df) else self.null_types
+            types[column].add(values.type if is_table else values.dtype)
+        self.rows += len(df)
+
+    def column_types(self, column):
+        # A column without a value in any batch keeps the type its batches agree on
+        if self.types[column] or len(self.null_types[column]) != 1:
+            return self.types[column]
+
+        return self.null_types[column]
+
+
+def _is_number_dtype(dtype):
+    # Arrow-backed decimals, from a typed schema, are numbers too
+    if isinstance(dtype, pd.ArrowDtype):
+        return _is_number_type(dtype.pyarrow_dtype)
+
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+
+def _is_number_type(data_type):
+    return pa.types.is_integer(data_type) or pa.types.is_floating(data_type) or pa.types.is_decimal(data_type)
+
+
+def common_dtype(dtypes, nullable=False):
+    # The dtype pandas gives a column whose values had these dtypes in separate batches: one int
+    # column with gaps is float, numbers of different kinds are float, anything else mixed is object.
+    # A declared decimal column that fell back to float in one batch is float in all of them, as it is
+    # when the whole table does not fit, rather than the float values being cut to the decimal's scale.
+    if not dtypes:
+        return None
+    if len(dtypes) == 1:
+        dtype = next(iter(dtypes))
+        if nullable and isinstance(dtype, np.dtype) and dtype.kind in 'iu':
+            return np.dtype('float64')
+        return dtype
+    if all(_is_number_dtype(dtype) for dtype in dtypes):
+        if all(pd.api.types.is_integer_dtype(dtype) for dtype in dtypes):
+            return pd.Int64Dtype() if nullable else np.dtype('int64')
+        return np.dtype('float64')
+
+    return np.dtype(object)
+
+
+def common_type(types, nullable=False, from_pandas=False):
+    # As common_dtype, for the Arrow types of a column: mixed numbers are float64, other mixes are
+    # text, as dataframe_to_arrow makes of a mixed column
+    if not types:
+        return pa.string()
+    if len(types) == 1:
+        data_type = next(iter(types))
+        if from_pandas and nullable and pa.types.is_integer(data_type):
+            return pa.float64()
+        return data_type
+    if all(_is_number_type(data_type) for data_type in types):
+        if all(pa.types.is_integer(data_type) for data_type in types) and not (from_pandas and nullable):
+            return pa.int64()
+        return pa.float64()
+
+    return pa.string()
+
+
+def cast_array(array, data_type):
+    if array.type == data_type:
+        return array
+    try:
+        return array.cast(data_type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        # Casts Arrow does not have, e.g. decimal to text
+        if pa.types.is_string(data_type):
+            return pa.array([None if value is None else str(value) for value in array.to_pylist()], pa.string())
+        raise
+
+
+class TableWriter:
+    # Writes DataFrame batches (or pyarrow Tables, from the Arrow normalise engine) as one CSV or
+    # Parquet file. The batches are spooled as they come and written out by getfile(), once every
+    # column is known: columns a later batch brings are added, and a column whose type changed
+    # between batches gets one type for the whole table.
+    def __init__(self, output_format, spool_size=SPOOL_SIZE, layout=None):
+        self.output_format = output_format
+        self.spool_size = spool_size
+        self.layout = layout or TableLayout()
+        self.rows = 0
+        self.file = None
+        self._parts = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        self._part_count = 0
+        self._from_pandas = False
+        self._empty = None
+
+    def write(self, df):
+        if len(df) == 0:
+            if self._empty is None:
+                self._empty = df
+            return
+
+        if not isinstance(df, pa.Table):
+            self._from_pandas = True
+            if self.output_format == 'parquet':
+                df = dataframe_to_arrow(df)
+        self.layout.add(df, isinstance(df, pa.Table))
+        pickle.dump(df, self._parts, protocol=pickle.HIGHEST_PROTOCOL)
+        self._part_count += 1
+        self.rows += len(df)
+
+    def _iter_parts(self):
+        self._parts.seek(0)
+        for _ in range(self._part_count):
+            yield pickle.load(self._parts)
+
+    def _table_part(self, table, schema):
+        arrays = [
+            cast_array(table.column(field.name), field.type) if field.name in table.column_names
+            else pa.nulls(len(table), field.type)
+            for field in schema
+        ]
+
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+    def _frame_part(self, df, dtypes):
+        df = df.reindex(columns=self.layout.columns)
+        for column, dtype in dtypes.items():
+            if df[column].dtype != dtype and df[column].notna().any():
+                df[column] = df[column].astype(dtype)
+
+        return df
+
+    def _schema(self):
+        return pa.schema([
+            (str(column), common_type(
+                self.layout.column_types(column), column in self.layout.nullable, self._from_pandas
+            ))
+            for column in self.layout.columns
+        ])
+
+    def _write_parts(self):
+        if self.output_format == 'parquet':
+            schema = self._schema()
+            with pq.ParquetWriter(self.file, schema, compression=PARQUET_COMPRESSION) as writer:
+                for part in self._iter_parts():
+                    writer.write_table(self._table_part(part, schema))
+        elif self._from_pandas:
+            dtypes = {
+                column: dtype for column in self.layout.columns
+                if (dtype := common_dtype(self.layout.types[column], column in self.layout.nullable)) is not None
+            }
+            for number, part in enumerate(self._iter_parts()):
+                self.file.write(dataframe_to_csv(self._frame_part(part, dtypes), header=number == 0).encode('utf-8'))
+        else:
+            schema = self._schema()
+            for number, part in enumerate(self._iter_parts()):
+                pa_csv.write_csv(
+                    self._table_part(part, schema), self.file, pa_csv.WriteOptions(include_header=number == 0)
+                )
+
+    def _write_empty(self, df):
+        if self.output_format == 'parquet':
+            table = df if isinstance(df, pa.Table) else dataframe_to_arrow(df)
+            pq.write_table(table, self.file, compression=PARQUET_COMPRESSION)
+        elif isinstance(df, pa.Table):
+            pa_csv.write_csv(df, self.file)
+        else:
+            self.file.write(dataframe_to_csv(df).encode('utf-8'))
+
+    def getfile(self):
+        if self.file is None:
+            self.file = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+            if self.rows:
+                self._write_parts()
+            elif self._empty is not None:
+                self._write_empty(self._empty)
+            self._parts.close()
+        self.file.seek(0)
+
+        return self.file
+
+    def close(self):
+        self._parts.close()
+        if self.file is not None:
+            self.file.close()
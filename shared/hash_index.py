@@ -0,0 +1,67 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+from azure.core.exceptions import ResourceNotFoundError
+
+INDEX_DIRECTORY = '_hashes'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(data):
+    # SHA-256 of an upload payload: str, bytes or a seekable file, which is left where it was
+    digest = hashlib.sha256()
+    if isinstance(data, str):
+        digest.update(data.encode('utf-8'))
+    elif isinstance(data, (bytes, bytearray, memoryview)):
+        digest.update(data)
+    else:
+        position = data.tell()
+        while chunk := data.read(HASH_CHUNK_SIZE):
+            digest.update(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        data.seek(position)
+
+    return digest.hexdigest()
+
+
+class HashIndex:
+    # Content hashes of the files last written for a key (an endpoint or an entity), so a run whose
+    # data has not changed can leave the lake as it is. One small JSON file per key:
+    # {name: {'sha256': ..., 'filename': ..., 'updated': ...}}
+    def __init__(self, datalake, root_directory_name, key):
+        self.datalake = datalake
+        self.root_directory_name = root_directory_name
+        self.key = key
+        self.entries = None
+
+    def _path(self):
+        return f"{INDEX_DIRECTORY}/{self.key}.json"
+
+    def load(self):
+        if self.entries is None:
+            try:
+                self.entries = json.loads(self.datalake.download_file_from_directory(self._path()))
+            except ResourceNotFoundError:
+                logging.info(f"No hash index for {self.key}.")
+                self.entries = {}
+
+        return self.entries
+
+    def unchanged(self, name, sha256):
+        # Returns the entry of the file holding exactly this content, or None
+        entry = self.load().get(name)
+        if entry is not None and entry['sha256'] == sha256:
+            return entry
+
+        return None
+
+    def record(self, name, sha256, filename):
+        self.load()[name] = {'sha256': sha256, 'filename': filename, 'updated': datetime.now().isoformat()}
+
+    def forget(self, name):
+        self.load().pop(name, None)
+
+    def save(self):
+        directory_name, _, filename = f"{self.root_directory_name}/{self._path()}".rpartition('/')
+        self.datalake.upload_file_to_directory(directory_name, filename, json.dumps(self.entries, indent=4))
@@ -1,16 +1,104 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.identity import DefaultAzureCredential
 from azure.keyvault.secrets import SecretClient
 from azure.core.exceptions import ResourceNotFoundError
 
+SECRET_CACHE_TTL = 3600  # seconds
+
+_credential = None
+_credential_lock = threading.Lock()
+
+# Secrets and clients live for the whole worker process, keyed by (vault name, secret name)
+_secret_clients = {}
+_secret_cache = {}
+_secret_cache_stats = {'hits': 0, 'misses': 0}
+_secret_cache_lock = threading.Lock()
+
+
+def get_azure_credential():
+    # A single credential per process keeps its access tokens cached across invocations
+    global _credential
+    if _credential is None:
+        with _credential_lock:
+            if _credential is None:
+                _credential = DefaultAzureCredential()
+
+    return _credential
+
+
+def secret_cache_info():
+    with _secret_cache_lock:
+        return {**_secret_cache_stats, 'size': len(_secret_cache)}
+
 
 class KeyVault:
-    def __init__(self, azure_credential, kv_name):
+    def __init__(self, azure_credential, kv_name, ttl=SECRET_CACHE_TTL):
         self.key_vault_name = kv_name
         self.key_vault_uri = f"https://{self.key_vault_name}.vault.azure.net"
-        self.client = SecretClient(vault_url=self.key_vault_uri, credential=azure_credential)
+        self.ttl = ttl
+        with _secret_cache_lock:
+            if self.key_vault_uri not in _secret_clients:
+                _secret_clients[self.key_vault_uri] = SecretClient(
+                    vault_url=self.key_vault_uri, credential=azure_credential
+                )
+            self.client = _secret_clients[self.key_vault_uri]
 
-    def get_key_vault_secret(self, secret_name):
+    def _cached_secret(self, secret_name):
+        # (True, value) for a secret in the cache that has not expired, (False, None) otherwise
+        with _secret_cache_lock:
+            cached = _secret_cache.get((self.key_vault_name, secret_name))
+            if cached is not None and cached[1] > time.monotonic():
+                _secret_cache_stats['hits'] += 1
+                return True, cached[0]
+            _secret_cache_stats['misses'] += 1
+
+        return False, None
+
+    def _fetch_secret(self, secret_name):
         try:
             kv_secret = self.client.get_secret(secret_name)
-            return kv_secret.value
         except ResourceNotFoundError as e:
             print(e.message)
+            return None
+
+        with _secret_cache_lock:
+            _secret_cache[(self.key_vault_name, secret_name)] = (kv_secret.value, time.monotonic() + self.ttl)
+
+        return kv_secret.value
+
+    def get_key_vault_secret(self, secret_name):
+        cached, value = self._cached_secret(secret_name)
+
+        return value if cached else self._fetch_secret(secret_name)
+
+    def get_key_vault_secrets(self, secret_names):
+        # Key Vault has no batch read, so the secrets missing from the cache are fetched
+        # concurrently; a call the cache answers in full starts no threads
+        secret_names = list(secret_names)
+        secrets = {}
+        missing = []
+        for secret_name in dict.fromkeys(secret_names):
+            cached, value = self._cached_secret(secret_name)
+            if cached:
+                secrets[secret_name] = value
+            else:
+                missing.append(secret_name)
+
+        if len(missing) > 1:
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                secrets.update(zip(missing, executor.map(self._fetch_secret, missing)))
+        elif missing:
+            secrets[missing[0]] = self._fetch_secret(missing[0])
+
+        return {secret_name: secrets[secret_name] for secret_name in secret_names}
+
+    def invalidate(self, secret_name=None):
+        with _secret_cache_lock:
+            if secret_name is None:
+                for key in [key for key in _secret_cache if key[0] == self.key_vault_name]:
+                    del _secret_cache[key]
+            else:
+                _secret_cache.pop((self.key_vault_name, secret_name), None)
@@ -0,0 +1,198 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+METRICS_MESSAGE = 'PipelineMetrics'  # prefix of the log line, e.g. traces | where message startswith "PipelineMetrics"
+
+# The collector of the run in progress, so the Datalake can time its calls without being handed one
+_current = contextvars.ContextVar('metrics', default=None)
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    # Records the stage's own time: time spent in stages nested inside it is counted there instead
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        stack = self.metrics._stack()
+        self.nested = 0.0
+        self.start = time.perf_counter()
+        stack.append(self)
+
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        stack = self.metrics._stack()
+        stack.pop()
+        if stack:
+            stack[-1].nested += elapsed
+        self.metrics._add_duration(self.name, elapsed - self.nested)
+
+        return False
+
+
+class Metrics:
+    # Per-run stage durations and counters, emitted as one structured log line when the run ends.
+    # When disabled every call returns straight away, so the instrumentation can stay in place.
+    def __init__(self, component, enabled=False, **dimensions):
+        self.component = component
+        self.enabled = str(enabled).lower() in ('true', '1')
+        self.dimensions = dimensions
+        self.durations = defaultdict(float)
+        self.stage_calls = Counter()
+        self.counters = Counter()
+        self.rows = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started = time.perf_counter()
+
+    def _stack(self):
+        # Stages nest per thread: concurrent requests are each timed on their own
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        return stack
+
+    def _add_duration(self, name, seconds):
+        with self._lock:
+            self.durations[name] += seconds
+            self.stage_calls[name] += 1
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+
+        return _Stage(self, name)
+
+    def add(self, name, value=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += value
+
+    def add_rows(self, table, rows):
+        if self.enabled:
+            with self._lock:
+                self.rows[table] += rows
+
+    def record_response(self, response):
+        # urllib3 keeps the retries a request went through on the final response. Time the request
+        # spent waiting for the rate limiter or a retry backoff is moved out of the http stage, so
+        # http is time in flight.
+        if not self.enabled:
+            return
+        retries = getattr(getattr(response, 'raw', None), 'retries', None)
+        waited = getattr(response, 'rate_limit_wait', 0.0)
+        with self._lock:
+            if waited:
+                self.durations['http'] -= waited
+                self.durations['rate_limit_wait'] += waited
+                self.stage_calls['rate_limit_wait'] += 1
+            self.counters['http_calls'] += 1
+            self.counters['http_retries'] += len(retries.history) if retries else 0
+            self.counters['bytes_in'] += len(response.content or b'')
+            if response.status_code >= 400:
+                self.counters['http_errors'] += 1
+
+    def timed(self, iterable, name, counter=None):
+        # Times each pull of a lazy iterable (a streamed download, batches being parsed) as the
+        # stage name, and adds the length of every item to counter
+        if not self.enabled:
+            return iterable
+
+        def pull():
+            iterator = iter(iterable)
+            while True:
+                with self.stage(name):
+                    item = next(iterator, None)
+                if item is None:
+                    return
+                if counter:
+                    self.add(counter, len(item))
+                yield item
+
+        return pull()
+
+    @contextmanager
+    def activate(self, **dimensions):
+        # Makes this the collector for the Datalake calls made in this thread until the block ends
+        if not self.enabled:
+            yield self
+            return
+
+        self.dimensions.update(dimensions)
+        token = _current.set(self)
+        self._started = time.perf_counter()
+        status = 'failed'
+        try:
+            yield self
+            status = 'succeeded'
+        finally:
+            _current.reset(token)
+            self.emit(status)
+
+    def summary(self, status='succeeded'):
+        with self._lock:
+            return {
+                'component': self.component,
+                **self.dimensions,
+                'status': status,
+                'seconds': round(time.perf_counter() - self._started, 6),
+                'stages': {
+                    name: {'seconds': round(seconds, 6), 'calls': self.stage_calls[name]}
+                    for name, seconds in self.durations.items()
+                },
+                'rows': dict(self.rows),
+                **{name: value for name, value in self.counters.items()}
+            }
+
+    def emit(self, status='succeeded'):
+        record = self.summary(status)
+        # The JSON message is what the Functions host forwards to Application Insights; handlers that
+        # read custom_dimensions (e.g. the OpenCensus Azure exporter) get the fields as they are
+        logging.info(
+            f"{METRICS_MESSAGE} {json.dumps(record, default=str)}", extra={'custom_dimensions': record}
+        )
+
+
+def active():
+    return _current.get() is not None
+
+
+def stage(name):
+    metrics = _current.get()
+    if metrics is None:
+        return _NULL_STAGE
+
+    return metrics.stage(name)
+
+
+def add(name, value=1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add(name, value)
+
+
+def timed(iterable, name, counter=None):
+    metrics = _current.get()
+    if metrics is None:
+        return iterable
+
+    return metrics.timed(iterable, name, counter)
@@ -0,0 +1,21 @@
+MAX_PARALLELISM = 8  # activities or sub-orchestrations started together per orchestration
+EVENT_CHUNK_SIZE = 250  # arrangements per event activity
+
+
+def task_all_bounded(context, calls, max_parallelism=MAX_PARALLELISM):
+    # Fans out calls ((method, function_name, input) tuples) in batches of max_parallelism and fans
+    # the results back in, in call order. Use with "yield from" in an orchestrator. The batches are
+    # synchronous: each is awaited in full before the next starts, so a slow call holds up the start
+    # of the next batch and fewer than max_parallelism calls run while it finishes. Refilling as calls
+    # finish would mean a task_any over the pending tasks at every step, and each of those re-adds the
+    # pending tasks' actions to the orchestration's output with azure-functions-durable 1.2.
+    max_parallelism = max(1, int(max_parallelism))
+    results = []
+    for start in range(0, len(calls), max_parallelism):
+        tasks = [
+            getattr(context, method)(function_name, function_input)
+            for method, function_name, function_input in calls[start:start + max_parallelism]
+        ]
+        results.extend((yield context.task_all(tasks)))
+
+    return results
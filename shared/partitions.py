@@ -0,0 +1,92 @@
+import re
+
+import pandas as pd
+import pyarrow as pa
+
+from shared.formats import TableLayout, TableWriter
+
+PARTITIONS_DIRECTORY = 'partitioned'
+UNKNOWN_PARTITION = 'unknown'  # rows whose date is missing or not a date
+_MONTH = re.compile(r'\d{4}-\d{2}$')
+
+
+class PartitionSpec:
+    # A table written as one file per month of a business date column. A rolling window extraction
+    # (the last n days) only partly covers the month its window starts in, so that month is written
+    # when it is new rather than replaced with part of itself; the months the window fully covers are
+    # rewritten when they change, and partitions that drop out of the window are kept. A full
+    # extraction holds every row, so partitions it no longer has are deleted.
+    def __init__(self, column, rolling_window=False):
+        self.column = column
+        self.rolling_window = rolling_window
+
+
+def parse_partition_columns(spec, defaults):
+    # {table: column} from "table=column,...": the items add to or override defaults, and an item
+    # without a column ("event=") leaves that table unpartitioned
+    columns = dict(defaults)
+    for item in (item.strip() for item in (spec or '').split(',')):
+        if not item:
+            continue
+        table, separator, column = item.partition('=')
+        if not separator or not table.strip():
+            raise ValueError(f"Unsupported partition column: {item}")
+        columns[table.strip()] = column.strip()
+
+    return {table: column for table, column in columns.items() if column}
+
+
+def partition_name(month):
+    return f"month={month}"
+
+
+def _months(values):
+    # YYYY-MM of each value: datetimes, or text that starts with an ISO date
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        months = values.dt.strftime('%Y-%m')
+    else:
+        months = values.astype('string').str[:7]
+
+    return [month if isinstance(month, str) and _MONTH.match(month) else UNKNOWN_PARTITION for month in months]
+
+
+def split_by_month(df, column):
+    # {month: the rows of df in that month}, in month order and with the rows in their own order;
+    # df is a DataFrame or a pyarrow Table. Without the column every row is in the unknown partition.
+    is_table = isinstance(df, pa.Table)
+    columns = df.column_names if is_table else df.columns
+    if column in columns:
+        values = df.column(column).to_pandas() if is_table else df[column]
+        months = pd.Series(_months(values))
+    else:
+        months = pd.Series([UNKNOWN_PARTITION] * len(df))
+
+    parts = {}
+    for month, positions in sorted(months.groupby(months).indices.items()):
+        parts[month] = df.take(positions) if is_table else df.iloc[positions]
+
+    return parts
+
+
+class PartitionedWriter:
+    # A TableWriter per month, for the batches of a streamed run. The writers share one TableLayout,
+    # so every partition gets the columns and types one TableWriter would have given the whole table.
+    def __init__(self, output_format, column):
+        self.output_format = output_format
+        self.column = column
+        self.writers = {}
+        self.layout = TableLayout()
+
+    @property
+    def rows(self):
+        return sum(writer.rows for writer in self.writers.values())
+
+    def write(self, df):
+        for month, part in split_by_month(df, self.column).items():
+            if month not in self.writers:
+                self.writers[month] = TableWriter(self.output_format, layout=self.layout)
+            self.writers[month].write(part)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
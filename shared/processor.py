@@ -1,20 +1,97 @@
-import logging
-from datetime import datetime
+import hashlib
 import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import time
 from json.decoder import JSONDecodeError
+from urllib.parse import urlsplit
 
-from requests import Request, Session, HTTPError
+from requests import Request, HTTPError
 import pandas as pd
 import pyarrow
 
+from shared import arrow_normalize, metrics
+from shared.arrow_normalize import NormaliseEngines
 from shared.key_vault import KeyVault
-from shared.datalake import Datalake
+from shared.datalake import Datalake, decompress
+from shared.excel import EXCEL_BATCH_SIZE, iter_excel_batches
+from shared.flatten import FlatteningPlan, TableSchema
+from shared.hash_index import HashIndex, content_hash
+from shared.formats import (
+    OutputFormats, RawEncoder, TableWriter, as_loaded, is_ndjson, load_raw, serialise_dataframe, serialise_raw
+)
+from shared.metrics import Metrics
+from shared.partitions import (
+    PARTITIONS_DIRECTORY, UNKNOWN_PARTITION, PartitionSpec, PartitionedWriter, parse_partition_columns,
+    partition_name, split_by_month
+)
+from shared.rate_limit import get_rate_limiter
+from shared.response_cache import ResponseCache
+from shared.streaming import batched, iter_records, ordered_map
+from shared.transport import get_session, RETRY_STATUS_CODES, REQUEST_TIMEOUT
+from shared.watermark import WatermarkStore
+
+ARTIFAX_BASE_URL = "https://{client_name}.artifaxevent.com/api/"
+ACCESS_BASE_URL = "https://{client_name}.dataengine.accessacloud.com/ds/"
+INVOICE_SCHEDULE_DAYS = 200
+PARTS_DIRECTORY = '_parts'  # event chunks fetched by parallel activities, until they are merged
+PART_FORMAT = 'ndjson.gz'
+INCREMENTAL_OVERLAP_DAYS = 1  # re-requested before the watermark, for changes made while the last run was in flight
+WATERMARK_MAX_AGE_DAYS = 7  # a watermark this old (runs were missed) is not caught up on incrementally
+FULL_REFRESH_DAYS = 7  # days between full refreshes, which pick up the changes the incremental checks miss
+CACHED_ENDPOINTS = (  # reference data that rarely changes, served from the response cache when it is enabled
+    'arrangements/venue', 'arrangements/room', 'arrangements/locale', 'arrangements/event_status',
+    'arrangements/event_activity'
+)
+INVOICE_SCHEDULE_KEY = (  # identifies the charge an invoice schedule record is for, across runs
+    'object_type', 'arrangement_id', 'event_id', 'resource_booking_id', 'ad_hoc_charge_id', 'price_code_title_id'
+)
+EVENT_COMMIT_SIZE = 8 * 1024 * 1024  # bytes of a streamed event file written between commits
+
+
+def normalise_in_batches(records, normalise, batch_size, output_format, partitions=None):
+    # Normalises records batch by batch into one TableWriter per output table, so memory
+    # scales with the batch size rather than the size of the raw file; the tables in partitions
+    # ({filename: PartitionSpec}) get a PartitionedWriter
+    partitions = partitions or {}
+    writers = {}
+    try:
+        for number, batch in enumerate(metrics.timed(batched(records, batch_size), 'parse'), start=1):
+            logging.info(f"Normalising batch {number} ({len(batch)} records)")
+            with metrics.stage('normalise'):
+                normalised_data = normalise(batch)
+            for file in normalised_data:
+                filename = file['filename']
+                if filename in partitions:
+                    writers.setdefault(
+                        filename, PartitionedWriter(output_format(filename), partitions[filename].column)
+                    )
+                elif filename not in writers:
+                    writers[filename] = TableWriter(output_format(filename))
+                with metrics.stage('serialise'):
+                    writers[filename].write(file['data'])
+    except Exception:
+        for writer in writers.values():
+            writer.close()
+        raise
+
+    return writers
+
+
+def _invoice_schedule_key(record):
+    # None for a record with none of the key fields, which is matched by its date alone
+    key = tuple(record.get(field) for field in INVOICE_SCHEDULE_KEY)
+
+    return key if any(value is not None for value in key) else None
 
 
 class ArtifaxRequest:
     def __init__(
         self, keyvault_name, datalake_name, filesystem_raw_name, directory_name,
-        endpoint, api_secret, client_secret, azure_credential
+        endpoint, api_secret, client_secret, azure_credential, max_workers=1, raw_format='json',
+        incremental=False, full_refresh=False, metrics=False, skip_unchanged=False, rate_limit=None,
+        cache_ttl=None, stream_events=False, keep_records=False
     ):
         self.artifax_endpoint = endpoint
         self.artifax_api_secret = api_secret
@@ -27,108 +104,724 @@ class ArtifaxRequest:
         self.filename = endpoint.split("/")[1]
         self.import_date = datetime.now().strftime("%Y/%m/%d")
         self.azure_credential = azure_credential
+        self.max_workers = max(1, int(max_workers))
+        self.raw_format = raw_format
+        self.incremental = str(incremental).lower() in ('true', '1')
+        self.full_refresh = str(full_refresh).lower() in ('true', '1')
+        self.run_started = datetime.now()
+        self.snapshot = None
+        self.last_full_refresh = None  # kept in the watermark state, to schedule the next full refresh
+        self.metrics = Metrics('ArtifaxRequest', metrics, endpoint=endpoint)
+        self.skip_unchanged = str(skip_unchanged).lower() in ('true', '1')
+        # Set when the payload matched the last upload; process() still returns (endpoint, filename),
+        # the activity output the orchestrations unpack
+        self.unchanged = False
+        self.rate_limit = float(rate_limit) if rate_limit else None
+        self.cache_ttl = float(cache_ttl) if cache_ttl not in (None, '') else None
+        self.stream_events = str(stream_events).lower() in ('true', '1')
+        self.uploaded = False
+        self.hash_index = None
+        # In pipeline mode the records are handed to the processor as well as written to the lake
+        # (for the json raw format, parsed again from the serialised text; see as_loaded)
+        self.keep_records = str(keep_records).lower() in ('true', '1')
+        self.records = None
 
     def process(self):
-        self._get_api_secrets()
-        if self.artifax_endpoint == 'arrangements/event':
-            self._get_event_data()
-        elif self.artifax_endpoint == 'finances/invoice_schedule':
-            self._get_invoice_schedule_data()
-        else:
-            self._get_data()
-        self._upload_to_lake()
+        with self.metrics.activate(action='ingest'):
+            self._get_api_secrets()
+            if self.artifax_endpoint == 'arrangements/event':
+                self._get_event_data()
+            elif self.artifax_endpoint == 'finances/invoice_schedule':
+                self._get_invoice_schedule_data()
+            else:
+                self._get_data()
+            if not self.uploaded:
+                self._upload_to_lake()
+            self._save_watermark()
+
+        return self.artifax_endpoint, self.artifax_filename
+
+    def plan_events(self, run_id, chunk_size):
+        # First step of a fanned-out event extraction: lists the arrangements, keeps the plan in the
+        # lake for merge_events and returns the arrangement ids to fetch, in chunks
+        with self.metrics.activate(action='plan_events'):
+            self._get_api_secrets()
+            arrangements, changed, _ = self._plan_events()
+            arrangement_ids = [
+                arrangement_id for (arrangement_id, _), fetch in zip(arrangements, changed) if fetch
+            ]
+
+            plan = {
+                'arrangements': arrangements, 'changed': changed,
+                'last_full_refresh': self.last_full_refresh.isoformat() if self.last_full_refresh else None
+            }
+            self._get_datalake().upload_file_to_directory(
+                self._parts_directory(run_id), 'plan.json', json.dumps(plan)
+            )
+
+        chunks = [arrangement_ids[i:i + chunk_size] for i in range(0, len(arrangement_ids), chunk_size)]
+        logging.info(f"{len(arrangement_ids)} arrangements to retrieve events for, in {len(chunks)} chunks.")
+
+        return chunks
+
+    def get_event_chunk(self, run_id, number, arrangement_ids):
+        with self.metrics.activate(action='event_chunk', chunk_number=number):
+            self._get_api_secrets()
+            self.url = self.artifax_base_url + self.artifax_endpoint
+            self.method = "GET"
+
+            start = time.perf_counter()
+            if self.max_workers > 1:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    results = list(executor.map(self._get_arrangement_events, arrangement_ids))
+            else:
+                results = list(map(self._get_arrangement_events, arrangement_ids))
+            logging.info(
+                f"Retrieved events for chunk {number} ({len(arrangement_ids)} arrangements) "
+                f"in {time.perf_counter() - start:.2f}s."
+            )
+
+            part = [
+                {'arrangement_id': arrangement_id, 'events': events}
+                for arrangement_id, events in zip(arrangement_ids, results)
+            ]
+            filename = f"part-{number:05d}.{PART_FORMAT}"
+            with self.metrics.stage('serialise'):
+                data = serialise_raw(part, PART_FORMAT)
+            self._get_datalake().upload_file_to_directory(self._parts_directory(run_id), filename, data)
+
+        return filename
+
+    def merge_events(self, run_id, parts):
+        # Fan-in: the parts are in chunk order, which is arrangement order, so they merge with the
+        # snapshot exactly as a single-activity extraction would
+        with self.metrics.activate(action='merge_events'):
+            datalake = self._get_datalake()
+            parts_directory = f"{PARTS_DIRECTORY}/{run_id}"
+            plan = json.loads(datalake.download_file_from_directory(f"{parts_directory}/plan.json"))
+            arrangements = [tuple(arrangement) for arrangement in plan['arrangements']]
+            changed = plan['changed']
+
+            # The plan decided whether this is a full refresh; the snapshot is the one it was made against
+            last_full_refresh = plan.get('last_full_refresh')
+            self.last_full_refresh = datetime.fromisoformat(last_full_refresh) if last_full_refresh else None
+            known = {}
+            if not all(changed):
+                snapshot = self._get_watermark_store().load_snapshot(self.artifax_endpoint)
+                if snapshot is None:
+                    raise ValueError(f"The {self.artifax_endpoint} snapshot the plan was made against is gone")
+                known = {item['arrangement_id']: item for item in snapshot}
+
+            fetched = (
+                record['events']
+                for part in parts
+                for record in self._load_part(datalake, f"{parts_directory}/{part}")
+            )
+            results = self._merge_events(arrangements, changed, fetched, known)
+            events = self._write_events(arrangements, results)
+            logging.info(f"Merged {events} events from {len(parts)} parts.")
+
+            if not self.uploaded:
+                self._upload_to_lake()
+            self._save_watermark()
+            datalake.delete_directory(self._parts_directory(run_id))
 
         return self.artifax_endpoint, self.artifax_filename
 
+    def _load_part(self, datalake, filename):
+        part = datalake.download_file_from_directory(filename).decode('utf-8')
+        with self.metrics.stage('parse'):
+            return load_raw(part, filename)
+
     def _get_api_secrets(self):
-        self.artifax_api_key = self.keyvault.get_key_vault_secret(self.artifax_api_secret)
-        self.artifax_client_name = self.keyvault.get_key_vault_secret(self.artifax_client_secret)
-        self.artifax_base_url = f"https://{self.artifax_client_name}.artifaxevent.com/api/"
+        with self.metrics.stage('secret_fetch'):
+            secrets = self.keyvault.get_key_vault_secrets([self.artifax_api_secret, self.artifax_client_secret])
+        self.artifax_api_key = secrets[self.artifax_api_secret]
+        self.artifax_client_name = secrets[self.artifax_client_secret]
+        self.artifax_base_url = ARTIFAX_BASE_URL.format(client_name=self.artifax_client_name)
+        # Every request to the API host, from any thread or run in this worker, shares its rate
+        get_rate_limiter(urlsplit(self.artifax_base_url).hostname, self.rate_limit)
+
+    def _get_datalake(self):
+        return Datalake(
+            self.azure_credential, self.datalake_name,
+            self.filesystem_raw_name, self.directory_name
+        )
 
-    def _get_event_data(self):
+    def _parts_directory(self, run_id):
+        return f"{self.directory_name}/{PARTS_DIRECTORY}/{run_id}"
+
+    def _get_watermark_store(self):
+        return WatermarkStore(self._get_datalake(), self.directory_name)
+
+    def _save_watermark(self):
+        # Only advanced once the day's file is in the lake
+        if self.snapshot is not None:
+            self._get_watermark_store().save(
+                self.artifax_endpoint, self.run_started, self.snapshot,
+                last_full_refresh=self.last_full_refresh.isoformat() if self.last_full_refresh else None
+            )
+
+    def _load_watermark(self):
+        # Returns the state and snapshot to merge into, or None when this run is a full extraction
+        self.last_full_refresh = self.run_started
+        if not self.incremental:
+            return None
+        if self.full_refresh:
+            logging.info(f"Full refresh requested for {self.artifax_endpoint}.")
+            return None
+
+        watermarks = self._get_watermark_store()
+        state = watermarks.load(self.artifax_endpoint)
+        if state is None:
+            return None
+        if self.run_started - state['watermark'] > timedelta(days=WATERMARK_MAX_AGE_DAYS):
+            logging.info(f"Watermark {state['watermark']} is too old, running a full refresh.")
+            return None
+        last_full_refresh = state.get('last_full_refresh')
+        if last_full_refresh is None or self.run_started - last_full_refresh > timedelta(days=FULL_REFRESH_DAYS):
+            logging.info(f"Last full refresh of {self.artifax_endpoint} was {last_full_refresh}, running one now.")
+            return None
+
+        snapshot = watermarks.load_snapshot(self.artifax_endpoint)
+        if snapshot is None:
+            logging.info(f"No snapshot for {self.artifax_endpoint}, running a full refresh.")
+            return None
+
+        logging.info(f"Extracting {self.artifax_endpoint} changes since {state['watermark']}.")
+        self.last_full_refresh = last_full_refresh
+
+        return state, snapshot
+
+    def _plan_events(self):
         endpoint = self.artifax_endpoint
         self.artifax_endpoint = 'arrangements/arrangement'
-        self._get_data()
-        data = json.loads(self.data)
-        arrangement_ids = []
+        data = self._request_data()
+        arrangements = []
         for arrangement in data:
-            arrangement_ids.append(
-                arrangement['arrangement_id']
+            arrangements.append(
+                (arrangement['arrangement_id'], arrangement.get('date_last_event'))
             )
 
-        logging.info(f"{len(arrangement_ids)} arrangements to retrieve events for.")
-
         self.artifax_endpoint = endpoint
 
+        previous = self._load_watermark()
+        if previous:
+            state, snapshot = previous
+            known = {item['arrangement_id']: item for item in snapshot}
+            cutoff = (state['watermark'] - timedelta(days=INCREMENTAL_OVERLAP_DAYS)).strftime("%Y-%m-%d")
+            changed = [
+                self._arrangement_changed(known.get(arrangement_id), date_last_event, cutoff)
+                for arrangement_id, date_last_event in arrangements
+            ]
+        else:
+            known = {}
+            changed = [True] * len(arrangements)
+
+        return arrangements, changed, known
+
+    def _get_event_data(self):
+        arrangements, changed, known = self._plan_events()
+        arrangement_ids = [arrangement_id for (arrangement_id, _), fetch in zip(arrangements, changed) if fetch]
+
+        logging.info(
+            f"{len(arrangement_ids)} arrangements to retrieve events for, "
+            f"{len(arrangements) - len(arrangement_ids)} unchanged."
+        )
+
+        self.url = self.artifax_base_url + self.artifax_endpoint
+        self.method = "GET"
+
+        start = time.perf_counter()
+        if self.max_workers > 1:
+            logging.info(f"Retrieving events with {self.max_workers} concurrent requests.")
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # Results come in arrangement order, whatever order they complete in
+                fetched = ordered_map(
+                    executor, self._get_arrangement_events, arrangement_ids, 2 * self.max_workers
+                )
+                results = self._merge_events(arrangements, changed, fetched, known)
+                events = self._write_events(arrangements, results)
+        else:
+            fetched = map(self._get_arrangement_events, arrangement_ids)
+            results = self._merge_events(arrangements, changed, fetched, known)
+            events = self._write_events(arrangements, results)
+        elapsed = time.perf_counter() - start
+
+        requests_per_second = len(arrangement_ids) / elapsed if elapsed else 0
+        logging.info(
+            f"Retrieved {events} events from {len(arrangements)} arrangements "
+            f"in {elapsed:.2f}s ({requests_per_second:.1f} requests/s)."
+        )
+
+    def _arrangement_changed(self, previous, date_last_event, cutoff):
+        # An arrangement is only skipped when its events were extracted before and all of them ended
+        # before the watermark; a new event moves date_last_event, so that is re-requested too
+        if previous is None or previous['events'] is None or not date_last_event:
+            return True
+        if previous['date_last_event'] != date_last_event:
+            return True
+
+        return str(date_last_event)[:10] >= cutoff
+
+    def _merge_events(self, arrangements, changed, fetched, known):
+        for (arrangement_id, _), fetch in zip(arrangements, changed):
+            yield next(fetched) if fetch else known[arrangement_id]['events']
+
+    def _get_arrangement_events(self, arrangement_id):
+        params = {'arrangement_id': arrangement_id}
+        return self._make_request(parameters=params)
+
+    def _write_events(self, arrangements, results):
+        # Returns the number of events, which are either in self.data or already in the lake
+        if self.stream_events:
+            return self._stream_events_to_lake(arrangements, results)
+
+        event_data = self._collect_events(arrangements, results)
+        self.data = self._serialise(event_data)
+
+        return len(event_data)
+
+    def _collect_events(self, arrangements, results):
         event_data = []
-        for arrangement_id in arrangement_ids:
-            params = {'arrangement_id': arrangement_id}
-            self._get_data(params)
+        for events in self._arrangement_events(arrangements, results):
+            event_data.extend(events)
+
+        return event_data
 
-            data = json.loads(self.data)
+    def _arrangement_events(self, arrangements, results):
+        # Yields the events of each arrangement in turn; the snapshot is complete once all are read
+        snapshot = []
+        for (arrangement_id, date_last_event), data in zip(arrangements, results):
             try:
                 logging.info(f"Arrangement id: {arrangement_id} contains {len(data)} events.")
-                event_data.extend(data)
+                events = data
             except TypeError:
                 logging.info(f"Arrangement id: {arrangement_id} contains 0 events.")
-                continue
+                # Failed requests are recorded as None, so the next run asks again
+                data = None if data is None else []
+                events = []
+            if self.incremental:
+                snapshot.append(
+                    {'arrangement_id': arrangement_id, 'date_last_event': date_last_event, 'events': data}
+                )
+            yield events
+
+        if self.incremental:
+            self.snapshot = snapshot
+
+    def _stream_events_to_lake(self, arrangements, results):
+        # Each arrangement's events are appended to the raw file as they arrive, so memory holds a
+        # few arrangements and one upload chunk rather than every event of the run. Commits fall
+        # between arrangements, so a failed ndjson run leaves a .partial file of whole records to
+        # inspect or resume from. A json array cut off before its closing bracket is not valid
+        # JSON, so a failed json run deletes its .partial file.
+        datalake = self._get_datalake()
+        directory_name, filename = self._new_raw_file()
+        encoder = RawEncoder(self.raw_format)
+        digest = hashlib.sha256()
+        file = datalake.open_append_file(directory_name, filename)
+
+        def write(data):
+            digest.update(data)
+            file.write(data)
+
+        try:
+            write(encoder.start())
+            for events in self._arrangement_events(arrangements, results):
+                with self.metrics.stage('serialise'):
+                    data = encoder.encode(events)
+                write(data)
+                if file.uncommitted >= EVENT_COMMIT_SIZE:
+                    write(encoder.sync())
+                    file.commit()
+            write(encoder.finish())
+            file.close()
+        except Exception:
+            if not is_ndjson(filename):
+                logging.warning(f"Event extraction failed, deleting {file.partial_path}")
+                try:
+                    file.discard()
+                except Exception as e:
+                    logging.warning(f"Could not delete {file.partial_path}: {e}")
+                raise
+            logging.warning(f"Event extraction failed, the events written so far are in {file.partial_path}")
+            try:
+                write(encoder.sync())
+                file.commit()
+            except Exception as e:
+                logging.warning(f"Could not commit {file.partial_path}: {e}")
+            raise
+
+        self.uploaded = True
+        self.metrics.add_rows(self.filename, encoder.records)
+        sha256 = digest.hexdigest() if self.skip_unchanged else None
+        written = self.artifax_filename
+        if sha256 and self._unchanged(datalake, sha256):
+            # Same data as the file of the last change, which stays the current one
+            if self.artifax_filename != written:
+                datalake.delete_file_from_directory(directory_name, filename)
+        else:
+            self._record_hash(sha256)
+
+        return encoder.records
 
-        self.data = json.dumps(event_data, sort_keys=True, indent=4)
+    def _get_invoice_schedule_data(self, previous_days=INVOICE_SCHEDULE_DAYS):
+        previous = self._load_watermark()
+        if previous:
+            state, snapshot = previous
+            days_since = (self.run_started.date() - state['watermark'].date()).days
+            request_days = min(previous_days, days_since + INCREMENTAL_OVERLAP_DAYS)
+        else:
+            request_days = previous_days
 
-    def _get_invoice_schedule_data(self, previous_days=200):
-        logging.info(f"Retrieving invoice schedules for previous {previous_days} days.")
+        logging.info(f"Retrieving invoice schedules for previous {request_days} days.")
 
         params = {
             'object_type': '1,2,3',
             'date': 'range',
             'range': 'last_days',
-            'date_range': previous_days
+            'date_range': request_days
         }
 
-        self._get_data(params)
+        data = self._request_data(params)
+        if previous and data is None:
+            # Keep the watermark where it is, so the next run asks for these days again
+            logging.warning("Invoice schedule request failed, keeping the previous snapshot.")
+            data = snapshot
+        elif previous:
+            data = self._merge_invoice_schedules(snapshot, data, request_days, previous_days)
+            self.snapshot = data
+        elif self.incremental:
+            self.snapshot = data
+
+        self.data = self._serialise(data)
+
+    def _merge_invoice_schedules(self, snapshot, data, request_days, previous_days):
+        # A returned record replaces the snapshot's records with its key. Snapshot records that were
+        # not returned are dropped when they fall on a day the request certainly covered (so they are
+        # gone upstream) or out of the previous_days window, as a full extraction would drop them.
+        # Whether the API counts today in the range is not documented, so the covered days run from
+        # the first day of the range if today is counted to yesterday: one day less at either end.
+        # Records without an invoice date are kept until a full refresh.
+        window_start = (self.run_started - timedelta(days=request_days - 1)).strftime("%Y-%m-%d")
+        today = self.run_started.strftime("%Y-%m-%d")
+        retention_start = (self.run_started - timedelta(days=previous_days)).strftime("%Y-%m-%d")
+        returned = {_invoice_schedule_key(record) for record in data} - {None}
+        kept = []
+        for record in snapshot:
+            if _invoice_schedule_key(record) in returned:
+                continue
+            invoice_date = str(record.get('invoice_date') or '')[:10]
+            if invoice_date and (invoice_date < retention_start or window_start <= invoice_date < today):
+                continue
+            kept.append(record)
+        logging.info(f"Merging {len(data)} invoice schedules into {len(kept)} unchanged.")
+
+        return kept + data
 
     def _get_data(self, parameters=None):
+        if self.cache_ttl is not None and self.artifax_endpoint in CACHED_ENDPOINTS:
+            self.data = self._get_cached_data(parameters)
+            if self.keep_records and self.records is None:
+                # A cache hit, which is only held serialised
+                self.records = self._load_data()
+            return
+
+        data = self._request_data(parameters)
+        self.data = self._serialise(data)
+
+    def _get_cached_data(self, parameters=None):
+        # A fresh or revalidated cache entry is already serialised, so a hit neither transfers nor
+        # re-serialises the response
         self.url = self.artifax_base_url + self.artifax_endpoint
         self.method = "GET"
-        data = self._make_request(parameters=parameters)
-        self.data = json.dumps(data, sort_keys=True, indent=4)
+        cache = ResponseCache(self._get_datalake(), self.directory_name)
+        entry = cache.load(self.artifax_endpoint, self.url, parameters, self.raw_format)
+
+        if entry is not None and not entry.conditional_headers() and entry.age() < self.cache_ttl:
+            logging.info(f"Using the {self.artifax_endpoint} response cached at {entry.meta['fetched']}.")
+            self.metrics.add('cache_hits')
+            return entry.body
+
+        headers = entry.conditional_headers() if entry is not None else {}
+        r = self._send_request(parameters, headers)
+        if r is not None and r.status_code == 304 and entry is not None:
+            logging.info(f"{self.artifax_endpoint} is not modified, using the cached response.")
+            self.metrics.add('cache_hits')
+            cache.revalidated(self.artifax_endpoint, self.url, parameters, entry)
+            return entry.body
+
+        self.metrics.add('cache_misses')
+        body = self._serialise(self._response_data(r))
+        if r is not None:
+            cache.store(self.artifax_endpoint, self.url, parameters, self.raw_format, body, r.headers)
+
+        return body
+
+    def _serialise(self, data):
+        if isinstance(data, list):
+            self.metrics.add_rows(self.filename, len(data))
+        with self.metrics.stage('serialise'):
+            payload = serialise_raw(data, self.raw_format)
+        if self.keep_records:
+            with self.metrics.stage('parse'):
+                self.records = as_loaded(data, payload, self.raw_format)
+
+        return payload
+
+    def _load_data(self):
+        filename = f"{self.filename}.{self.raw_format}"
+        data = self.data
+        if isinstance(data, bytes):
+            data = decompress(data, filename).decode('utf-8')
+        with self.metrics.stage('parse'):
+            return load_raw(data, filename)
+
+    def _request_data(self, parameters=None):
+        self.url = self.artifax_base_url + self.artifax_endpoint
+        self.method = "GET"
+
+        return self._make_request(parameters=parameters)
 
     def _make_request(self, parameters=None):
-        headers = {'X-API-KEY': self.artifax_api_key}
-        session = Session()
+        return self._response_data(self._send_request(parameters))
+
+    def _send_request(self, parameters=None, headers=None):
+        headers = {'X-API-KEY': self.artifax_api_key, **(headers or {})}
+        session = get_session()
         req = Request(method=self.method, url=self.url, headers=headers, params=parameters)
 
         try:
-            r = session.send(req.prepare())
+            with self.metrics.stage('http'):
+                r = session.send(req.prepare(), timeout=REQUEST_TIMEOUT)
+            self.metrics.record_response(r)
             r.raise_for_status()
-            try:
-                return r.json()
-            except JSONDecodeError:
-                # There is one endpoint which returns non-JSON content (instances/{}/status/detail)
-                return r.content
+            return r
         except HTTPError as exc:
             logging.info(exc.response.text)
-            pass
+            # Retries are exhausted by now, so a throttled or failing API must not pass as empty data
+            if exc.response.status_code in RETRY_STATUS_CODES:
+                raise
+
+    def _response_data(self, r):
+        if r is None:
+            return None
+        try:
+            with self.metrics.stage('parse'):
+                return r.json()
+        except JSONDecodeError:
+            # There is one endpoint which returns non-JSON content (instances/{}/status/detail)
+            return r.content
 
     def _upload_to_lake(self):
-        directory_name = f"{self.directory_name}/{self.artifax_endpoint}/{self.import_date}"
+        datalake = self._get_datalake()
 
-        datalake = Datalake(
-            self.azure_credential, self.datalake_name,
-            self.filesystem_raw_name, self.directory_name
-        )
+        sha256 = content_hash(self.data) if self.skip_unchanged else None
+        if sha256 and self._unchanged(datalake, sha256):
+            return
+
+        directory_name, filename = self._new_raw_file()
+        datalake.upload_file_to_directory(directory_name, filename, self.data)
+        self._record_hash(sha256)
 
+    def _new_raw_file(self):
         now = datetime.now().strftime("%Y%m%dT%H%M%S")
-        filename = f"{self.filename}_{now}.json"
+        filename = f"{self.filename}_{now}.{self.raw_format}"
         self.artifax_filename = f"{self.artifax_endpoint}/{self.import_date}/{filename}"
 
-        datalake.upload_file_to_directory(directory_name, filename, self.data)
+        return f"{self.directory_name}/{self.artifax_endpoint}/{self.import_date}", filename
+
+    def _unchanged(self, datalake, sha256):
+        self.hash_index = HashIndex(datalake, self.directory_name, self.artifax_endpoint)
+        if entry := self.hash_index.unchanged(self.filename, sha256):
+            # The raw file of the last change still holds exactly this data
+            logging.info(f"{self.artifax_endpoint} is unchanged since {entry['updated']}.")
+            self.metrics.add('unchanged_files')
+            self.artifax_filename = entry['filename']
+            self.unchanged = True
+
+        return self.unchanged
+
+    def _record_hash(self, sha256):
+        if sha256:
+            self.hash_index.record(self.filename, sha256, self.artifax_filename)
+            self.hash_index.save()
+
+
+# Declarative table schemas per nested entity, compiled into single-pass flatteners
+ARRANGEMENT_PLAN = FlatteningPlan([
+    TableSchema('arrangement', columns=[
+        'arrangement_created',
+        'arrangement_id',
+        'arrangement_reference',
+        'arrangement_temporary',
+        'arrangement_type_background_colour',
+        'arrangement_type_id',
+        'arrangement_type_name',
+        'arrangement_type_text_colour',
+        'close_date_time',
+        'contact_entity_full_name',
+        'contact_entity_id',
+        'customer_entity_full_name',
+        'customer_entity_id',
+        'customer_entity_type',
+        'date_first_confirmed_event',
+        'date_first_confirmed_public_event',
+        'date_first_event',
+        'date_first_public_event',
+        'date_last_confirmed_event',
+        'date_last_confirmed_public_event',
+        'date_last_event',
+        'date_last_public_event',
+        'description',
+        'estimated_revenue',
+        'sales_manager_full_name',
+        'sales_manager_user_id',
+        'sales_process_stage_id',
+        'sales_process_stage_title',
+        'sales_team_id',
+        'sales_team_name'
+    ], dtypes={
+        **dict.fromkeys([
+            'arrangement_id', 'arrangement_type_id', 'contact_entity_id', 'customer_entity_id',
+            'sales_manager_user_id', 'sales_process_stage_id', 'sales_team_id'
+        ], 'Int64'),
+        **dict.fromkeys([
+            'arrangement_type_background_colour', 'arrangement_type_name', 'arrangement_type_text_colour',
+            'customer_entity_type', 'sales_manager_full_name', 'sales_process_stage_title', 'sales_team_name'
+        ], 'category'),
+        **dict.fromkeys([
+            'arrangement_created', 'close_date_time', 'date_first_confirmed_event',
+            'date_first_confirmed_public_event', 'date_first_event', 'date_first_public_event',
+            'date_last_confirmed_event', 'date_last_confirmed_public_event', 'date_last_event',
+            'date_last_public_event'
+        ], 'datetime'),
+        'estimated_revenue': 'decimal(18,2)'
+    }),
+    TableSchema(
+        'arrangement_custom_forms',
+        record_path=['custom_forms', 'custom_form_sections', 'custom_form_elements'],
+        meta=[
+            'arrangement_id',
+            ['custom_forms', 'custom_form_assignment_id'],
+            ['custom_forms', 'custom_form_definition_id'],
+            ['custom_forms', 'custom_form_name'],
+            ['custom_forms', 'custom_form_sections', 'custom_form_section_id'],
+            ['custom_forms', 'custom_form_sections', 'custom_form_section_name']
+        ]
+    )
+])
+
+ROOM_PLAN = FlatteningPlan([
+    TableSchema('room', columns=[
+        'room_id', 'room_type_id', 'sort_order', 'venue_id', 'code',
+        'custom_forms', 'events', 'room_name', 'room_type_name'
+    ], dtypes={
+        **dict.fromkeys(['room_id', 'room_type_id', 'sort_order', 'venue_id'], 'Int64'),
+        'room_type_name': 'category'
+    }),
+    TableSchema('room_room_layout', record_path=['room_layouts'], meta=['room_id']),
+    TableSchema('room_event_activity', record_path=['event_activities'], meta=['room_id'])
+])
+
+EVENT_ACTIVITY_PLAN = FlatteningPlan([
+    TableSchema('event_activity', columns=[
+        'activity_id', 'background_color', 'code', 'custom_forms',
+        'event_activity_name', 'text_color'
+    ]),
+    TableSchema(
+        'event_activity_arrangement_type', record_path=['arrangement_types'], meta=['activity_id'],
+        drop=['name'], rename={'id': 'arrangement_type_id'}
+    )
+])
+
+INVOICE_SCHEDULE_PLAN = FlatteningPlan([
+    TableSchema('invoice_schedule', columns=[
+        'object_type',
+        'arrangement_id',
+        'ad_hoc_charge_id',
+        'ad_hoc_charge_name',
+        'ad_hoc_charge_type_id',
+        'ad_hoc_charge_type_name',
+        'event_id',
+        'event_status_id',
+        'room_id',
+        'venue_id',
+        'locale_id',
+        'price_code_title_id',
+        'price_code_name',
+        'resource_booking_id',
+        'resource_id',
+        'resource_name',
+        'resource_type_id',
+        'resource_type_name',
+        'unit_price',
+        'unit_cost',
+        'quantity',
+        'source_amount',
+        'amount_type_id',
+        'amount_type_name',
+        'entity_id',
+        'entity_fullname',
+        'purchase_order_number',
+        'supplier_entity_id',
+        'supplier_entity_full_name',
+        'invoice_date',
+        'tax_rate_1_id',
+        'tax_rate_1_name',
+        'tax_rate_1_code',
+        'tax_rate_2_id',
+        'tax_rate_2_name',
+        'tax_rate_2_code',
+        'net_amount',
+        'tax_rate_1_amount',
+        'tax_rate_2_amount',
+        'tax_amount',
+        'gross_amount',
+        'invoice_number',
+        'nominal_ledger_code_id',
+        'nominal_ledger_code',
+        'cost_centre_code_id',
+        'cost_centre_code',
+        'department_code_id',
+        'department_code',
+        'currency'
+    ], dtypes={
+        **dict.fromkeys([
+            'object_type', 'arrangement_id', 'ad_hoc_charge_id', 'ad_hoc_charge_type_id', 'event_id',
+            'event_status_id', 'room_id', 'venue_id', 'locale_id', 'price_code_title_id', 'resource_booking_id',
+            'resource_id', 'resource_type_id', 'amount_type_id', 'entity_id', 'supplier_entity_id',
+            'tax_rate_1_id', 'tax_rate_2_id', 'nominal_ledger_code_id', 'cost_centre_code_id', 'department_code_id'
+        ], 'Int64'),
+        **dict.fromkeys([
+            'ad_hoc_charge_name', 'ad_hoc_charge_type_name', 'price_code_name', 'resource_name',
+            'resource_type_name', 'amount_type_name', 'entity_fullname', 'supplier_entity_full_name',
+            'tax_rate_1_name', 'tax_rate_1_code', 'tax_rate_2_name', 'tax_rate_2_code', 'nominal_ledger_code',
+            'cost_centre_code', 'department_code', 'currency'
+        ], 'category'),
+        **dict.fromkeys([
+            'source_amount', 'net_amount', 'tax_rate_1_amount', 'tax_rate_2_amount', 'tax_amount', 'gross_amount'
+        ], 'decimal(18,2)'),
+        **dict.fromkeys(['unit_price', 'unit_cost', 'quantity'], 'decimal(18,4)'),
+        'invoice_date': 'datetime'
+    })
+])
+
+# Tables written partitioned by the month of a business date when partitioned output is enabled,
+# and their date columns; partition_columns ("event=<column>,...") adds to or overrides these. The
+# event API's date fields are not documented here, so events are only partitioned when configured.
+PARTITION_COLUMNS = {'invoice_schedule': 'invoice_date'}
+ROLLING_WINDOW_TABLES = ('invoice_schedule',)  # extracted for the last INVOICE_SCHEDULE_DAYS days, the rest in full
+UNKNOWN_PARTITION_WARNING = 0.5  # share of a table's rows without a month that suggests the wrong partition column
 
 
 class ArtifaxProcessor:
     def __init__(
         self, endpoint, raw_filename, datalake_name, filesystem_raw_name,
-        filesystem_structured_name, root_directory_name, azure_credential
+        filesystem_structured_name, root_directory_name, azure_credential, output_format='csv',
+        stream_batch_size=None, metrics=False, skip_unchanged=False, normalise_engine='pandas',
+        typed_schemas=False, partitioned=False, partition_columns=None
     ):
         self.directory_name = endpoint.split("/")[0]
         self.endpoint = endpoint
@@ -140,16 +833,78 @@ class ArtifaxProcessor:
         self.root_directory_name = root_directory_name
         self.import_date = datetime.now().strftime("%Y/%m/%d")
         self.azure_credential = azure_credential
+        self.output_formats = OutputFormats(output_format)
+        self.stream_batch_size = int(stream_batch_size) if stream_batch_size else None
+        self.metrics = Metrics('ArtifaxProcessor', metrics, endpoint=endpoint)
+        self.skip_unchanged = str(skip_unchanged).lower() in ('true', '1')
+        self.hash_index = None
+        self.unchanged = False
+        self.normalise_engines = NormaliseEngines(normalise_engine)
+        self.typed_schemas = str(typed_schemas).lower() in ('true', '1')
+        self.partitions = {
+            table: PartitionSpec(column, rolling_window=table in ROLLING_WINDOW_TABLES)
+            for table, column in parse_partition_columns(partition_columns, PARTITION_COLUMNS).items()
+        } if str(partitioned).lower() in ('true', '1') else {}
+        self.partition_index = None
+        self.run_started = datetime.now()
+
+    def process(self, json_data=None):
+        # json_data is the raw file already parsed, as the ingest hands it over in pipeline mode
+        with self.metrics.activate(stream=bool(self.stream_batch_size), pipeline=json_data is not None):
+            self._load_hash_index()
+            if self.stream_batch_size:
+                return self._process_stream(json_data)
+
+            if json_data is None:
+                json_file = self._download_from_lake()
+                with self.metrics.stage('parse'):
+                    json_data = load_raw(json_file, self.raw_filename)
+            with self.metrics.stage('normalise'):
+                normalised_data = self._entity(json_data)
+
+            for file in normalised_data:
+                filename = file['filename']
+                output_format = self.output_formats.get(filename, self.entity)
+                self.metrics.add_rows(filename, len(file['data']))
+                if filename in self.partitions:
+                    parts = split_by_month(file['data'], self.partitions[filename].column)
+                    with self.metrics.stage('serialise'):
+                        files = {month: serialise_dataframe(df, output_format) for month, df in parts.items()}
+                    rows = {month: len(df) for month, df in parts.items()}
+                    self._upload_partitions(filename, files, rows, output_format)
+                    continue
+                with self.metrics.stage('serialise'):
+                    data = serialise_dataframe(file['data'], output_format)
+                self._upload_to_lake(filename, data, output_format)
+            self._save_hash_index()
 
-    def process(self):
-        json_file = self._download_from_lake()
-        json_data = json.loads(json_file)
-        normalised_data = self._entity(json_data)
+        return self.entity
+
+    def _process_stream(self, json_data=None):
+        if json_data is None:
+            records = iter_records(self._stream_from_lake(), self.raw_filename)
+        else:
+            records = json_data if isinstance(json_data, list) else [json_data]
+        writers = normalise_in_batches(
+            records, self._entity, self.stream_batch_size,
+            lambda filename: self.output_formats.get(filename, self.entity), self.partitions
+        )
 
-        for file in normalised_data:
-            filename = file['filename']
-            data = file['data']
-            self._upload_to_lake(filename, data)
+        for filename, writer in writers.items():
+            try:
+                self.metrics.add_rows(filename, writer.rows)
+                if isinstance(writer, PartitionedWriter):
+                    with self.metrics.stage('serialise'):
+                        files = {month: part.getfile() for month, part in writer.writers.items()}
+                    rows = {month: part.rows for month, part in writer.writers.items()}
+                    self._upload_partitions(filename, files, rows, writer.output_format)
+                    continue
+                with self.metrics.stage('serialise'):
+                    file = writer.getfile()
+                self._upload_to_lake(filename, file, writer.output_format)
+            finally:
+                writer.close()
+        self._save_hash_index()
 
         return self.entity
 
@@ -172,90 +927,135 @@ class ArtifaxProcessor:
         except JSONDecodeError as e:
             print(e)
 
-    def _upload_to_lake(self, filename, data, delete_files=True):
+    def _stream_from_lake(self):
+        datalake = Datalake(
+            self.azure_credential, self.datalake_name,
+            self.filesystem_raw_name, self.root_directory_name
+        )
+
+        return datalake.stream_file_from_directory(self.raw_filename)
+
+    def _load_hash_index(self):
+        # Output tables whose content hash matches the last one written are not rewritten
+        if self.skip_unchanged:
+            datalake = Datalake(
+                self.azure_credential, self.datalake_name,
+                self.filesystem_structured_name, self.root_directory_name
+            )
+            self.hash_index = HashIndex(datalake, self.root_directory_name, self.endpoint)
+            self.unchanged = True
+
+    def _save_hash_index(self):
+        if self.hash_index is not None and not self.unchanged:
+            self.hash_index.save()
+
+    def _upload_to_lake(self, filename, data, output_format='csv', delete_files=True):
         directory_name = f"{self.root_directory_name}/{self.directory_name}/{filename}/{self.import_date}"
 
+        if self.hash_index is not None:
+            sha256 = content_hash(data)
+            if entry := self.hash_index.unchanged(filename, sha256):
+                logging.info(f"{filename} is unchanged since {entry['updated']}.")
+                self.metrics.add('unchanged_files')
+                return entry['filename'].split('/')[-1]
+
         datalake = Datalake(
             self.azure_credential, self.datalake_name,
             self.filesystem_structured_name, self.root_directory_name
         )
 
+        table_name = filename
+        now = datetime.now().strftime("%Y%m%dT%H%M%S")
+        filename = f"{filename}_{now}.{output_format}"
+
         if delete_files:
-            self._delete_existing_files(datalake, directory_name)
+            datalake.replace_directory(directory_name, {filename: data})
+        else:
+            datalake.upload_file_to_directory(directory_name, filename, data)
 
-        now = datetime.now().strftime("%Y%m%dT%H%M%S")
-        filename = f"{filename}_{now}.csv"
-        datalake.upload_file_to_directory(directory_name, filename, data)
+        if self.hash_index is not None:
+            self.hash_index.record(
+                table_name, sha256, f"{self.directory_name}/{table_name}/{self.import_date}/{filename}"
+            )
+            self.unchanged = False
 
         return filename
 
-    def _delete_existing_files(self, datalake, directory_name):
-        if datalake.directory_exists(directory_name):
-            files = datalake.list_directory_contents(directory_name)
-            for file in files:
-                filename = file.name.split('/')[-1]
-                datalake.delete_file_from_directory(directory_name, filename)
+    def _upload_partitions(self, table_name, files, rows, output_format):
+        # files is {month: data} and rows {month: row count}. Each month is a directory of its own that
+        # downstream loads can prune on, and only the months whose content changed are rewritten.
+        spec = self.partitions[table_name]
+        unknown = rows.get(UNKNOWN_PARTITION, 0)
+        if unknown and unknown >= UNKNOWN_PARTITION_WARNING * sum(rows.values()):
+            logging.warning(
+                f"{unknown} of {sum(rows.values())} {table_name} rows have no month in {spec.column}, "
+                f"check the partition column."
+            )
+            self.metrics.add('unknown_partition_rows', unknown)
+        datalake = Datalake(
+            self.azure_credential, self.datalake_name,
+            self.filesystem_structured_name, self.root_directory_name
+        )
+        if self.partition_index is None:
+            self.partition_index = HashIndex(
+                datalake, self.root_directory_name, f"{self.endpoint}/{PARTITIONS_DIRECTORY}"
+            )
+        index = self.partition_index
+        months = sorted(files)
+        written = deleted = 0
+        # The first day the rolling window certainly covers, as _merge_invoice_schedules counts it
+        window_start = (self.run_started - timedelta(days=INVOICE_SCHEDULE_DAYS - 1)).strftime("%Y-%m-%d")
+
+        for month in months:
+            name = f"{table_name}/{partition_name(month)}"
+            partial = spec.rolling_window and month != UNKNOWN_PARTITION and f"{month}-01" < window_start
+            if partial and index.load().get(name):
+                logging.info(f"{name} is only partly in the extraction window, keeping the partition there is.")
+                continue
 
-    def _arrangement(self, json_data):
-        logging.info("Normalise arrangement entity")
+            sha256 = content_hash(files[month])
+            if index.unchanged(name, sha256):
+                self.metrics.add('unchanged_partitions')
+                continue
 
-        normalised_data = []
+            path = self._partition_path(name)
+            filename = f"{table_name}_{month}.{output_format}"
+            datalake.replace_directory(f"{self.root_directory_name}/{path}", {filename: files[month]})
+            index.record(name, sha256, f"{path}/{filename}")
+            written += 1
 
-        # arrangement
-        cols = [
-            'arrangement_created',
-            'arrangement_id',
-            'arrangement_reference',
-            'arrangement_temporary',
-            'arrangement_type_background_colour',
-            'arrangement_type_id',
-            'arrangement_type_name',
-            'arrangement_type_text_colour',
-            'close_date_time',
-            'contact_entity_full_name',
-            'contact_entity_id',
-            'customer_entity_full_name',
-            'customer_entity_id',
-            'customer_entity_type',
-            'date_first_confirmed_event',
-            'date_first_confirmed_public_event',
-            'date_first_event',
-            'date_first_public_event',
-            'date_last_confirmed_event',
-            'date_last_confirmed_public_event',
-            'date_last_event',
-            'date_last_public_event',
-            'description',
-            'estimated_revenue',
-            'sales_manager_full_name',
-            'sales_manager_user_id',
-            'sales_process_stage_id',
-            'sales_process_stage_title',
-            'sales_team_id',
-            'sales_team_name'
-        ]
-        df = pd.json_normalize(json_data)
-        df = df[cols]
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'arrangement', 'data': data})
-
-        # arrangement custom forms
-        df = pd.json_normalize(
-            json_data,
-            record_path=['custom_forms', 'custom_form_sections', 'custom_form_elements'],
-            meta=[
-                'arrangement_id',
-                ['custom_forms', 'custom_form_assignment_id'],
-                ['custom_forms', 'custom_form_definition_id'],
-                ['custom_forms', 'custom_form_name'],
-                ['custom_forms', 'custom_form_sections', 'custom_form_section_id'],
-                ['custom_forms', 'custom_form_sections', 'custom_form_section_name']
-            ]
-        )
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'arrangement_custom_forms', 'data': data})
+        if not spec.rolling_window and months:
+            # A full extraction no longer holding a month means its rows are gone
+            current = {f"{table_name}/{partition_name(month)}" for month in months}
+            for name in [name for name in index.load() if name.startswith(f"{table_name}/") and name not in current]:
+                datalake.delete_directory(f"{self.root_directory_name}/{self._partition_path(name)}")
+                index.forget(name)
+                deleted += 1
 
-        return normalised_data
+        logging.info(f"{table_name}: {written} of {len(months)} partitions rewritten, {deleted} deleted.")
+        self.metrics.add('partitions_written', written)
+        if written or deleted:
+            index.save()
+            self.unchanged = False
+
+    def _partition_path(self, name):
+        # name is "<table>/month=YYYY-MM", as in the partition index
+        table_name, partition = name.split('/')
+
+        return f"{self.directory_name}/{table_name}/{PARTITIONS_DIRECTORY}/{partition}"
+
+    def _json_normalize(self, json_data, filename):
+        if self.normalise_engines.get(filename, self.entity) == 'arrow':
+            output_format = self.output_formats.get(filename, self.entity)
+            return arrow_normalize.json_normalize(json_data, arrow_normalize.list_to_text(output_format))
+
+        return pd.json_normalize(json_data)
+
+    def _arrangement(self, json_data):
+        logging.info("Normalise arrangement entity")
+
+        # arrangement and arrangement custom forms
+        return ARRANGEMENT_PLAN.flatten(json_data, self.typed_schemas)
 
     def _event(self, json_data):
         logging.info("Normalise event entity")
@@ -263,9 +1063,8 @@ class ArtifaxProcessor:
         normalised_data = []
 
         # event
-        df = pd.json_normalize(json_data)
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'event', 'data': data})
+        df = self._json_normalize(json_data, 'event')
+        normalised_data.append({'filename': 'event', 'data': df})
 
         return normalised_data
 
@@ -275,38 +1074,16 @@ class ArtifaxProcessor:
         normalised_data = []
 
         # venue
-        df = pd.json_normalize(json_data)
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'venue', 'data': data})
+        df = self._json_normalize(json_data, 'venue')
+        normalised_data.append({'filename': 'venue', 'data': df})
 
         return normalised_data
 
     def _room(self, json_data):
         logging.info("Normalise room entity")
 
-        normalised_data = []
-
-        # room
-        cols = [
-            'room_id', 'room_type_id', 'sort_order', 'venue_id', 'code',
-            'custom_forms', 'events', 'room_name', 'room_type_name'
-        ]
-        df = pd.json_normalize(json_data)
-        df = df[cols]
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'room', 'data': data})
-
-        # room layouts
-        df = pd.json_normalize(json_data, record_path=['room_layouts'], meta=['room_id'])
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'room_room_layout', 'data': data})
-
-        # room event activities
-        df = pd.json_normalize(json_data, record_path=['event_activities'], meta=['room_id'])
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'room_event_activity', 'data': data})
-
-        return normalised_data
+        # room, room layouts and room event activities
+        return ROOM_PLAN.flatten(json_data, self.typed_schemas)
 
     def _locale(self, json_data):
         logging.info("Normalise locale entity")
@@ -314,35 +1091,16 @@ class ArtifaxProcessor:
         normalised_data = []
 
         # locale
-        df = pd.json_normalize(json_data)
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'locale', 'data': data})
+        df = self._json_normalize(json_data, 'locale')
+        normalised_data.append({'filename': 'locale', 'data': df})
 
         return normalised_data
 
     def _event_activity(self, json_data):
         logging.info("Normalise event activity entity")
 
-        normalised_data = []
-
-        # event activity
-        cols = [
-            'activity_id', 'background_color', 'code', 'custom_forms',
-            'event_activity_name', 'text_color'
-        ]
-        df = pd.json_normalize(json_data)
-        df = df[cols]
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'event_activity', 'data': data})
-
-        # event activity arrangement types
-        df = pd.json_normalize(json_data, record_path=['arrangement_types'], meta=['activity_id'])
-        df = df.drop(columns=['name'])
-        df.rename(columns={'id': 'arrangement_type_id'}, inplace=True)
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'event_activity_arrangement_type', 'data': data})
-
-        return normalised_data
+        # event activity and event activity arrangement types
+        return EVENT_ACTIVITY_PLAN.flatten(json_data, self.typed_schemas)
 
     def _event_status(self, json_data):
         logging.info("Normalise event status entity")
@@ -350,81 +1108,22 @@ class ArtifaxProcessor:
         normalised_data = []
 
         # event status
-        df = pd.json_normalize(json_data)
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'event_status', 'data': data})
+        df = self._json_normalize(json_data, 'event_status')
+        normalised_data.append({'filename': 'event_status', 'data': df})
 
         return normalised_data
 
     def _invoice_schedule(self, json_data):
         logging.info("Normalise invoice schedule entity")
 
-        normalised_data = []
-
         # invoice schedule
-        cols = [
-            'object_type',
-            'arrangement_id',
-            'ad_hoc_charge_id',
-            'ad_hoc_charge_name',
-            'ad_hoc_charge_type_id',
-            'ad_hoc_charge_type_name',
-            'event_id',
-            'event_status_id',
-            'room_id',
-            'venue_id',
-            'locale_id',
-            'price_code_title_id',
-            'price_code_name',
-            'resource_booking_id',
-            'resource_id',
-            'resource_name',
-            'resource_type_id',
-            'resource_type_name',
-            'unit_price',
-            'unit_cost',
-            'quantity',
-            'source_amount',
-            'amount_type_id',
-            'amount_type_name',
-            'entity_id',
-            'entity_fullname',
-            'purchase_order_number',
-            'supplier_entity_id',
-            'supplier_entity_full_name',
-            'invoice_date',
-            'tax_rate_1_id',
-            'tax_rate_1_name',
-            'tax_rate_1_code',
-            'tax_rate_2_id',
-            'tax_rate_2_name',
-            'tax_rate_2_code',
-            'net_amount',
-            'tax_rate_1_amount',
-            'tax_rate_2_amount',
-            'tax_amount',
-            'gross_amount',
-            'invoice_number',
-            'nominal_ledger_code_id',
-            'nominal_ledger_code',
-            'cost_centre_code_id',
-            'cost_centre_code',
-            'department_code_id',
-            'department_code',
-            'currency'
-        ]
-        df = pd.json_normalize(json_data)
-        df = df[cols]
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'invoice_schedule', 'data': data})
-
-        return normalised_data
+        return INVOICE_SCHEDULE_PLAN.flatten(json_data, self.typed_schemas)
 
 
 class SpektrixRequest:
     def __init__(
         self, landing_filename, datalake_name, filesystem_landing_name,
-        filesystem_raw_name, root_directory_name, azure_credential
+        filesystem_raw_name, root_directory_name, azure_credential, metrics=False
     ):
         self.datalake_name = datalake_name
         self.filesystem_landing_name = filesystem_landing_name
@@ -434,33 +1133,29 @@ class SpektrixRequest:
         self.entity = self.landing_filename.split("-")[0][4:].lower()
         self.import_date = datetime.now().strftime("%Y/%m/%d")
         self.azure_credential = azure_credential
+        self.metrics = Metrics('SpektrixRequest', metrics, entity=self.entity)
 
     def process(self):
-        spektrix_file = self._download_from_landing_zone()
-        raw_filename = self._upload_to_raw_zone(spektrix_file)
+        with self.metrics.activate():
+            raw_filename = self._copy_to_raw_zone()
 
         return raw_filename
 
-    def _download_from_landing_zone(self):
-        datalake = Datalake(
-            self.azure_credential, self.datalake_name,
-            self.filesystem_landing_name, self.root_directory_name
-        )
-
-        landing_file = datalake.download_file_from_directory(self.landing_filename)
-
-        return landing_file
-
-    def _upload_to_raw_zone(self, file):
+    def _copy_to_raw_zone(self):
+        # The landing file is copied by the storage service, so it never passes through the function
         directory_name = f"{self.root_directory_name}/{self.entity}/{self.import_date}"
         landing_filename = self.landing_filename[4:]
 
+        landing_datalake = Datalake(
+            self.azure_credential, self.datalake_name,
+            self.filesystem_landing_name, self.root_directory_name
+        )
         datalake = Datalake(
             self.azure_credential, self.datalake_name,
             self.filesystem_raw_name, self.root_directory_name
         )
 
-        datalake.upload_file_to_directory(directory_name, landing_filename, file)
+        datalake.copy_file_to_directory(landing_datalake, self.landing_filename, directory_name, landing_filename)
 
         filename = f"{self.entity}/{self.import_date}/{landing_filename}"
 
@@ -470,7 +1165,8 @@ class SpektrixRequest:
 class SpektrixProcessor:
     def __init__(
             self, raw_filepath, datalake_name, filesystem_raw_name,
-            filesystem_structured_name, root_directory_name, azure_credential
+            filesystem_structured_name, root_directory_name, azure_credential, output_format='csv',
+            stream_batch_size=None, excel_engine='openpyxl', metrics=False
     ):
         self.raw_filepath = raw_filepath
         self.entity = self.raw_filepath.split("/")[0]
@@ -481,11 +1177,20 @@ class SpektrixProcessor:
         self.root_directory_name = root_directory_name
         self.import_date = datetime.now().strftime("%Y/%m/%d")
         self.azure_credential = azure_credential
+        self.output_format = OutputFormats(output_format).get(self.entity)
+        self.stream_batch_size = int(stream_batch_size) if stream_batch_size else None
+        self.excel_engine = excel_engine
+        self.metrics = Metrics('SpektrixProcessor', metrics, entity=self.entity, excel_engine=excel_engine)
 
     def process(self):
-        excel_file = self._download_from_raw_zone()
-        csv_file = self._entity(excel_file)
-        self._upload_to_structured_zone(csv_file)
+        with self.metrics.activate(stream=bool(self.stream_batch_size)):
+            excel_file = self._download_from_raw_zone()
+            structured_file = self._entity(excel_file)
+            try:
+                self._upload_to_structured_zone(structured_file)
+            finally:
+                if hasattr(structured_file, 'close'):
+                    structured_file.close()
 
         return self.raw_filename
 
@@ -513,86 +1218,105 @@ class SpektrixProcessor:
         )
 
         if delete_files:
-            self._delete_existing_files(datalake, directory_name)
-
-        datalake.upload_file_to_directory(directory_name, self.raw_filename, file)
-
-    def _delete_existing_files(self, datalake, directory_name):
-        if datalake.directory_exists(directory_name):
-            files = datalake.list_directory_contents(directory_name)
-            for file in files:
-                filename = file.name.split('/')[-1]
-                datalake.delete_file_from_directory(directory_name, filename)
+            datalake.replace_directory(directory_name, {self.raw_filename: file})
+        else:
+            datalake.upload_file_to_directory(directory_name, self.raw_filename, file)
 
-    def _convert_excel_to_csv(self, excel_file):
+    def _convert_excel(self, excel_file):
         try:
-            df = pd.read_excel(excel_file)
-            csv_file = df.to_csv(index=False)
-            self.raw_filename = self.raw_filename.split(".")[0] + ".csv"
+            if self.stream_batch_size or self.excel_engine != 'openpyxl':
+                structured_file = self._convert_excel_stream(excel_file)
+            else:
+                with self.metrics.stage('parse'):
+                    df = pd.read_excel(excel_file)
+                self.metrics.add_rows(self.entity, len(df))
+                with self.metrics.stage('serialise'):
+                    structured_file = serialise_dataframe(df, self.output_format)
+            self.raw_filename = self.raw_filename.split(".")[0] + f".{self.output_format}"
         except Exception as e:
             raise
 
-        return csv_file
+        return structured_file
+
+    def _convert_excel_stream(self, excel_file):
+        # Reads the sheet row by row and writes it out batch by batch, so the workbook object model
+        # and the whole table are never in memory at once
+        writer = TableWriter(self.output_format)
+        try:
+            # calamine without a batch size still converts in batches, rather than the sheet at once
+            batch_size = self.stream_batch_size or EXCEL_BATCH_SIZE
+            batches = iter_excel_batches(excel_file, batch_size, self.excel_engine)
+            for number, df in enumerate(self.metrics.timed(batches, 'parse'), start=1):
+                logging.info(f"Converting batch {number} ({len(df)} rows)")
+                with self.metrics.stage('serialise'):
+                    writer.write(df)
+            self.metrics.add_rows(self.entity, writer.rows)
+            with self.metrics.stage('serialise'):
+                return writer.getfile()
+        except Exception:
+            writer.close()
+            raise
 
     def _customer(self, excel_file):
-        logging.info(f"Converting file to csv")
-        csv_file = self._convert_excel_to_csv(excel_file)
+        logging.info(f"Converting file to {self.output_format}")
+        structured_file = self._convert_excel(excel_file)
 
-        return csv_file
+        return structured_file
 
     def _opportunity_stage_change(self, excel_file):
-        logging.info(f"Converting file to csv")
-        csv_file = self._convert_excel_to_csv(excel_file)
+        logging.info(f"Converting file to {self.output_format}")
+        structured_file = self._convert_excel(excel_file)
 
-        return csv_file
+        return structured_file
 
     def _membership(self, excel_file):
-        logging.info(f"Converting file to csv")
-        csv_file = self._convert_excel_to_csv(excel_file)
+        logging.info(f"Converting file to {self.output_format}")
+        structured_file = self._convert_excel(excel_file)
 
-        return csv_file
+        return structured_file
 
     def _event_instance(self, excel_file):
-        logging.info(f"Converting file to csv")
-        csv_file = self._convert_excel_to_csv(excel_file)
+        logging.info(f"Converting file to {self.output_format}")
+        structured_file = self._convert_excel(excel_file)
 
-        return csv_file
+        return structured_file
 
     def _event(self, excel_file):
-        logging.info(f"Converting file to csv")
-        csv_file = self._convert_excel_to_csv(excel_file)
+        logging.info(f"Converting file to {self.output_format}")
+        structured_file = self._convert_excel(excel_file)
 
-        return csv_file
+        return structured_file
 
     def _event_attributes(self, excel_file):
-        logging.info(f"Converting file to csv")
-        csv_file = self._convert_excel_to_csv(excel_file)
+        logging.info(f"Converting file to {self.output_format}")
+        structured_file = self._convert_excel(excel_file)
 
-        return csv_file
+        return structured_file
 
     def _campaign(self, excel_file):
-        logging.info(f"Converting file to csv")
-        csv_file = self._convert_excel_to_csv(excel_file)
+        logging.info(f"Converting file to {self.output_format}")
+        structured_file = self._convert_excel(excel_file)
 
-        return csv_file
+        return structured_file
 
     def _ticket_scans(self, excel_file):
-        logging.info(f"Converting file to csv")
-        csv_file = self._convert_excel_to_csv(excel_file)
+        logging.info(f"Converting file to {self.output_format}")
+        structured_file = self._convert_excel(excel_file)
 
-        return csv_file
+        return structured_file
 
     def _transaction_item(self, excel_file):
-        logging.info(f"Converting file to csv")
-        csv_file = self._convert_excel_to_csv(excel_file)
+        logging.info(f"Converting file to {self.output_format}")
+        structured_file = self._convert_excel(excel_file)
 
-        return csv_file
+        return structured_file
 
 
 class AccessRequest:
     def __init__(
         self, keyvault_name, datalake_name, filesystem_raw_name, root_directory_name,
-        endpoint, api_secret, client_secret, azure_credential
+        endpoint, api_secret, client_secret, azure_credential, raw_format='json', metrics=False,
+        skip_unchanged=False, rate_limit=None, keep_records=False
     ):
         self.directory_name = endpoint
         self.endpoint = endpoint.split("/")[1]
@@ -605,36 +1329,58 @@ class AccessRequest:
         self.root_directory_name = root_directory_name
         self.import_date = datetime.now().strftime("%Y/%m/%d")
         self.azure_credential = azure_credential
+        self.raw_format = raw_format
+        self.metrics = Metrics('AccessRequest', metrics, endpoint=endpoint)
+        self.skip_unchanged = str(skip_unchanged).lower() in ('true', '1')
+        self.unchanged = False
+        self.rate_limit = float(rate_limit) if rate_limit else None
+        # In pipeline mode the records are handed to the processor as well as written to the lake
+        # (for the json raw format, parsed again from the serialised text; see as_loaded)
+        self.keep_records = str(keep_records).lower() in ('true', '1')
+        self.records = None
 
     def process(self):
-        self._get_api_secrets()
-        self._get_data()
-        filename = self._upload_to_raw_zone()
+        with self.metrics.activate():
+            self._get_api_secrets()
+            self._get_data()
+            filename = self._upload_to_raw_zone()
 
         return filename
 
     def _get_api_secrets(self):
-        self.api_key = self.keyvault.get_key_vault_secret(self.api_secret)
-        self.client_name = self.keyvault.get_key_vault_secret(self.client_secret)
-        self.base_url = f"https://{self.client_name}.dataengine.accessacloud.com/ds/"
+        with self.metrics.stage('secret_fetch'):
+            secrets = self.keyvault.get_key_vault_secrets([self.api_secret, self.client_secret])
+        self.api_key = secrets[self.api_secret]
+        self.client_name = secrets[self.client_secret]
+        self.base_url = ACCESS_BASE_URL.format(client_name=self.client_name)
+        get_rate_limiter(urlsplit(self.base_url).hostname, self.rate_limit)
 
     def _get_data(self, parameters=None):
         self.url = self.base_url + self.endpoint
         self.method = "GET"
         data = self._make_request(parameters=parameters)
-        self.data = json.dumps(data, sort_keys=True, indent=4)
+        if isinstance(data, list):
+            self.metrics.add_rows(self.endpoint, len(data))
+        with self.metrics.stage('serialise'):
+            self.data = serialise_raw(data, self.raw_format)
+        if self.keep_records:
+            with self.metrics.stage('parse'):
+                self.records = as_loaded(data, self.data, self.raw_format)
 
     def _make_request(self, parameters=None):
         headers = {'Authorization': self.api_key}
-        session = Session()
+        session = get_session()
         req = Request(method=self.method, url=self.url, headers=headers, params=parameters)
 
         logging.info(f"Requesting: {self.url}")
         try:
-            r = session.send(req.prepare())
+            with self.metrics.stage('http'):
+                r = session.send(req.prepare(), timeout=REQUEST_TIMEOUT)
+            self.metrics.record_response(r)
             r.raise_for_status()
             try:
-                return r.json()
+                with self.metrics.stage('parse'):
+                    return r.json()
             except JSONDecodeError:
                 return r.content
         except HTTPError as exc:
@@ -649,18 +1395,33 @@ class AccessRequest:
             self.filesystem_raw_name, self.root_directory_name
         )
 
+        if self.skip_unchanged:
+            hash_index = HashIndex(datalake, self.root_directory_name, self.directory_name)
+            sha256 = content_hash(self.data)
+            if entry := hash_index.unchanged(self.endpoint, sha256):
+                logging.info(f"{self.directory_name} is unchanged since {entry['updated']}.")
+                self.metrics.add('unchanged_files')
+                self.unchanged = True
+                return entry['filename']
+
         now = datetime.now().strftime("%Y%m%dT%H%M%S")
-        filename = f"{self.endpoint}_{now}.json"
+        filename = f"{self.endpoint}_{now}.{self.raw_format}"
 
         datalake.upload_file_to_directory(directory_name, filename, self.data)
+        raw_filename = f"{self.directory_name}/{self.import_date}/{filename}"
+
+        if self.skip_unchanged:
+            hash_index.record(self.endpoint, sha256, raw_filename)
+            hash_index.save()
 
-        return f"{self.directory_name}/{self.import_date}/{filename}"
+        return raw_filename
 
 
 class AccessProcessor:
     def __init__(
             self, raw_filepath, datalake_name, filesystem_raw_name,
-            filesystem_structured_name, root_directory_name, azure_credential
+            filesystem_structured_name, root_directory_name, azure_credential, output_format='csv',
+            stream_batch_size=None, metrics=False, skip_unchanged=False, normalise_engine='pandas'
     ):
         self.raw_filepath = raw_filepath
         self.raw_filename = self.raw_filepath.split("/")[-1]
@@ -672,16 +1433,60 @@ class AccessProcessor:
         self.root_directory_name = root_directory_name
         self.import_date = datetime.now().strftime("%Y/%m/%d")
         self.azure_credential = azure_credential
+        self.output_formats = OutputFormats(output_format)
+        self.stream_batch_size = int(stream_batch_size) if stream_batch_size else None
+        self.metrics = Metrics('AccessProcessor', metrics, entity=self.entity)
+        self.skip_unchanged = str(skip_unchanged).lower() in ('true', '1')
+        self.hash_index = None
+        self.unchanged = False
+        self.normalise_engines = NormaliseEngines(normalise_engine)
+
+    def process(self, json_data=None):
+        # json_data is the raw file already parsed, as the ingest hands it over in pipeline mode
+        with self.metrics.activate(stream=bool(self.stream_batch_size), pipeline=json_data is not None):
+            self._load_hash_index()
+            if self.stream_batch_size:
+                return self._process_stream(json_data)
+
+            if json_data is None:
+                json_file = self._download_from_lake()
+                with self.metrics.stage('parse'):
+                    json_data = load_raw(json_file, self.raw_filepath)
+            with self.metrics.stage('normalise'):
+                normalised_data = self._entity(json_data)
+
+            for file in normalised_data:
+                filename = file['filename']
+                output_format = self.output_formats.get(filename, self.entity)
+                self.metrics.add_rows(filename, len(file['data']))
+                with self.metrics.stage('serialise'):
+                    data = serialise_dataframe(file['data'], output_format)
+                self.raw_filename = self.raw_filename.split(".")[0] + f".{output_format}"
+                self._upload_to_structured_zone(filename, data)
+            self._save_hash_index()
 
-    def process(self):
-        json_file = self._download_from_lake()
-        json_data = json.loads(json_file)
-        normalised_data = self._entity(json_data)
+        return self.raw_filename
 
-        for file in normalised_data:
-            filename = file['filename']
-            data = file['data']
-            self._upload_to_structured_zone(filename, data)
+    def _process_stream(self, json_data=None):
+        if json_data is None:
+            records = iter_records(self._stream_from_lake(), self.raw_filepath)
+        else:
+            records = json_data if isinstance(json_data, list) else [json_data]
+        writers = normalise_in_batches(
+            records, self._entity, self.stream_batch_size,
+            lambda filename: self.output_formats.get(filename, self.entity)
+        )
+
+        for filename, writer in writers.items():
+            try:
+                self.raw_filename = self.raw_filename.split(".")[0] + f".{writer.output_format}"
+                self.metrics.add_rows(filename, writer.rows)
+                with self.metrics.stage('serialise'):
+                    file = writer.getfile()
+                self._upload_to_structured_zone(filename, file)
+            finally:
+                writer.close()
+        self._save_hash_index()
 
         return self.raw_filename
 
@@ -704,25 +1509,60 @@ class AccessProcessor:
         except JSONDecodeError as e:
             print(e)
 
+    def _stream_from_lake(self):
+        datalake = Datalake(
+            self.azure_credential, self.datalake_name,
+            self.filesystem_raw_name, self.root_directory_name
+        )
+
+        return datalake.stream_file_from_directory(self.raw_filepath)
+
+    def _load_hash_index(self):
+        # Output tables whose content hash matches the last one written are not rewritten
+        if self.skip_unchanged:
+            datalake = Datalake(
+                self.azure_credential, self.datalake_name,
+                self.filesystem_structured_name, self.root_directory_name
+            )
+            self.hash_index = HashIndex(datalake, self.root_directory_name, self.entity)
+            self.unchanged = True
+
+    def _save_hash_index(self):
+        if self.hash_index is not None and not self.unchanged:
+            self.hash_index.save()
+
     def _upload_to_structured_zone(self, filename, data, delete_files=True):
         directory_name = f"{self.root_directory_name}/{self.directory_name}/{filename}/{self.import_date}"
 
+        if self.hash_index is not None:
+            sha256 = content_hash(data)
+            if entry := self.hash_index.unchanged(filename, sha256):
+                logging.info(f"{filename} is unchanged since {entry['updated']}.")
+                self.metrics.add('unchanged_files')
+                return
+
         datalake = Datalake(
             self.azure_credential, self.datalake_name,
             self.filesystem_structured_name, self.root_directory_name
         )
 
         if delete_files:
-            self._delete_existing_files(datalake, directory_name)
+            datalake.replace_directory(directory_name, {self.raw_filename: data})
+        else:
+            datalake.upload_file_to_directory(directory_name, self.raw_filename, data)
 
-        datalake.upload_file_to_directory(directory_name, self.raw_filename, data)
+        if self.hash_index is not None:
+            self.hash_index.record(
+                filename, sha256, f"{self.directory_name}/{filename}/{self.import_date}/{self.raw_filename}"
+            )
+            self.unchanged = False
 
-    def _delete_existing_files(self, datalake, directory_name):
-        if datalake.directory_exists(directory_name):
-            files = datalake.list_directory_contents(directory_name)
-            for file in files:
-                filename = file.name.split('/')[-1]
-                datalake.delete_file_from_directory(directory_name, filename)
+    def _json_normalize(self, json_data, filename):
+        if self.normalise_engines.get(filename, self.entity) == 'arrow':
+            output_format = self.output_formats.get(filename, self.entity)
+            return arrow_normalize.json_normalize(json_data, arrow_normalize.list_to_text(output_format))
+
+        return pd.json_normalize(json_data)
 
     def _hr_person(self, json_data):
         logging.info("Normalise person entity")
@@ -730,10 +1570,8 @@ class AccessProcessor:
         normalised_data = []
 
         # person
-        df = pd.json_normalize(json_data)
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'person', 'data': data})
-        self.raw_filename = self.raw_filename.split(".")[0] + ".csv"
+        df = self._json_normalize(json_data, 'person')
+        normalised_data.append({'filename': 'person', 'data': df})
 
         return normalised_data
 
@@ -743,10 +1581,8 @@ class AccessProcessor:
         normalised_data = []
 
         # person
-        df = pd.json_normalize(json_data)
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'person_ses', 'data': data})
-        self.raw_filename = self.raw_filename.split(".")[0] + ".csv"
+        df = self._json_normalize(json_data, 'person_ses')
+        normalised_data.append({'filename': 'person_ses', 'data': df})
 
         return normalised_data
 
@@ -756,10 +1592,8 @@ class AccessProcessor:
         normalised_data = []
 
         # person
-        df = pd.json_normalize(json_data)
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'appointment', 'data': data})
-        self.raw_filename = self.raw_filename.split(".")[0] + ".csv"
+        df = self._json_normalize(json_data, 'appointment')
+        normalised_data.append({'filename': 'appointment', 'data': df})
 
         return normalised_data
 
@@ -769,10 +1603,8 @@ class AccessProcessor:
         normalised_data = []
 
         # person
-        df = pd.json_normalize(json_data)
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'nl_account', 'data': data})
-        self.raw_filename = self.raw_filename.split(".")[0] + ".csv"
+        df = self._json_normalize(json_data, 'nl_account')
+        normalised_data.append({'filename': 'nl_account', 'data': df})
 
         return normalised_data
 
@@ -782,10 +1614,8 @@ class AccessProcessor:
         normalised_data = []
 
         # person
-        df = pd.json_normalize(json_data)
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'costcentre', 'data': data})
-        self.raw_filename = self.raw_filename.split(".")[0] + ".csv"
+        df = self._json_normalize(json_data, 'costcentre')
+        normalised_data.append({'filename': 'costcentre', 'data': df})
 
         return normalised_data
 
@@ -795,9 +1625,7 @@ class AccessProcessor:
         normalised_data = []
 
         # person
-        df = pd.json_normalize(json_data)
-        data = df.to_csv(index=False)
-        normalised_data.append({'filename': 'costheader', 'data': data})
-        self.raw_filename = self.raw_filename.split(".")[0] + ".csv"
+        df = self._json_normalize(json_data, 'costheader')
+        normalised_data.append({'filename': 'costheader', 'data': df})
 
         return normalised_data
\ No newline at end of file
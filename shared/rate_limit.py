@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+THROTTLE_DECREASE = 0.5  # the rate is multiplied by this on every 429
+ADDITIVE_INCREASE = 5.0  # requests/s the rate regains per second of successful requests
+MIN_RATE = 0.5  # requests/s
+RATE_WINDOW = 1.0  # seconds of recent requests an unconfigured limiter measures its rate over
+REMAINING_HEADERS = ('RateLimit-Remaining', 'X-RateLimit-Remaining', 'X-Rate-Limit-Remaining')
+RESET_HEADERS = ('RateLimit-Reset', 'X-RateLimit-Reset', 'X-Rate-Limit-Reset')
+
+# One limiter per API host for the whole worker process, shared by every request and thread
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def _header(headers, names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+
+    return None
+
+
+def parse_delay(value, now=None):
+    # Retry-After and rate-limit reset headers: seconds to wait, an epoch timestamp or an HTTP date
+    if value is None:
+        return None
+    now = time.time() if now is None else now
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+        except (TypeError, ValueError):
+            return None
+
+    if seconds > 10 ** 9:
+        return max(0.0, seconds - now)
+
+    return max(0.0, seconds)
+
+
+class RateLimiter:
+    # Token bucket in its scheduling form: each request reserves the next free slot, so callers
+    # sleep outside the lock and a burst of up to burst requests goes out at once. The rate starts
+    # at max_rate (or unlimited), is cut on every 429 and recovers additively while requests succeed,
+    # never past max_rate. A reported budget of the vendor (remaining requests until a reset) caps
+    # the rate until that reset.
+    def __init__(self, host, max_rate=None, burst=None):
+        self.host = host
+        self.lock = threading.Lock()
+        self.rate = None
+        self.configure(max_rate, burst)
+        self.rate = self.max_rate
+        self.theoretical_arrival = 0.0
+        self.paused_until = 0.0
+        self.budget_rate = None
+        self.budget_until = 0.0
+        self.recent = deque()
+        self.decreased_at = float('-inf')
+        self.stats = {'requests': 0, 'throttled': 0, 'wait_seconds': 0.0}
+
+    def configure(self, max_rate=None, burst=None):
+        with self.lock:
+            self.max_rate = float(max_rate) if max_rate else None
+            self.burst = max(1, int(burst or 1))
+            if self.rate is not None and self.max_rate is not None:
+                self.rate = min(self.rate, self.max_rate)
+
+    def _current_rate(self, now):
+        rate = self.rate
+        if self.budget_rate is not None and now < self.budget_until:
+            rate = self.budget_rate if rate is None else min(rate, self.budget_rate)
+
+        return rate
+
+    def acquire(self):
+        # Blocks until the request may be sent and returns the seconds it waited
+        with self.lock:
+            now = time.monotonic()
+            earliest = max(now, self.paused_until)
+            rate = self._current_rate(now)
+            if rate:
+                interval = 1 / rate
+                slot = max(earliest, self.theoretical_arrival - (self.burst - 1) * interval)
+                self.theoretical_arrival = max(self.theoretical_arrival, slot) + interval
+            else:
+                slot = earliest
+            self.recent.append(slot)
+            while self.recent and self.recent[0] < slot - RATE_WINDOW:
+                self.recent.popleft()
+            self.stats['requests'] += 1
+            wait = slot - now
+            self.stats['wait_seconds'] += wait
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
+
+    def observe(self, status, headers):
+        # Adapts to a response: 429s slow every caller down, successes speed them up again
+        now = time.monotonic()
+        with self.lock:
+            if status == 429:
+                self._throttled(now, parse_delay(headers.get('Retry-After')))
+            elif status < 400 and self.rate is not None:
+                self.rate += ADDITIVE_INCREASE / self.rate
+                if self.max_rate is not None:
+                    self.rate = min(self.rate, self.max_rate)
+
+            remaining = _header(headers, REMAINING_HEADERS)
+            reset = parse_delay(_header(headers, RESET_HEADERS))
+            if remaining is not None and reset is not None:
+                try:
+                    remaining = int(float(remaining))
+                except ValueError:
+                    return
+                if remaining <= 0:
+                    self.paused_until = max(self.paused_until, now + reset)
+                else:
+                    # Spread what is left of the budget over the time until it is reset
+                    self.budget_rate = max(MIN_RATE, remaining / max(reset, RATE_WINDOW))
+                    self.budget_until = now + reset
+
+    def _throttled(self, now, retry_after):
+        self.stats['throttled'] += 1
+        # Requests already in flight at the old rate are throttled together, so cut it once per window
+        if now - self.decreased_at >= RATE_WINDOW:
+            if self.rate is None:
+                # Unconfigured: start from the rate the requests were actually going out at
+                self.rate = max(MIN_RATE, len(self.recent) / RATE_WINDOW)
+            self.rate = max(MIN_RATE, self.rate * THROTTLE_DECREASE)
+            self.decreased_at = now
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+        # Slots handed out at the old rate are dropped, so the next requests start afresh
+        self.theoretical_arrival = max(now, self.paused_until)
+        logging.info(f"Throttled by {self.host}, rate now {self.rate:.1f} requests/s.")
+
+    def info(self):
+        with self.lock:
+            return {'host': self.host, 'rate': self.rate, 'max_rate': self.max_rate, **self.stats}
+
+
+def get_rate_limiter(host, max_rate=None, burst=None):
+    # A configured rate replaces the previous one for the host; None leaves it as it is
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(host)
+        if limiter is None:
+            limiter = _rate_limiters[host] = RateLimiter(host, max_rate, burst)
+        elif max_rate and float(max_rate) != limiter.max_rate:
+            limiter.configure(max_rate, burst)
+
+        return limiter
+
+
+def find_rate_limiter(host):
+    return _rate_limiters.get(host)
+
+
+def rate_limit_info():
+    with _rate_limiters_lock:
+        return [limiter.info() for limiter in _rate_limiters.values()]
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime
+
+from azure.core.exceptions import ResourceNotFoundError
+
+CACHE_DIRECTORY = '_cache'
+MAX_MEMORY_ENTRIES = 64
+
+# Entries read or written by this worker, so a warm invocation does not download them again
+_memory_cache = {}
+_memory_cache_lock = threading.Lock()
+
+
+def cache_key(url, parameters):
+    parameters = sorted((str(key), str(value)) for key, value in (parameters or {}).items())
+    return hashlib.sha256(json.dumps([url, parameters]).encode('utf-8')).hexdigest()[:32]
+
+
+class CachedResponse:
+    def __init__(self, meta, body):
+        self.meta = meta
+        self.body = body
+
+    def age(self):
+        return (datetime.now() - datetime.fromisoformat(self.meta['fetched'])).total_seconds()
+
+    def conditional_headers(self):
+        headers = {}
+        if self.meta.get('etag'):
+            headers['If-None-Match'] = self.meta['etag']
+        if self.meta.get('last_modified'):
+            headers['If-Modified-Since'] = self.meta['last_modified']
+
+        return headers
+
+
+class ResponseCache:
+    # Serialised API responses in the raw zone, keyed by URL and parameters, with the validators
+    # the API sent for them. Bodies are kept byte for byte (.body, so a gzipped one is not
+    # decompressed on download). An entry with an ETag or Last-Modified is revalidated with a
+    # conditional request; one without is trusted for a TTL.
+    def __init__(self, datalake, root_directory_name):
+        self.datalake = datalake
+        self.root_directory_name = root_directory_name
+
+    def _path(self, endpoint, key):
+        return f"{CACHE_DIRECTORY}/{endpoint}/{key}"
+
+    def _memory_key(self, path):
+        return self.datalake.datalake_name, self.datalake.filesystem_name, self.root_directory_name, path
+
+    def load(self, endpoint, url, parameters, raw_format):
+        path = self._path(endpoint, cache_key(url, parameters))
+        with _memory_cache_lock:
+            cached = _memory_cache.get(self._memory_key(path))
+        if cached is not None and cached.meta['raw_format'] == raw_format:
+            return cached
+
+        try:
+            meta = json.loads(self.datalake.download_file_from_directory(f"{path}.json"))
+            if meta['raw_format'] != raw_format:
+                return None
+            body = self.datalake.download_file_from_directory(f"{path}.body")
+        except ResourceNotFoundError:
+            logging.info(f"No cached response for {endpoint}.")
+            return None
+
+        entry = CachedResponse(meta, body)
+        self._remember(path, entry)
+
+        return entry
+
+    def store(self, endpoint, url, parameters, raw_format, body, headers):
+        # The body is written first, so metadata never describes a body that is not there
+        path = self._path(endpoint, cache_key(url, parameters))
+        directory_name, _, name = f"{self.root_directory_name}/{path}".rpartition('/')
+        # The URL is only hashed: its host carries the client name, which is kept in Key Vault
+        meta = {
+            'endpoint': endpoint,
+            'parameters': parameters,
+            'raw_format': raw_format,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched': datetime.now().isoformat()
+        }
+        self.datalake.upload_file_to_directory(directory_name, f"{name}.body", body)
+        self.datalake.upload_file_to_directory(directory_name, f"{name}.json", json.dumps(meta, indent=4))
+        self._remember(path, CachedResponse(meta, body))
+
+    def revalidated(self, endpoint, url, parameters, entry):
+        # A 304: the body stays, the entry is marked fresh again
+        path = self._path(endpoint, cache_key(url, parameters))
+        directory_name, _, name = f"{self.root_directory_name}/{path}".rpartition('/')
+        entry.meta['fetched'] = datetime.now().isoformat()
+        self.datalake.upload_file_to_directory(directory_name, f"{name}.json", json.dumps(entry.meta, indent=4))
+        self._remember(path, entry)
+
+    def _remember(self, path, entry):
+        with _memory_cache_lock:
+            if len(_memory_cache) >= MAX_MEMORY_ENTRIES:
+                _memory_cache.clear()
+            _memory_cache[self._memory_key(path)] = entry
+
+
+def clear_memory_cache():
+    with _memory_cache_lock:
+        _memory_cache.clear()
@@ -0,0 +1,127 @@
+import codecs
+import json
+from collections import deque
+from itertools import islice
+
+import orjson
+
+from shared.formats import is_ndjson
+
+_WHITESPACE = ' \t\n\r'
+
+
+def batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def ordered_map(executor, function, items, window):
+    # executor.map submits every call up front and keeps each result until it is read; this keeps
+    # at most window calls in flight or waiting to be read, and still yields in the order of items
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, item))
+    while pending:
+        yield pending.popleft().result()
+
+
+def iter_records(chunks, filename):
+    if is_ndjson(filename):
+        return iter_ndjson(chunks)
+
+    return iter_json_array(chunks)
+
+
+def iter_ndjson(chunks):
+    remainder = b''
+    for chunk in chunks:
+        lines = (remainder + chunk).split(b'\n')
+        remainder = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield orjson.loads(line)
+
+    if remainder.strip():
+        yield orjson.loads(remainder)
+
+
+def iter_json_array(chunks, encoding='utf-8'):
+    # Yields the elements of a top-level JSON array from an iterable of byte chunks, holding
+    # at most one chunk plus one partially received element in memory
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)()
+    chunks = iter(chunks)
+    buffer = ''
+    position = 0
+    state = 'start'
+    eof = False
+
+    while True:
+        while position < len(buffer) and buffer[position] in _WHITESPACE:
+            position += 1
+
+        if position == len(buffer) or state == 'value':
+            if position == len(buffer) and eof:
+                if state != 'done':
+                    raise ValueError("Unexpected end of JSON array")
+                return
+
+            if state == 'value':
+                try:
+                    element, end = decoder.raw_decode(buffer, position)
+                    # A number or literal is only complete once the delimiter after it has arrived
+                    complete = eof or buffer[end - 1] in ']}"' or (
+                        end < len(buffer) and buffer[end] in _WHITESPACE + ',]'
+                    )
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    complete = False
+
+                if complete:
+                    yield element
+                    position = end
+                    state = 'separator'
+                    continue
+
+            try:
+                chunk = next(chunks)
+                buffer = buffer[position:] + text_decoder.decode(chunk)
+            except StopIteration:
+                buffer = buffer[position:] + text_decoder.decode(b'', final=True)
+                eof = True
+            position = 0
+            continue
+
+        char = buffer[position]
+        if state == 'start':
+            if char == '\ufeff':
+                position += 1
+            elif char == '[':
+                position += 1
+                state = 'first'
+            else:
+                # Not an array (e.g. a single object response), so fall back to a plain parse
+                remainder = buffer[position:] + ''.join(text_decoder.decode(chunk) for chunk in chunks)
+                document = json.loads(remainder + text_decoder.decode(b'', final=True))
+                yield from document if isinstance(document, list) else [document]
+                return
+        elif state == 'first':
+            if char == ']':
+                position += 1
+                state = 'done'
+            else:
+                state = 'value'
+        elif state == 'separator':
+            position += 1
+            if char == ',':
+                state = 'value'
+            elif char == ']':
+                state = 'done'
+            else:
+                raise ValueError(f"Expected ',' or ']' in JSON array, found {char!r}")
+        else:
+            raise ValueError(f"Unexpected data after JSON array: {char!r}")
@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from shared.rate_limit import find_rate_limiter
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+REQUEST_TIMEOUT = (10, 300)  # (connect, read) seconds
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class VendorRetry(Retry):
+    # urllib3 only honours Retry-After on 413/429/503 by default
+    RETRY_AFTER_STATUS_CODES = RETRY_STATUS_CODES
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.host = None
+        self.waited = 0.0  # seconds of backoff and rate limiting before the retries of one request
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.host = self.host
+        retry.waited = self.waited
+        return retry
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        # Only a response that is retried is observed here. Once the retries are exhausted, super()
+        # raises and the response goes back to RateLimitedAdapter.send, which observes it.
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        limiter = find_rate_limiter(_pool.host) if _pool is not None else None
+        if limiter is not None and response is not None:
+            limiter.observe(response.status, response.headers)
+        retry.host = _pool.host if _pool is not None else None
+        reason = response.status if response is not None else error
+        logging.info(f"Retrying {method} {url} ({reason}), {retry.total} retries left.")
+        return retry
+
+    def sleep(self, response=None):
+        # A retry waits for its backoff and then takes its turn with the host's rate limiter
+        start = time.perf_counter()
+        super().sleep(response)
+        limiter = find_rate_limiter(self.host)
+        if limiter is not None:
+            limiter.acquire()
+        self.waited += time.perf_counter() - start
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    # Requests to a host with a rate limiter wait for their slot, and the response adapts the limiter.
+    # response.rate_limit_wait is the time the request spent waiting rather than in flight.
+    def send(self, request, **kwargs):
+        limiter = find_rate_limiter(urlsplit(request.url).hostname)
+        if limiter is None:
+            return super().send(request, **kwargs)
+
+        waited = limiter.acquire()
+        response = super().send(request, **kwargs)
+        limiter.observe(response.status_code, response.headers)
+        retries = getattr(response.raw, 'retries', None)
+        response.rate_limit_wait = max(0.0, waited) + getattr(retries, 'waited', 0.0)
+
+        return response
+
+
+def create_session(pool_maxsize=32, max_retries=5, backoff_factor=1):
+    retry = VendorRetry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset({'GET'}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = RateLimitedAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+
+    session = Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def get_session():
+    # One pooled session per worker process, so keep-alive connections survive warm invocations
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+
+    return _session
@@ -0,0 +1,56 @@
+import json
+import logging
+from datetime import datetime
+
+from azure.core.exceptions import ResourceNotFoundError
+
+from shared.formats import load_raw, serialise_raw
+
+STATE_DIRECTORY = '_watermarks'
+SNAPSHOT_FORMAT = 'ndjson.gz'
+
+
+class WatermarkStore:
+    # Per-endpoint extraction state in the raw zone: the high-water mark of the last successful
+    # run, when the last full refresh ran, and the snapshot that incremental runs merge their
+    # changes into
+    def __init__(self, datalake, root_directory_name):
+        self.datalake = datalake
+        self.root_directory_name = root_directory_name
+
+    def _path(self, endpoint):
+        return f"{STATE_DIRECTORY}/{endpoint}"
+
+    def load(self, endpoint):
+        try:
+            state = self.datalake.download_file_from_directory(f"{self._path(endpoint)}/state.json")
+        except ResourceNotFoundError:
+            logging.info(f"No watermark for {endpoint}.")
+            return None
+
+        state = json.loads(state)
+        state['watermark'] = datetime.fromisoformat(state['watermark'])
+        if state.get('last_full_refresh'):
+            state['last_full_refresh'] = datetime.fromisoformat(state['last_full_refresh'])
+
+        return state
+
+    def load_snapshot(self, endpoint):
+        try:
+            snapshot = self.datalake.download_file_from_directory(
+                f"{self._path(endpoint)}/snapshot.{SNAPSHOT_FORMAT}"
+            )
+        except ResourceNotFoundError:
+            return None
+
+        return load_raw(snapshot.decode('utf-8'), f"snapshot.{SNAPSHOT_FORMAT}")
+
+    def save(self, endpoint, watermark, snapshot, **state):
+        # The snapshot goes first, so a state file never points at a snapshot that was not written
+        directory_name = f"{self.root_directory_name}/{self._path(endpoint)}"
+        self.datalake.upload_file_to_directory(
+            directory_name, f"snapshot.{SNAPSHOT_FORMAT}", serialise_raw(snapshot, SNAPSHOT_FORMAT)
+        )
+        state = {**state, 'endpoint': endpoint, 'watermark': watermark.isoformat()}
+        self.datalake.upload_file_to_directory(directory_name, 'state.json', json.dumps(state))
+        logging.info(f"Saved watermark {state['watermark']} for {endpoint}.")
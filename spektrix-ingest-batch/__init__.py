@@ -0,0 +1,48 @@
+import os
+import json
+import logging
+
+import azure.functions as func
+
+from shared.batch import ingest_spektrix_file, list_files, run_batch, BATCH_MAX_WORKERS
+from shared.datalake import Datalake
+from shared.key_vault import get_azure_credential
+
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request.')
+
+    # Parse request body
+    req_body = req.get_json()
+    landing_filenames = req_body.get('filenames')
+    if not landing_filenames and req_body.get('prefix') is None:
+        error = "The request body needs 'filenames', or a 'prefix' to list the landing files under."
+        return func.HttpResponse(json.dumps({'error': error}), status_code=400, mimetype='application/json')
+    max_workers = req_body.get('max_workers', os.environ.get("SPEKTRIX_BATCH_MAX_WORKERS", BATCH_MAX_WORKERS))
+
+    # Get environment variables
+    datalake_name = os.environ["DATALAKE_GEN_2_RESOURCE_NAME"]
+    filesystem_landing_name = os.environ["DATALAKE_GEN_2_LANDING_CONTAINER_NAME"]
+    filesystem_raw_name = os.environ["DATALAKE_GEN_2_RAW_CONTAINER_NAME"]
+    root_directory_name = os.environ["DATALAKE_GEN_2_SPEKTRIX_DIRECTORY_NAME"]
+    metrics = req_body.get('metrics', os.environ.get("PIPELINE_METRICS", "false"))
+
+    # Without a list of files, everything under the landing prefix is ingested
+    if not landing_filenames:
+        datalake = Datalake(get_azure_credential(), datalake_name, filesystem_landing_name, root_directory_name)
+        landing_filenames = list_files(datalake, root_directory_name, req_body['prefix'])
+
+    settings = {
+        'datalake_name': datalake_name,
+        'filesystem_landing_name': filesystem_landing_name,
+        'filesystem_raw_name': filesystem_raw_name,
+        'root_directory_name': root_directory_name,
+        'metrics': metrics
+    }
+
+    # Run Spektrix requests; they only move bytes, so threads are enough
+    results = run_batch(ingest_spektrix_file, landing_filenames, settings, max_workers)
+
+    status_code = 500 if any('error' in result for result in results) else 200
+
+    return func.HttpResponse(json.dumps(results), status_code=status_code, mimetype='application/json')
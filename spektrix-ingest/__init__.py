@@ -1,10 +1,30 @@
 import os
 import logging
 
-from azure.identity import DefaultAzureCredential
 import azure.functions as func
 
-from shared.processor import SpektrixRequest
+from shared.key_vault import get_azure_credential
+from shared.processor import SpektrixProcessor, SpektrixRequest
+
+
+def process_file(req_body, raw_filename, azure_credential):
+    # Pipeline mode: the workbook is converted in the same invocation that copied it to the raw
+    # zone. The copy is made by the storage service, so the file has not passed through the
+    # function and the processor still downloads it.
+    datalake_name = os.environ["DATALAKE_GEN_2_RESOURCE_NAME"]
+    filesystem_raw_name = os.environ["DATALAKE_GEN_2_RAW_CONTAINER_NAME"]
+    filesystem_structured_name = os.environ["DATALAKE_GEN_2_STRUCTURED_CONTAINER_NAME"]
+    root_directory_name = os.environ["DATALAKE_GEN_2_SPEKTRIX_DIRECTORY_NAME"]
+    output_format = req_body.get('output_format', os.environ.get("STRUCTURED_OUTPUT_FORMAT", "csv"))
+    stream_batch_size = req_body.get('stream_batch_size', os.environ.get("PROCESSOR_STREAM_BATCH_SIZE"))
+    excel_engine = req_body.get('excel_engine', os.environ.get("SPEKTRIX_EXCEL_ENGINE", "openpyxl"))
+    metrics = req_body.get('metrics', os.environ.get("PIPELINE_METRICS", "false"))
+
+    SpektrixProcessor(
+        raw_filename, datalake_name, filesystem_raw_name,
+        filesystem_structured_name, root_directory_name, azure_credential, output_format,
+        stream_batch_size, excel_engine, metrics
+    ).process()
 
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
@@ -19,14 +39,18 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     filesystem_landing_name = os.environ["DATALAKE_GEN_2_LANDING_CONTAINER_NAME"]
     filesystem_raw_name = os.environ["DATALAKE_GEN_2_RAW_CONTAINER_NAME"]
     root_directory_name = os.environ["DATALAKE_GEN_2_SPEKTRIX_DIRECTORY_NAME"]
+    metrics = req_body.get('metrics', os.environ.get("PIPELINE_METRICS", "false"))
+    pipeline = str(req_body.get('pipeline', os.environ.get("SPEKTRIX_PIPELINE", "false"))).lower() in ('true', '1')
 
     # Get authentication credential
-    azure_credential = DefaultAzureCredential()
+    azure_credential = get_azure_credential()
 
     # Run Spektrix request
     raw_filename = SpektrixRequest(
         landing_filename, datalake_name, filesystem_landing_name,
-        filesystem_raw_name, root_directory_name, azure_credential
+        filesystem_raw_name, root_directory_name, azure_credential, metrics
     ).process()
+    if pipeline:
+        process_file(req_body, raw_filename, azure_credential)
 
     return func.HttpResponse(raw_filename)
@@ -0,0 +1,54 @@
+import os
+import json
+import logging
+
+import azure.functions as func
+
+from shared.batch import list_files, process_spektrix_file, run_batch, BATCH_MAX_WORKERS
+from shared.datalake import Datalake
+from shared.key_vault import get_azure_credential
+
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request.')
+
+    # Parse request body
+    req_body = req.get_json()
+    raw_filepaths = req_body.get('filenames')
+    if not raw_filepaths and req_body.get('prefix') is None:
+        error = "The request body needs 'filenames', or a 'prefix' to list the raw files under."
+        return func.HttpResponse(json.dumps({'error': error}), status_code=400, mimetype='application/json')
+    max_workers = req_body.get('max_workers', os.environ.get("SPEKTRIX_BATCH_MAX_WORKERS", BATCH_MAX_WORKERS))
+
+    # Get environment variables
+    datalake_name = os.environ["DATALAKE_GEN_2_RESOURCE_NAME"]
+    filesystem_raw_name = os.environ["DATALAKE_GEN_2_RAW_CONTAINER_NAME"]
+    filesystem_structured_name = os.environ["DATALAKE_GEN_2_STRUCTURED_CONTAINER_NAME"]
+    root_directory_name = os.environ["DATALAKE_GEN_2_SPEKTRIX_DIRECTORY_NAME"]
+    output_format = req_body.get('output_format', os.environ.get("STRUCTURED_OUTPUT_FORMAT", "csv"))
+    stream_batch_size = req_body.get('stream_batch_size', os.environ.get("PROCESSOR_STREAM_BATCH_SIZE"))
+    excel_engine = req_body.get('excel_engine', os.environ.get("SPEKTRIX_EXCEL_ENGINE", "openpyxl"))
+    metrics = req_body.get('metrics', os.environ.get("PIPELINE_METRICS", "false"))
+
+    # Without a list of files, everything under the raw prefix is processed
+    if not raw_filepaths:
+        datalake = Datalake(get_azure_credential(), datalake_name, filesystem_raw_name, root_directory_name)
+        raw_filepaths = list_files(datalake, root_directory_name, req_body['prefix'])
+
+    settings = {
+        'datalake_name': datalake_name,
+        'filesystem_raw_name': filesystem_raw_name,
+        'filesystem_structured_name': filesystem_structured_name,
+        'root_directory_name': root_directory_name,
+        'output_format': output_format,
+        'stream_batch_size': stream_batch_size,
+        'excel_engine': excel_engine,
+        'metrics': metrics
+    }
+
+    # Run Spektrix processors; Excel parsing is CPU-bound, so each file gets a process
+    results = run_batch(process_spektrix_file, raw_filepaths, settings, max_workers, processes=True)
+
+    status_code = 500 if any('error' in result for result in results) else 200
+
+    return func.HttpResponse(json.dumps(results), status_code=status_code, mimetype='application/json')
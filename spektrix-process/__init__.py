@@ -1,9 +1,9 @@
 import os
 import logging
 
-from azure.identity import DefaultAzureCredential
 import azure.functions as func
 
+from shared.key_vault import get_azure_credential
 from shared.processor import SpektrixProcessor
 
 
@@ -19,14 +19,19 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     filesystem_raw_name = os.environ["DATALAKE_GEN_2_RAW_CONTAINER_NAME"]
     filesystem_structured_name = os.environ["DATALAKE_GEN_2_STRUCTURED_CONTAINER_NAME"]
     root_directory_name = os.environ["DATALAKE_GEN_2_SPEKTRIX_DIRECTORY_NAME"]
+    output_format = req_body.get('output_format', os.environ.get("STRUCTURED_OUTPUT_FORMAT", "csv"))
+    stream_batch_size = req_body.get('stream_batch_size', os.environ.get("PROCESSOR_STREAM_BATCH_SIZE"))
+    excel_engine = req_body.get('excel_engine', os.environ.get("SPEKTRIX_EXCEL_ENGINE", "openpyxl"))
+    metrics = req_body.get('metrics', os.environ.get("PIPELINE_METRICS", "false"))
 
     # Get authentication credential
-    azure_credential = DefaultAzureCredential()
+    azure_credential = get_azure_credential()
 
     # Run Artifax processor
     filename = SpektrixProcessor(
         raw_filepath, datalake_name, filesystem_raw_name,
-        filesystem_structured_name, root_directory_name, azure_credential
+        filesystem_structured_name, root_directory_name, azure_credential, output_format,
+        stream_batch_size, excel_engine, metrics
     ).process()
 
     return func.HttpResponse(filename)
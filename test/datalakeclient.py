@@ -19,9 +19,5 @@ datalake = Datalake(
     azure_credential, datalake_name, filesystem_structured_name, directory_name
 )
 
-if datalake.directory_exists(dir_path):
-    files = datalake.list_directory_contents(dir_path)
-    for file in files:
-        filename = file.name.split('/')[-1]
-        datalake.delete_file_from_directory(dir_path, filename)
+datalake.delete_directory_contents(dir_path)
 
@@ -0,0 +1,36 @@
+import io
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from benchmark.fake_datalake import installed
+from benchmark.suite import seed_raw_file
+from shared.hash_index import INDEX_DIRECTORY
+from shared.processor import ArtifaxProcessor
+
+
+def structured_files(storage):
+    # {table: data} of what the processors wrote to the structured zone
+    return {
+        path.split('/')[2]: data for (_, filesystem, path), data in storage.files.items()
+        if filesystem == 'structured' and path.split('/')[1] != INDEX_DIRECTORY
+    }
+
+
+def process_artifax(endpoint, records, raw_format='json', **options):
+    # Runs ArtifaxProcessor over records seeded as a raw file in a fresh fake lake
+    with installed() as storage:
+        storage.files.clear()
+        raw_filename = seed_raw_file('artifax', endpoint, endpoint.split('/')[1], records, raw_format)
+        ArtifaxProcessor(
+            endpoint, raw_filename, 'benchmark', 'raw', 'structured', 'artifax', None, **options
+        ).process()
+
+        return structured_files(storage)
+
+
+def read_table(data, output_format):
+    if output_format == 'parquet':
+        return pq.read_table(io.BytesIO(data)).to_pandas()
+
+    return pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False)
@@ -0,0 +1,122 @@
+import pytest
+from azure.core.exceptions import ResourceNotFoundError
+
+import shared.datalake
+from shared.datalake import STAGING_DIRECTORY, Datalake
+
+
+class Lake:
+    # Directories and files of a filesystem, behind stand-ins for the SDK's directory and file clients
+    def __init__(self):
+        self.directories = set()
+        self.files = {}
+        self.failing_uploads = None
+
+    def staged(self):
+        return sorted(name for name in self.directories if name.startswith(f"{STAGING_DIRECTORY}/"))
+
+
+class FileClient:
+    def __init__(self, lake, path):
+        self.lake = lake
+        self.path = path
+
+    def upload_data(self, stream, **kwargs):
+        if self.lake.failing_uploads is not None:
+            self.lake.failing_uploads -= 1
+            if self.lake.failing_uploads < 0:
+                raise IOError('upload failed')
+        self.lake.directories.add(self.path.rpartition('/')[0])
+        self.lake.files[self.path] = stream.read() if hasattr(stream, 'read') else bytes(stream)
+        return {'etag': 'new'} if self.lake.files[self.path] else {}
+
+    def create_file(self):
+        self.lake.files[self.path] = b''
+
+
+class DirectoryClient:
+    def __init__(self, lake, name):
+        self.lake = lake
+        self.name = name
+
+    def get_file_client(self, filename):
+        return FileClient(self.lake, f"{self.name}/{filename}")
+
+    def create_directory(self):
+        self.lake.directories.add(self.name)
+
+    def _require(self):
+        if self.name not in self.lake.directories:
+            raise ResourceNotFoundError(f"The specified path does not exist: {self.name}")
+
+    def rename_directory(self, new_name):
+        self._require()
+        new_name = new_name.split('/', 1)[1]
+        for path in [path for path in self.lake.files if path.startswith(f"{self.name}/")]:
+            self.lake.files[new_name + path[len(self.name):]] = self.lake.files.pop(path)
+        self.lake.directories.discard(self.name)
+        self.lake.directories.add(new_name)
+
+        return DirectoryClient(self.lake, new_name)
+
+    def delete_directory(self):
+        self._require()
+        for path in [path for path in self.lake.files if path.startswith(f"{self.name}/")]:
+            del self.lake.files[path]
+        self.lake.directories.discard(self.name)
+
+
+class FileSystemClient:
+    def __init__(self, lake):
+        self.lake = lake
+
+    def create_directory(self, name, **kwargs):
+        self.lake.directories.add(name)
+
+
+@pytest.fixture
+def lake(monkeypatch):
+    lake = Lake()
+    monkeypatch.setattr(shared.datalake, 'get_service_client', lambda *args: None)
+    monkeypatch.setattr(shared.datalake, 'get_file_system_client', lambda *args: FileSystemClient(lake))
+    monkeypatch.setattr(
+        shared.datalake, 'get_directory_client', lambda _, account, filesystem, name, *args: DirectoryClient(lake, name)
+    )
+
+    return lake
+
+
+def replace(files):
+    Datalake(None, 'account', 'structured', 'artifax').replace_directory('artifax/room/2024/01/01', files)
+
+
+def test_replace_swaps_in_the_staged_files(lake):
+    replace({'room_1.csv': b'old', 'room_1.parquet': b'old'})
+    replace({'room_2.csv': b'new'})
+
+    assert lake.files == {'artifax/room/2024/01/01/room_2.csv': b'new'}
+    assert lake.staged() == []
+
+
+def test_failed_upload_leaves_the_directory_as_it_was(lake):
+    replace({'room_1.csv': b'old'})
+    lake.failing_uploads = 1
+
+    with pytest.raises(IOError):
+        replace({'room_2.csv': b'new', 'room_2.parquet': b'new'})
+
+    assert lake.files == {'artifax/room/2024/01/01/room_1.csv': b'old'}
+    assert lake.staged() == []
+
+
+def test_replace_with_empty_files(lake):
+    replace({'room_1.csv': b'old'})
+    replace({'room_2.csv': b''})
+
+    assert lake.files == {'artifax/room/2024/01/01/room_2.csv': b''}
+
+    replace({})
+
+    assert lake.files == {}
+    assert 'artifax/room/2024/01/01' in lake.directories
+    assert lake.staged() == []
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from shared.dtypes import column_array, typed_dataframe
+
+
+def test_nullable_int_keeps_ids_with_gaps_as_ints():
+    array = column_array([7, None, 9], 'Int64')
+
+    assert str(array.dtype) == 'Int64'
+    assert array.tolist() == [7, pd.NA, 9]
+
+
+def test_decimal_goes_through_text():
+    array = column_array([0.1, '12.5', None], 'decimal(10,2)')
+
+    assert [str(value) for value in array[:2]] == ['0.10', '12.50']
+    assert array[2] is pd.NA
+
+
+def test_datetime_parses_text_only():
+    assert column_array(['2024-03-01T10:30:00', None], 'datetime').tolist()[0] == pd.Timestamp('2024-03-01 10:30')
+    assert column_array([1, 2], 'datetime').tolist() == [1, 2]
+
+
+@pytest.mark.parametrize('values, dtype', [
+    (['a', 'b'], 'Int64'),
+    (['1.234'], 'decimal(10,2)'),
+    (['not a date'], 'datetime'),
+])
+def test_values_that_do_not_fit_are_kept(values, dtype, caplog):
+    assert column_array(values, dtype).tolist() == values
+    assert f"not {dtype}" in caplog.text
+
+
+def test_unsupported_dtype():
+    with pytest.raises(ValueError, match='Unsupported dtype'):
+        column_array([1], 'float128')
+
+
+def test_typed_dataframe():
+    rows = [[1, 'a', 'x'], [2, 'b', None]]
+    df = typed_dataframe(rows, ['id', 'code', 'note'], {'id': 'Int64', 'code': 'category'})
+
+    assert rows == []
+    assert list(df.columns) == ['id', 'code', 'note']
+    assert [str(dtype) for dtype in df.dtypes] == ['Int64', 'category', 'object']
+    assert df['note'].tolist() == ['x', None]
+
+
+def test_typed_dataframe_without_rows():
+    df = typed_dataframe([], ['id', 'code'], {'id': 'Int64'})
+
+    assert list(df.columns) == ['id', 'code']
+    assert len(df) == 0
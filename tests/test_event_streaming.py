@@ -0,0 +1,46 @@
+import pytest
+
+import shared.processor
+from benchmark.fake_datalake import installed
+from benchmark.suite import FakeKeyVault
+from shared.datalake import PARTIAL_SUFFIX, decompress_chunks
+from shared.formats import load_raw
+from shared.processor import ArtifaxRequest
+
+
+def failing_results(count):
+    # The events of count arrangements, then a failure, as a dropped connection would give
+    for number in range(count):
+        yield [{'event_id': number * 10 + item, 'arrangement_id': number} for item in range(3)]
+    raise ConnectionError('connection reset')
+
+
+def stream_events(monkeypatch, raw_format):
+    monkeypatch.setattr(shared.processor, 'KeyVault', FakeKeyVault)
+    with installed() as storage:
+        storage.files.clear()
+        request = ArtifaxRequest(
+            'vault', 'benchmark', 'raw', 'artifax', 'arrangements/event', 'api-key', 'client', None,
+            raw_format=raw_format, stream_events=True
+        )
+        arrangements = [(number, None) for number in range(5)]
+        with pytest.raises(ConnectionError):
+            request._stream_events_to_lake(arrangements, failing_results(3))
+
+        return {path: data for (_, _, path), data in storage.files.items()}
+
+
+@pytest.mark.parametrize('raw_format', ['ndjson', 'ndjson.gz'])
+def test_failed_ndjson_stream_keeps_whole_records(monkeypatch, raw_format):
+    files = stream_events(monkeypatch, raw_format)
+
+    [(path, data)] = files.items()
+    assert path.endswith(PARTIAL_SUFFIX)
+    # A compressed .partial file has no gzip trailer, but everything committed decompresses
+    filename = path[:-len(PARTIAL_SUFFIX)]
+    text = b''.join(decompress_chunks([data], filename)).decode('utf-8')
+    assert [event['event_id'] for event in load_raw(text, filename)] == [0, 1, 2, 10, 11, 12, 20, 21, 22]
+
+
+def test_failed_json_stream_leaves_nothing(monkeypatch):
+    assert stream_events(monkeypatch, 'json') == {}
@@ -0,0 +1,81 @@
+import pandas as pd
+
+from shared.flatten import FlatteningPlan, TableSchema
+
+RECORDS = [
+    {
+        'id': 1, 'name': 'Hall', 'address': {'city': 'Oslo', 'zip': '0150'},
+        'layouts': [{'layout_id': 10, 'capacity': 100, 'note': 'x'}, {'layout_id': 11, 'capacity': 80, 'note': 'y'}],
+    },
+    {'id': 2, 'name': 'Room', 'address': None, 'layouts': []},
+    {'id': 3, 'name': 'Loft', 'layouts': {'layout_id': 12, 'capacity': 20, 'note': 'z'}},
+]
+
+
+def tables(schemas, records=RECORDS, typed=False):
+    return {table['filename']: table['data'] for table in FlatteningPlan(schemas).flatten(records, typed)}
+
+
+def test_parent_table_keeps_declared_columns():
+    df = tables([TableSchema('room', columns=['id', 'address.city', 'missing'])])['room']
+
+    assert list(df.columns) == ['id', 'address.city', 'missing']
+    assert df['id'].tolist() == [1, 2, 3]
+    assert df['address.city'].tolist() == ['Oslo', None, None]
+    assert df['missing'].isna().all()
+
+
+def test_parent_table_without_columns_matches_json_normalize():
+    records = [{key: value for key, value in record.items() if key != 'layouts'} for record in RECORDS[:1]]
+    df = tables([TableSchema('room')], records)['room']
+
+    pd.testing.assert_frame_equal(df, pd.json_normalize(records))
+
+
+def test_child_table_matches_json_normalize():
+    records = RECORDS[:2]
+    schema = TableSchema(
+        'room_layout', record_path=['layouts'], meta=['id'], drop=['note'], rename={'id': 'room_id'}
+    )
+    expected = pd.json_normalize(records, record_path=['layouts'], meta=['id'])
+    expected = expected.drop(columns=['note']).rename(columns={'id': 'room_id'})
+
+    pd.testing.assert_frame_equal(tables([schema], records)['room_layout'], expected, check_dtype=False)
+
+
+def test_child_table_takes_a_single_object_as_one_item():
+    df = tables([TableSchema('room_layout', record_path=['layouts'], meta=['id'])])['room_layout']
+
+    assert df['layout_id'].tolist() == [10, 11, 12]
+    assert df['id'].tolist() == [1, 1, 3]
+
+
+def test_child_table_without_items_drops_missing_columns():
+    records = [{'id': 1, 'layouts': []}]
+    df = tables([TableSchema('room_layout', record_path=['layouts'], meta=['id'], drop=['note'])], records)
+
+    assert list(df['room_layout'].columns) == ['id']
+    assert len(df['room_layout']) == 0
+
+
+def test_nested_record_path_reads_meta_at_its_level():
+    records = [{'id': 1, 'rooms': [{'room_id': 5, 'bookings': [{'booking_id': 7}, {'booking_id': 8}]}]}]
+    schema = TableSchema('booking', record_path=['rooms', 'bookings'], meta=['id', ['rooms', 'room_id']])
+
+    df = tables([schema], records)['booking']
+
+    assert df.to_dict('records') == [
+        {'booking_id': 7, 'id': 1, 'rooms.room_id': 5}, {'booking_id': 8, 'id': 1, 'rooms.room_id': 5}
+    ]
+
+
+def test_typed_flatten_applies_declared_dtypes():
+    schema = TableSchema('room', columns=['id', 'name'], dtypes={'id': 'Int64', 'name': 'category'})
+
+    untyped = tables([schema])['room']
+    typed = tables([schema], typed=True)['room']
+
+    assert untyped['name'].dtype == object
+    assert str(typed['id'].dtype) == 'Int64'
+    assert str(typed['name'].dtype) == 'category'
+    assert typed['name'].tolist() == untyped['name'].tolist()
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import pytest
+
+from shared import key_vault
+from shared.key_vault import KeyVault
+
+
+class FakeSecretClient:
+    def __init__(self, vault_url, credential):
+        self.requested = []
+
+    def get_secret(self, secret_name):
+        self.requested.append(secret_name)
+        return SimpleNamespace(value=f"{secret_name}-value")
+
+
+@pytest.fixture
+def vault(monkeypatch):
+    monkeypatch.setattr(key_vault, 'SecretClient', FakeSecretClient)
+    monkeypatch.setattr(key_vault, '_secret_clients', {})
+    monkeypatch.setattr(key_vault, '_secret_cache', {})
+
+    return KeyVault(None, 'vault')
+
+
+def test_secrets_are_fetched_once_within_the_ttl(vault):
+    names = ['api-key', 'client-name', 'api-key']
+
+    assert vault.get_key_vault_secrets(names) == {'api-key': 'api-key-value', 'client-name': 'client-name-value'}
+    assert sorted(vault.client.requested) == ['api-key', 'client-name']
+    assert vault.get_key_vault_secrets(names)['client-name'] == 'client-name-value'
+    assert len(vault.client.requested) == 2
+
+
+def test_cached_secrets_start_no_threads(vault, monkeypatch):
+    vault.get_key_vault_secrets(['api-key', 'client-name'])
+
+    def no_executor(*args, **kwargs):
+        raise AssertionError("a ThreadPoolExecutor was started for cached secrets")
+
+    monkeypatch.setattr(key_vault, 'ThreadPoolExecutor', no_executor)
+    assert vault.get_key_vault_secrets(['api-key', 'client-name'])['api-key'] == 'api-key-value'
+    vault.invalidate('client-name')
+    assert vault.get_key_vault_secrets(['api-key', 'client-name'])['client-name'] == 'client-name-value'
+    assert vault.client.requested.count('client-name') == 2
@@ -0,0 +1,38 @@
+from shared.orchestration import task_all_bounded
+
+
+class FakeContext:
+    # Records the batches an orchestrator waits on; a task is its (function name, input)
+    def __init__(self):
+        self.batches = []
+
+    def call_activity(self, function_name, function_input):
+        return function_name, function_input
+
+    def task_all(self, tasks):
+        self.batches.append(tasks)
+        return tasks
+
+
+def run(orchestration):
+    # Drives a generator as the Durable runtime does, sending each awaited task list back as its results
+    try:
+        awaited = next(orchestration)
+        while True:
+            awaited = orchestration.send([function_input * 10 for _, function_input in awaited])
+    except StopIteration as stop:
+        return stop.value
+
+
+def test_calls_run_in_batches_and_results_keep_call_order():
+    context = FakeContext()
+    calls = [('call_activity', 'artifax-ingest', number) for number in range(7)]
+
+    assert run(task_all_bounded(context, calls, '3')) == [0, 10, 20, 30, 40, 50, 60]
+    assert [[function_input for _, function_input in batch] for batch in context.batches] == [
+        [0, 1, 2], [3, 4, 5], [6]
+    ]
+
+
+def test_no_calls():
+    assert run(task_all_bounded(FakeContext(), [], 8)) == []
@@ -0,0 +1,106 @@
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import shared.processor
+from benchmark.fake_datalake import installed
+from shared.partitions import UNKNOWN_PARTITION, parse_partition_columns, split_by_month
+from shared.processor import ArtifaxProcessor
+
+
+def test_parse_partition_columns():
+    defaults = {'invoice_schedule': 'invoice_date'}
+
+    assert parse_partition_columns(None, defaults) == defaults
+    assert parse_partition_columns(' event=start_date , invoice_schedule=due_date', defaults) == {
+        'invoice_schedule': 'due_date', 'event': 'start_date'
+    }
+    assert parse_partition_columns('invoice_schedule=', defaults) == {}
+    with pytest.raises(ValueError):
+        parse_partition_columns('event', defaults)
+
+
+@pytest.mark.parametrize('as_table', [False, True])
+def test_split_by_month(as_table):
+    df = pd.DataFrame({
+        'id': [1, 2, 3, 4, 5],
+        'invoice_date': ['2024-02-03', '2024-01-31T10:00:00', None, '2024-02-01', 'soon'],
+    })
+    parts = split_by_month(pa.Table.from_pandas(df) if as_table else df, 'invoice_date')
+
+    assert list(parts) == ['2024-01', '2024-02', UNKNOWN_PARTITION]
+    ids = {month: (part.column('id').to_pylist() if as_table else part['id'].tolist()) for month, part in parts.items()}
+    assert ids == {'2024-01': [2], '2024-02': [1, 4], UNKNOWN_PARTITION: [3, 5]}
+
+
+def test_split_by_month_of_datetimes_and_without_the_column():
+    df = pd.DataFrame({'id': [1, 2], 'invoice_date': pd.to_datetime(['2024-03-01', None])})
+
+    assert {month: len(part) for month, part in split_by_month(df, 'invoice_date').items()} == {
+        '2024-03': 1, UNKNOWN_PARTITION: 1
+    }
+    assert list(split_by_month(df, 'due_date')) == [UNKNOWN_PARTITION]
+
+
+class Run:
+    # Uploads partitions as a processor started at run_started would, in the fake lake
+    def __init__(self, storage, endpoint, run_started, **options):
+        self.storage = storage
+        self.endpoint = endpoint
+        self.run_started = run_started
+        self.options = options
+
+    def upload(self, table_name, files):
+        processor = ArtifaxProcessor(
+            self.endpoint, None, 'benchmark', 'raw', 'structured', 'artifax', None, partitioned=True,
+            **self.options
+        )
+        processor.run_started = self.run_started
+        self.storage.reset_counters()
+        processor._upload_partitions(table_name, files, {month: 1 for month in files}, 'csv')
+
+        return processor
+
+    def partitions(self):
+        return {
+            path.split('/')[4]: data for (_, filesystem, path), data in self.storage.files.items()
+            if filesystem == 'structured' and path.split('/')[3] == 'partitioned'
+        }
+
+
+@pytest.fixture
+def storage():
+    with installed() as storage:
+        storage.files.clear()
+        yield storage
+
+
+def test_rolling_window_keeps_the_partly_covered_month(storage, monkeypatch):
+    monkeypatch.setattr(shared.processor, 'INVOICE_SCHEDULE_DAYS', 30)
+    run = Run(storage, 'finances/invoice_schedule', datetime(2024, 6, 15))
+
+    run.upload('invoice_schedule', {'2024-04': b'april', '2024-05': b'may', '2024-06': b'june'})
+    assert run.partitions() == {'month=2024-04': b'april', 'month=2024-05': b'may', 'month=2024-06': b'june'}
+
+    # The window now starts on 2024-05-17: May is only partly extracted, April not at all
+    run.upload('invoice_schedule', {'2024-05': b'late may', '2024-06': b'june'})
+    assert run.partitions() == {'month=2024-04': b'april', 'month=2024-05': b'may', 'month=2024-06': b'june'}
+    assert storage.calls['replace_directory'] == 0
+
+    run.upload('invoice_schedule', {'2024-06': b'all of june', UNKNOWN_PARTITION: b'no date'})
+    assert run.partitions()['month=2024-06'] == b'all of june'
+    assert run.partitions()[f'month={UNKNOWN_PARTITION}'] == b'no date'
+    assert storage.calls['replace_directory'] == 2
+
+
+def test_full_extraction_deletes_months_it_no_longer_has(storage):
+    run = Run(storage, 'arrangements/event', datetime(2024, 6, 15), partition_columns='event=start_date')
+
+    run.upload('event', {'2024-01': b'january', '2024-02': b'february'})
+    processor = run.upload('event', {'2024-02': b'february', '2024-03': b'march'})
+
+    assert run.partitions() == {'month=2024-02': b'february', 'month=2024-03': b'march'}
+    assert storage.calls['replace_directory'] == 1
+    assert sorted(processor.partition_index.load()) == ['event/month=2024-02', 'event/month=2024-03']
@@ -0,0 +1,71 @@
+import copy
+
+import pytest
+
+from benchmark.synthetic import Dataset
+from tests.helpers import process_artifax, read_table
+
+BATCH_SIZE = 10
+
+
+def event_activities():
+    # A whole batch of activities without arrangement types, so that batch has no child rows
+    records = copy.deepcopy(Dataset(1).artifax('arrangements/event_activity', {}))
+    for record in records[BATCH_SIZE:2 * BATCH_SIZE]:
+        record['arrangement_types'] = []
+
+    return records
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+def test_event_activity_batch_without_child_rows(output_format):
+    records = event_activities()
+    one_shot = process_artifax('arrangements/event_activity', records, output_format=output_format)
+    streamed = process_artifax(
+        'arrangements/event_activity', records, output_format=output_format, stream_batch_size=BATCH_SIZE
+    )
+
+    assert set(streamed) == {'event_activity', 'event_activity_arrangement_type'}
+    for table, data in one_shot.items():
+        assert read_table(streamed[table], output_format).equals(read_table(data, output_format)), table
+    child = read_table(streamed['event_activity_arrangement_type'], output_format)
+    assert list(child.columns) == ['arrangement_type_id', 'activity_id']
+
+
+def without_child_rows(records, start, stop):
+    # Empties every nested list of records[start:stop], so a batch of them has no child table rows
+    records = copy.deepcopy(records)
+    for record in records[start:stop]:
+        for key, value in record.items():
+            if isinstance(value, list):
+                record[key] = []
+
+    return records
+
+
+# Every entity normalised by a FlatteningPlan, with the tables it writes
+PLAN_ENDPOINTS = {
+    'arrangements/arrangement': {'arrangement', 'arrangement_custom_forms'},
+    'arrangements/room': {'room', 'room_room_layout', 'room_event_activity'},
+    'arrangements/event_activity': {'event_activity', 'event_activity_arrangement_type'},
+    'finances/invoice_schedule': {'invoice_schedule'},
+}
+
+
+@pytest.mark.parametrize('endpoint', sorted(PLAN_ENDPOINTS))
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+@pytest.mark.parametrize('typed_schemas', [False, True])
+def test_streamed_output_matches_one_shot(endpoint, output_format, typed_schemas):
+    records = Dataset(1).artifax(endpoint, {})[:20 * BATCH_SIZE]
+    records = without_child_rows(records, BATCH_SIZE, 2 * BATCH_SIZE)
+    options = {'output_format': output_format, 'typed_schemas': typed_schemas}
+    one_shot = process_artifax(endpoint, records, **options)
+    streamed = process_artifax(endpoint, records, stream_batch_size=BATCH_SIZE, **options)
+
+    assert set(one_shot) == set(streamed) == PLAN_ENDPOINTS[endpoint]
+    for table, data in one_shot.items():
+        expected, actual = read_table(data, output_format), read_table(streamed[table], output_format)
+        assert list(actual.columns) == list(expected.columns), table
+        assert actual.equals(expected), table
+        if output_format == 'csv':
+            assert streamed[table] == data, table
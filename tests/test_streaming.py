@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from shared.streaming import iter_json_array, iter_ndjson
+
+RECORDS = [{'id': 1, 'name': 'Café'}, 12, 3.5, 'text', None, True, [1, 2], {'nested': {'a': [1]}}]
+
+
+def chunked(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1024])
+def test_json_array_split_anywhere(size):
+    # Chunks of one byte split the two-byte é and every number and literal
+    data = json.dumps(RECORDS, ensure_ascii=False, indent=2).encode('utf-8')
+
+    assert list(iter_json_array(chunked(data, size))) == RECORDS
+
+
+def test_number_at_chunk_boundary_waits_for_its_delimiter():
+    assert list(iter_json_array([b'[12', b'34, 5', b'6]'])) == [1234, 56]
+
+
+@pytest.mark.parametrize('data, expected', [
+    (b'[]', []),
+    (b' \n[ ]\n', []),
+    (b'\xef\xbb\xbf[1]', [1]),
+    (b'{"id": 1}', [{'id': 1}]),
+])
+def test_json_edge_cases(data, expected):
+    assert list(iter_json_array(chunked(data, 1))) == expected
+
+
+@pytest.mark.parametrize('data', [b'[1, 2', b'[1 2]', b'[1] 2'])
+def test_invalid_json_array(data):
+    with pytest.raises(ValueError):
+        list(iter_json_array([data]))
+
+
+def test_ndjson_split_anywhere():
+    data = b''.join(json.dumps(record).encode('utf-8') + b'\n' for record in RECORDS) + b'\n'
+
+    assert list(iter_ndjson(chunked(data, 3))) == RECORDS
+    assert list(iter_ndjson([data.rstrip()])) == RECORDS
@@ -0,0 +1,81 @@
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from shared.dtypes import column_array
+from shared.formats import TableWriter, serialise_dataframe
+from tests.helpers import read_table
+
+BATCHES = [
+    pd.DataFrame({'id': [1, 2], 'amount': [1, 2]}),
+    pd.DataFrame({'id': [3], 'amount': [2.5], 'note': ['late']}),
+    pd.DataFrame({'id': [4], 'amount': ['n/a']}),
+]
+
+
+SPOOL_SIZE = 64  # bytes, so every writer spills its batches to disk
+
+
+def written(batches, output_format):
+    writer = TableWriter(output_format, spool_size=SPOOL_SIZE)
+    try:
+        for batch in batches:
+            writer.write(batch)
+        return writer.rows, writer.getfile().read()
+    finally:
+        writer.close()
+
+
+def test_spilled_batches_match_one_shot():
+    writer = TableWriter('csv', spool_size=SPOOL_SIZE)
+    for batch in BATCHES[:2]:
+        writer.write(batch)
+
+    assert writer._parts._rolled
+    assert writer.rows == 3
+    assert writer.getfile().read() == serialise_dataframe(pd.concat(BATCHES[:2], ignore_index=True), 'csv').encode()
+    writer.close()
+
+
+def test_late_column_is_added_to_every_row():
+    for output_format in ('csv', 'parquet'):
+        _, data = written(BATCHES[:2], output_format)
+        df = read_table(data, output_format)
+
+        assert list(df.columns) == ['id', 'amount', 'note']
+        assert df['id'].astype(str).tolist() == ['1', '2', '3']
+
+
+def test_column_whose_type_changed_gets_one_type():
+    _, data = written(BATCHES[:2], 'parquet')
+    assert pq.read_schema(io.BytesIO(data)).field('amount').type == pa.float64()
+
+    _, data = written(BATCHES, 'parquet')
+    table = pq.read_table(io.BytesIO(data))
+    assert table.schema.field('amount').type == pa.string()
+    assert table.column('amount').to_pylist() == ['1', '2', '2.5', 'n/a']
+
+
+def test_decimals_are_written_at_their_scale():
+    batches = [
+        pd.DataFrame({'amount': column_array(['12.5'], 'decimal(10,2)')}),
+        pd.DataFrame({'amount': column_array([None], 'decimal(10,2)')}),
+    ]
+    _, data = written(batches, 'parquet')
+    table = pq.read_table(io.BytesIO(data))
+
+    assert table.schema.field('amount').type == pa.decimal128(10, 2)
+    assert [str(value) for value in table.column('amount').to_pylist()] == ['12.50', 'None']
+    assert written(batches, 'csv')[1] == serialise_dataframe(pd.concat(batches, ignore_index=True), 'csv').encode()
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+def test_table_without_rows_keeps_its_columns(output_format):
+    rows, data = written([pd.DataFrame({'id': pd.Series([], dtype=object)})], output_format)
+
+    assert rows == 0
+    assert list(read_table(data, output_format).columns) == ['id']
+
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+import pytest
+
+import shared.processor
+from benchmark.fake_datalake import installed
+from benchmark.suite import FakeKeyVault
+from shared.processor import FULL_REFRESH_DAYS, ArtifaxRequest
+
+ENDPOINT = 'finances/invoice_schedule'
+
+
+@pytest.fixture
+def request_factory(monkeypatch):
+    monkeypatch.setattr(shared.processor, 'KeyVault', FakeKeyVault)
+    with installed() as storage:
+        storage.files.clear()
+        yield lambda: ArtifaxRequest(
+            'vault', 'benchmark', 'raw', 'artifax', ENDPOINT, 'api-key', 'client', None, incremental=True
+        )
+
+
+def save_state(request, watermark_days_ago, last_full_refresh_days_ago):
+    last_full_refresh = None
+    if last_full_refresh_days_ago is not None:
+        last_full_refresh = (request.run_started - timedelta(days=last_full_refresh_days_ago)).isoformat()
+    request._get_watermark_store().save(
+        ENDPOINT, request.run_started - timedelta(days=watermark_days_ago), [{'invoice_date': None}],
+        last_full_refresh=last_full_refresh
+    )
+
+
+def test_incremental_run_between_full_refreshes(request_factory):
+    request = request_factory()
+    save_state(request, 1, FULL_REFRESH_DAYS - 1)
+
+    state, snapshot = request._load_watermark()
+    assert snapshot == [{'invoice_date': None}]
+    # An incremental run carries the date of the last full refresh forward
+    assert request.last_full_refresh == state['last_full_refresh']
+
+
+@pytest.mark.parametrize('last_full_refresh_days_ago', [FULL_REFRESH_DAYS + 1, None])
+def test_daily_runs_still_get_a_full_refresh(request_factory, last_full_refresh_days_ago):
+    request = request_factory()
+    save_state(request, 1, last_full_refresh_days_ago)
+
+    assert request._load_watermark() is None
+    assert request.last_full_refresh == request.run_started
+
+
+def test_full_refresh_date_is_saved(request_factory):
+    request = request_factory()
+    save_state(request, 1, None)
+    request._load_watermark()
+    request.snapshot = []
+    request._save_watermark()
+
+    next_run = request_factory()
+    next_run.run_started = request.run_started + timedelta(days=1)
+    assert next_run._load_watermark() is not None
+    assert next_run.last_full_refresh == request.run_started